@@ -0,0 +1,14 @@
+"""
+QUANT_PY: quantitative trait extraction from Genes & Health primary and secondary care data.
+
+The pipeline is a DAG of stages (see `quant_py.stages`) run by `quant_py.pipeline.run`, or from the shell:
+```
+quant_py run --version version011 --yr 2025 --mon 10
+```
+"""
+from . import tre # noqa: F401 (registers the `.TRE` LazyFrame namespace)
+from .config import RunConfig
+from .lookup import get_person
+from .pipeline import configure_telemetry, run, status
+
+__all__ = ["RunConfig", "configure_telemetry", "get_person", "run", "status"]
@@ -0,0 +1,155 @@
+# Benchmarks of the ingest stages, run on the raw data of a pipeline version, e.g.
+#
+#   quant_py benchmark decode --version version011 --yr 2025 --mon 10
+#
+# `decode` times reading the typed columns of provenances with a `schema` (the Discovery extracts, see
+# `provenances/discovery.toml`) both ways: scanned as strings and cast (the former path), and parsed by the CSV
+# reader as they are scanned.  Each way is timed `repeats` times and the fastest run is kept, so the page cache
+# is warm for both.
+#
+#   quant_py benchmark formats --version version011 --yr 2025 --mon 10 --format ipc --format parquet-zstd:500000
+#
+# `formats` writes the reference combo (the `Combined_all_sources` dataset, see `datasets.py`) as one file in each
+# intermediate format (see `intermediates.py`, default: all compressions, Parquet with the default row groups),
+# next to it, and times the write, a full read and a downstream scan (the unit counts per term of the traits
+# stages, reading only the columns they need), with the file size.
+
+import os
+import tempfile
+import time
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+from .datasets import scan_dataset
+from .intermediates import IPC_COMPRESSIONS, PARQUET_COMPRESSIONS, IntermediateFormat, scan_intermediate
+from .provenance import raw_files, scan_schema
+from .sources import PROVENANCE_SPECS
+from .stages.combine import combined_all_sources_path
+
+
+def _fastest_seconds(lf: pl.LazyFrame, repeats: int) -> tuple[float, int]:
+    """The fastest of `repeats` streaming collects of `lf`, and its number of rows."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = lf.collect(engine="streaming").height
+        seconds.append(time.perf_counter() - start)
+    return min(seconds), rows
+
+
+def decode_benchmark(config: RunConfig, provenance_keys: list[str] | None = None, repeats: int = 3) -> pl.DataFrame:
+    """
+    Seconds taken to read the `schema` columns of each provenance (default: all those with a `schema`) as
+    strings then cast, and parsed at scan time, with the speed-up.
+    """
+    specs = {key: spec for provider_specs in PROVENANCE_SPECS.values() for key, spec in provider_specs.items()}
+    keys = provenance_keys or [key for key, spec in specs.items() if spec.get("schema")]
+
+    rows = []
+    for key in keys:
+        spec = specs[key]
+        schema = scan_schema(spec)
+        if not schema:
+            raise ValueError(f"{key}: no schema to benchmark")
+        files = raw_files(config, spec)
+        scan_options = {**spec.get("scan", {}), "infer_schema": False}
+        # the strict casts of `provenance_plan`
+        as_strings = pl.scan_csv(files, **scan_options).select(
+            pl.col(column).cast(dtype) for column, dtype in schema.items()
+        )
+        typed = pl.scan_csv(files, **scan_options, schema_overrides=schema).select(list(schema))
+
+        string_seconds, string_rows = _fastest_seconds(as_strings, repeats)
+        typed_seconds, typed_rows = _fastest_seconds(typed, repeats)
+        if string_rows != typed_rows:
+            raise AssertionError(f"{key}: {string_rows} rows read as strings, {typed_rows} typed")
+        rows.append({
+            "provenance": key,
+            "rows": typed_rows,
+            "columns": ", ".join(schema),
+            "string_cast_seconds": string_seconds,
+            "typed_scan_seconds": typed_seconds,
+            "speed_up": string_seconds / typed_seconds,
+        })
+
+    return pl.DataFrame(
+        rows,
+        schema={
+            "provenance": pl.Utf8,
+            "rows": pl.UInt64,
+            "columns": pl.Utf8,
+            "string_cast_seconds": pl.Float64,
+            "typed_scan_seconds": pl.Float64,
+            "speed_up": pl.Float64,
+        },
+    )
+
+
+def _write(df: pl.DataFrame, file_format: IntermediateFormat, path: AnyPath) -> None:
+    """`df` written as `intermediates.sink_intermediate` would (without the TRE telemetry)."""
+    if file_format.format == "ipc":
+        df.lazy().sink_ipc(path, compression=file_format.compression)
+    else:
+        df.lazy().sink_parquet(
+            path,
+            compression=file_format.compression,
+            row_group_size=file_format.row_group_size,
+            statistics=True,
+        )
+
+
+def format_benchmark(config: RunConfig, formats: list[str] | None = None, repeats: int = 3) -> pl.DataFrame:
+    """
+    Seconds taken to write the reference combo in each of `formats` (default: every format, see
+    `intermediates.py`), to read it back and to scan the unit counts per term from it, with the file size.
+    """
+    file_formats = [IntermediateFormat.parse(spec) for spec in formats or (
+        [f"ipc-{compression}" for compression in IPC_COMPRESSIONS]
+        + [f"parquet-{compression}" for compression in PARQUET_COMPRESSIONS]
+    )]
+    combo = scan_dataset(combined_all_sources_path(config)).collect(engine="streaming")
+
+    rows = []
+    with tempfile.TemporaryDirectory(dir=config.reference_combo_files_path, prefix=".format_benchmark_") as folder:
+        for file_format in file_formats:
+            path = AnyPath(folder, f"combo{file_format.suffix}")
+            write_seconds = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                _write(combo, file_format, path)
+                write_seconds.append(time.perf_counter() - start)
+
+            read_seconds, read_rows = _fastest_seconds(scan_intermediate(path), repeats)
+            if read_rows != combo.height:
+                raise AssertionError(f"{file_format}: {read_rows} rows read back, {combo.height} written")
+            # the shape of `stages/traits.py::units_counts`
+            units_counts = (
+                scan_intermediate(path)
+                .select("person_id", "original_term", "result_value_units")
+                .unique()
+                .group_by("original_term", "result_value_units")
+                .len()
+            )
+            scan_seconds, _ = _fastest_seconds(units_counts, repeats)
+            rows.append({
+                "format": str(file_format),
+                "rows": combo.height,
+                "size_mb": os.path.getsize(path) / 1e6,
+                "write_seconds": min(write_seconds),
+                "read_seconds": read_seconds,
+                "units_scan_seconds": scan_seconds,
+            })
+
+    return pl.DataFrame(
+        rows,
+        schema={
+            "format": pl.Utf8,
+            "rows": pl.UInt64,
+            "size_mb": pl.Float64,
+            "write_seconds": pl.Float64,
+            "read_seconds": pl.Float64,
+            "units_scan_seconds": pl.Float64,
+        },
+    )
@@ -0,0 +1,230 @@
+# Command line interface, e.g.
+#
+#   quant_py run --version version011 --yr 2025 --mon 10
+#   quant_py run --version version011 --yr 2025 --mon 10 --stage 2024_12_Bradford_path --force
+#   quant_py run --version version011 --yr 2025 --mon 10 --ingest-ram-budget 48
+#   quant_py run --version version011 --yr 2025 --mon 10 --stage 2023_05_Barts_path --force --quarantine
+#   quant_py run --version version011 --yr 2025 --mon 10 --intermediate-format primary_care_combined=parquet-zstd
+#   quant_py status --version version011 --yr 2025 --mon 10
+#   quant_py partition .../GandH_Measurements__20240423.ascii.redacted2.tab
+#   quant_py benchmark decode --version version011 --yr 2025 --mon 10
+#   quant_py benchmark formats --version version011 --yr 2025 --mon 10 --format ipc --format ipc-zstd
+
+import argparse
+import dataclasses
+
+import polars as pl
+
+from .benchmarks import decode_benchmark, format_benchmark
+from .config import ROOT_FOLDER_LOCATION, RunConfig
+from .dag import STAGES
+from .intermediates import FORMATTED_STAGES, IntermediateFormat
+from .partition import field_counts, partition_by_field_count
+from .pipeline import configure_telemetry, run, status
+
+
+def _intermediate_format(value: str) -> tuple[str, str]:
+    """A `STAGE=FORMAT` argument, checked."""
+    stage, _, spec = value.partition("=")
+    if stage not in FORMATTED_STAGES:
+        raise argparse.ArgumentTypeError(f"{stage!r} is not one of {', '.join(FORMATTED_STAGES)}")
+    try:
+        return stage, str(IntermediateFormat.parse(spec))
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from error
+
+
+def _add_version_details(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--version", required=True, help="pipeline version, e.g. version011")
+    parser.add_argument("--yr", required=True, help="run year, e.g. 2025")
+    parser.add_argument("--mon", required=True, help="run month, e.g. 10")
+    parser.add_argument(
+        "--root",
+        default=ROOT_FOLDER_LOCATION,
+        help=f"folder the QUANT_PY/<version>_<yr>_<mon> directory is in (default: {ROOT_FOLDER_LOCATION})",
+    )
+    parser.add_argument(
+        "--intermediate-format",
+        action="append",
+        dest="intermediate_formats",
+        type=_intermediate_format,
+        metavar="STAGE=FORMAT",
+        help=(
+            "this stage's combined file is written as ipc, ipc-lz4, ipc-zstd or "
+            "parquet-<compression>[:<row group size>] (repeatable; default: ipc)"
+        ),
+    )
+
+
+def _add_run_details(parser: argparse.ArgumentParser) -> None:
+    _add_version_details(parser)
+    parser.add_argument(
+        "--stage",
+        action="append",
+        dest="stages",
+        metavar="NAME",
+        help="only this stage and the stages it depends on (repeatable; default: all stages)",
+    )
+
+
+def _config(args: argparse.Namespace) -> RunConfig:
+    return RunConfig(
+        version=args.version,
+        yr=args.yr,
+        mon=args.mon,
+        root_folder_location=args.root,
+        intermediate_formats=tuple(args.intermediate_formats or ()),
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="quant_py", description="Run the QUANT_PY pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the out of date stages")
+    _add_run_details(run_parser)
+    run_parser.add_argument("--force", action="store_true", help="re-run the selected stages even if up to date")
+    run_parser.add_argument("--dry-run", action="store_true", help="only list the stages which would run")
+    run_parser.add_argument("--copy", action="store_true", help="also copy the raw data from library-red")
+    run_parser.add_argument(
+        "--copy-workers",
+        type=int,
+        metavar="N",
+        help="with --copy, copy at most this many files at a time (default: 4)",
+    )
+    run_parser.add_argument(
+        "--check-unrecovered-traits",
+        action="store_true",
+        help="also write the original terms not matching any trait alias to the logs",
+    )
+    run_parser.add_argument(
+        "--capture-query-plans",
+        action="store_true",
+        help="save each sink's optimised plan and streaming-engine nodes next to the logs",
+    )
+    run_parser.add_argument(
+        "--profile-sinks",
+        action="store_true",
+        help="also profile each sink (in-memory engine; only for sinks whose output fits in memory)",
+    )
+
+    run_parser.add_argument(
+        "--quarantine",
+        action="store_true",
+        help="also write the rows each ingest stage rejects to data/quarantine (with --force for up to date stages)",
+    )
+    run_parser.add_argument(
+        "--ingest-ram-budget",
+        type=float,
+        metavar="GB",
+        help="ingest the raw extracts in parallel processes within this much memory",
+    )
+    run_parser.add_argument(
+        "--ingest-workers",
+        type=int,
+        metavar="N",
+        help="at most this many parallel ingest processes (default: chosen from the extract sizes and CPUs)",
+    )
+
+    status_parser = subparsers.add_parser("status", help="show which stages are up to date")
+    _add_run_details(status_parser)
+
+    subparsers.add_parser("stages", help="list the pipeline stages")
+
+    partition_parser = subparsers.add_parser("partition", help="split a ragged file by number of fields")
+    partition_parser.add_argument("file", help="delimited file with a header line")
+    partition_parser.add_argument("--separator", default="\\t", help="field separator (default: \\t)")
+    partition_parser.add_argument("--output-dir", help="where to write the bucket files (default: next to the file)")
+    partition_parser.add_argument("--workers", type=int, help="number of threads (default: one per CPU)")
+    partition_parser.add_argument(
+        "--count-only",
+        action="store_true",
+        help="only print the number of lines per number of fields",
+    )
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="time parts of the ingest on a version's raw data")
+    benchmark_parser.add_argument(
+        "benchmark",
+        choices=["decode", "formats"],
+        help=(
+            "decode: reading the typed columns as strings then casting vs parsing them at scan time; "
+            "formats: writing, reading and scanning the reference combo in each intermediate format"
+        ),
+    )
+    _add_version_details(benchmark_parser)
+    benchmark_parser.add_argument(
+        "--provenance",
+        action="append",
+        dest="provenances",
+        metavar="KEY",
+        help="decode: only this provenance (repeatable; default: all provenances with a schema)",
+    )
+    benchmark_parser.add_argument(
+        "--format",
+        action="append",
+        dest="formats",
+        metavar="FORMAT",
+        help="formats: only this intermediate format, e.g. parquet-zstd:500000 (repeatable; default: all)",
+    )
+    benchmark_parser.add_argument("--repeats", type=int, default=3, help="runs per way, the fastest is kept (default: 3)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "stages":
+        for name, s in STAGES.items():
+            print(f"{name:<50} {'(optional) ' if s.optional else ''}{s.description}")
+        return
+
+    if args.command == "partition":
+        separator = args.separator.encode().decode("unicode_escape")
+        if args.count_only:
+            print(field_counts(args.file, separator, workers=args.workers))
+        else:
+            print(partition_by_field_count(args.file, separator, output_path=args.output_dir, workers=args.workers))
+        return
+
+    config = _config(args)
+
+    if args.command == "benchmark":
+        with pl.Config(tbl_rows=-1, tbl_width_chars=200, fmt_str_lengths=60):
+            if args.benchmark == "formats":
+                print(format_benchmark(config, args.formats, repeats=args.repeats))
+            else:
+                print(decode_benchmark(config, args.provenances, repeats=args.repeats))
+        return
+
+    stages = list(args.stages or [])
+
+    if args.command == "status":
+        status(config, stages=stages)
+        return
+
+    optional_stages = [
+        name for name, requested in (
+            ("copy_raw_data", args.copy),
+            ("unrecovered_traits", args.check_unrecovered_traits),
+        ) if requested
+    ]
+    if optional_stages and not stages:
+        stages = [name for name, s in STAGES.items() if not s.optional]
+    stages = stages + optional_stages
+
+    if args.copy_workers:
+        config = dataclasses.replace(config, copy_workers=args.copy_workers)
+    if args.quarantine:
+        config = dataclasses.replace(config, quarantine_rejected_rows=True)
+    if not args.dry_run:
+        run_id = configure_telemetry(
+            config,
+            capture_query_plans=args.capture_query_plans,
+            profile_sinks=args.profile_sinks,
+        )
+        print(f"Run {run_id} of {config.version_folder_name} in {config.pipeline_version_path}")
+    run(
+        config,
+        stages=stages,
+        force=args.force,
+        dry_run=args.dry_run,
+        ingest_ram_budget_gb=args.ingest_ram_budget,
+        ingest_workers=args.ingest_workers,
+    )
@@ -0,0 +1,110 @@
+# Column (sets) used to select, hash and output the pipeline's data.
+
+import polars as pl
+
+# The two 64-bit halves of the fingerprint of a reading (see `hashing.py`)
+HASH_COLUMN_NAMES = ["hash", "hash_low"]
+
+
+TARGET_OUTPUT_COLUMNS = [
+    pl.col("pseudo_nhs_number"),
+    pl.col("test_date"),
+    pl.col("original_term"),
+    pl.col("result"),
+    pl.col("result_value_units"),
+    pl.col("provenance"),
+    pl.col("source"),
+]
+
+
+TARGET_OUTPUT_COLUMNS_WITH_HASH = TARGET_OUTPUT_COLUMNS + [pl.col(name) for name in HASH_COLUMN_NAMES]
+
+
+# The low-cardinality target columns as stored in the ingest intermediates (see `dictionary.py`); the hash is
+# taken on the strings
+CATEGORICAL_TARGET_COLUMNS = [
+    pl.col("original_term").cast(pl.Categorical),
+    pl.col("result_value_units").cast(pl.Categorical),
+]
+
+
+TARGET_TRAIT_LONG_COLUMNS = [
+    pl.col("trait"),
+    pl.col("target_units"),
+    pl.col("min"),
+    pl.col("max"),
+    pl.col("alias"),
+]
+
+
+TARGET_MEGA_LINKAGE_COLUMNS = [
+    pl.col("OrageneID"),
+    pl.col("gender"),
+    pl.col("gsa_id"),
+    pl.col("exome_id"),
+    pl.col("pseudo_nhs_number"),
+    pl.col("FID"),
+    pl.col("lane"),
+]
+
+
+TARGET_JOINED_LINK_FILE_AND_QUESTIONNAIRE_COLUMNS = [
+    pl.col("OrageneID"),
+    pl.col("gender"),
+    pl.col("dob"),
+    pl.col("year_of_birth"),
+    pl.col("exome_id"),
+    pl.col("pseudo_nhs_number"),
+    pl.col("gsa_id"),
+    pl.col("FID"),
+    pl.col("lane"),
+]
+
+
+TARGET_TRAIT_RAW_ALL_COLUMNS = [
+    pl.col("person_id"),
+    pl.col("trait"),
+    pl.col("unit"),
+    pl.col("value"),
+    pl.col("date"),
+    pl.col("gender"),
+    pl.col("age_at_test"),
+]
+
+
+TARGET_COMBO_POST_10D_WINDOWING_COLUMNS = [
+    pl.col("person_id"),
+    pl.col("trait"),
+    pl.col("unit"),
+    pl.col("value"),
+    pl.col("date"),
+    pl.col("gender"),
+    pl.col("age_at_test"),
+    pl.col("minmax_outlier"),
+    pl.col("region_types")
+]
+
+
+TARGET_TRAIT_READINGS_AT_INDIVIDUAL_TIMEPOINTS_COLUMNS = [
+    pl.col("person_id"),
+    pl.col("trait"),
+    pl.col("unit"),
+    pl.col("value"),
+    pl.col("date"),
+    pl.col("gender"),
+    pl.col("age_at_test"),
+    pl.col("minmax_outlier"),
+]
+
+
+TARGET_TRAIT_PER_INDIVIDUAL_STATS_COLUMNS = [
+    pl.col("person_id"),
+    pl.col("trait"),
+    pl.col("median"),
+    pl.col("mean"),
+    pl.col("max"),
+    pl.col("min"),
+    pl.col("earliest"),
+    pl.col("latest"),
+    pl.col("n")
+]
@@ -0,0 +1,223 @@
+# Run settings and the locations of every pipeline input, intermediate and output.
+#
+# The script is run in ivm on ivm storage; in this process, most source data are copied from
+# /library-red/ to /home/ivm/. The intermediary files are also initially stored on /home/ivm
+# during the running of the pipeline.
+# However, at completion of the pipeline, all useful intermediaries and final outputs are moved to
+# /library-red/phenotypes_curated/version###_YYYY_MM/
+
+from dataclasses import dataclass
+
+from cloudpathlib import AnyPath
+
+PIPELINE_NAME = "QUANT_PY"
+
+ROOT_FOLDER_LOCATION = "/home/ivm"
+
+LIBRARY_RED_DATA_LOCATION = "/genesandhealth/library-red/genesandhealth/phenotypes_rawdata"
+NHSE_SUBLICENSE_DATA_LOCATION = "/genesandhealth/nhsdigital-sublicence-red"
+
+MEGA_LINKAGE_LOCATION = (
+    "/",
+    "genesandhealth",
+    "library-red",
+    "genesandhealth",
+    "2025_02_10__MegaLinkage_forTRE.csv",
+)
+
+S1QST_LOCATION = (
+    "/",
+    "genesandhealth",
+    "library-red",
+    "genesandhealth",
+    "phenotypes_rawdata",
+    "QMUL__Stage1Questionnaire",
+    "2025_01_24__S1QSTredacted.csv", # The new one without future births
+)
+
+
+@dataclass(frozen=True)
+class RunConfig:
+    """
+    The run details (`version`, `yr`, `mon`) and every path derived from them.
+
+    Only the run details are required; the locations default to the production TRE layout and can be
+    overridden (e.g. `root_folder_location`) to run the pipeline elsewhere.
+
+    e.g.
+    ```
+    config = RunConfig(version="version011", yr="2025", mon="10")
+    config.secondary_arrow_path  # /home/ivm/QUANT_PY/version011_2025_10/data/secondary_care/arrow
+    ```
+    """
+    version: str
+    yr: str
+    mon: str
+    root_folder_location: str = ROOT_FOLDER_LOCATION
+    library_red_data_location: str = LIBRARY_RED_DATA_LOCATION
+    nhse_sublicense_data_location: str = NHSE_SUBLICENSE_DATA_LOCATION
+    mega_linkage_location: tuple[str, ...] = MEGA_LINKAGE_LOCATION
+    s1qst_location: tuple[str, ...] = S1QST_LOCATION
+    # Ingest stages whose raw files, spec and code are unchanged copy their earlier arrow file (see
+    # `fingerprints.py`); `pipeline.run(..., force=True)` turns this off
+    reuse_unchanged_ingests: bool = True
+    # Ingest stages also write the rows they reject to `quarantine_path` (see `quarantine.py`)
+    quarantine_rejected_rows: bool = False
+    # (stage, format) pairs: the file format of the combined intermediate a stage writes, e.g.
+    # `(("combined_all_sources", "parquet-zstd"),)` (default: uncompressed IPC, see `intermediates.py`)
+    intermediate_formats: tuple[tuple[str, str], ...] = ()
+    # Raw files copied at a time by `copy_raw_data` (see `transfer.py`)
+    copy_workers: int = 4
+
+    @property
+    def version_folder_name(self) -> str:
+        return f"{self.version}_{self.yr}_{self.mon}"
+
+    @property
+    def pipeline_version_path(self) -> AnyPath:
+        return AnyPath(self.root_folder_location, PIPELINE_NAME, self.version_folder_name)
+
+    @property
+    def data_path(self) -> AnyPath:
+        return AnyPath(self.pipeline_version_path, "data")
+
+    @property
+    def inputs_path(self) -> AnyPath:
+        # The input files are stored in the ivm for the run.  Once the run is officialised and released,
+        # the input files are copied to /red/QUANT_PY, so for subsequent re-running(s) of the pipeline
+        # they have to be copied back from /red/QUANT_PY into this directory.
+        return AnyPath(self.pipeline_version_path, "inputs")
+
+    @property
+    def helpers_path(self) -> AnyPath:
+        return AnyPath(self.pipeline_version_path, "helpers")
+
+    @property
+    def logs_path(self) -> AnyPath:
+        return AnyPath(self.pipeline_version_path, "logs")
+
+    @property
+    def outputs_path(self) -> AnyPath:
+        return AnyPath(self.pipeline_version_path, "outputs")
+
+    @property
+    def reference_combo_files_path(self) -> AnyPath:
+        return AnyPath(self.outputs_path, "reference_combo_files")
+
+    @property
+    def individual_trait_files_path(self) -> AnyPath:
+        return AnyPath(self.outputs_path, "individual_trait_files")
+
+    @property
+    def individual_trait_plots_path(self) -> AnyPath:
+        return AnyPath(self.outputs_path, "individual_trait_plots")
+
+    @property
+    def regenie_path(self) -> AnyPath:
+        return AnyPath(self.outputs_path, "regenie")
+
+    @property
+    def regenie_covariate_files_path(self) -> AnyPath:
+        return AnyPath(self.regenie_path, "covariate_files")
+
+    # "Ephemeral" paths: raw data copied over from /library-red/ and the intermediary files created and
+    # used during the running of the pipeline (e.g. `combined_dataset` arrow files).
+
+    @property
+    def raw_data_path(self) -> AnyPath:
+        # Destination for raw data files copied from /library-red and/or /nhsdigital to ivm
+        return AnyPath(self.data_path, "raw_datasets")
+
+    @property
+    def primary_arrow_path(self) -> AnyPath:
+        return AnyPath(self.data_path, "primary_care", "arrow")
+
+    @property
+    def nda_arrow_path(self) -> AnyPath:
+        return AnyPath(self.data_path, "nda", "arrow")
+
+    @property
+    def secondary_arrow_path(self) -> AnyPath:
+        return AnyPath(self.data_path, "secondary_care", "arrow")
+
+    @property
+    def combined_datasets_arrow_path(self) -> AnyPath:
+        return AnyPath(self.data_path, "combined_datasets", "arrow")
+
+    @property
+    def merge_spill_path(self) -> AnyPath:
+        # The merged chunks of the combine stages, removed once written (see `merge.py`)
+        return AnyPath(self.data_path, "merge_spill")
+
+    @property
+    def quarantine_path(self) -> AnyPath:
+        return AnyPath(self.data_path, "quarantine")
+
+    @property
+    def ingest_manifest_path(self) -> AnyPath:
+        # Shared by all pipeline versions, so that a new version can reuse the unchanged ingests of earlier ones
+        return AnyPath(self.root_folder_location, PIPELINE_NAME, "ingest_manifest")
+
+    @property
+    def string_dictionary_path(self) -> AnyPath:
+        # Shared by all pipeline versions, so that the codes of the dictionary-encoded columns never change
+        return AnyPath(self.root_folder_location, PIPELINE_NAME, "string_dictionary")
+
+    @property
+    def person_dictionary_path(self) -> AnyPath:
+        # Shared by all pipeline versions, so that the person ID of a pseudoNHS number never changes
+        return AnyPath(self.root_folder_location, PIPELINE_NAME, "person_dictionary")
+
+    @property
+    def nhse_data_path(self) -> AnyPath:
+        return AnyPath(self.nhse_sublicense_data_location, "DSA__NHSDigitalNHSEngland")
+
+    @property
+    def trait_features_path(self) -> AnyPath:
+        return AnyPath(self.inputs_path, "trait_features.csv")
+
+    @property
+    def trait_aliases_long_path(self) -> AnyPath:
+        return AnyPath(self.inputs_path, "trait_aliases_long.csv")
+
+    @property
+    def unit_conversions_path(self) -> AnyPath:
+        return AnyPath(self.inputs_path, "unit_conversions.csv")
+
+    @property
+    def mega_linkage_path(self) -> AnyPath:
+        return AnyPath(*self.mega_linkage_location)
+
+    @property
+    def s1qst_path(self) -> AnyPath:
+        return AnyPath(*self.s1qst_location)
+
+    def make_directories(self) -> None:
+        """
+        Creates all pipeline directories as needed.  Existing directories (e.g. from an earlier run of the same
+        version) are neither re-created nor emptied.
+        """
+        for path in (
+            self.raw_data_path,
+            self.helpers_path,
+            self.inputs_path,
+            self.outputs_path,
+            self.reference_combo_files_path,
+            self.logs_path,
+            self.individual_trait_files_path,
+            self.individual_trait_plots_path,
+            self.regenie_covariate_files_path,
+            self.primary_arrow_path,
+            self.nda_arrow_path,
+            self.secondary_arrow_path,
+            self.combined_datasets_arrow_path,
+            self.quarantine_path,
+            self.ingest_manifest_path,
+            self.string_dictionary_path,
+            self.person_dictionary_path,
+        ):
+            path.mkdir(parents=True, exist_ok=True)
+        for region_category in ("in_hospital", "out_hospital", "all"):
+            AnyPath(self.individual_trait_files_path, region_category).mkdir(parents=True, exist_ok=True)
+            AnyPath(self.individual_trait_plots_path, region_category).mkdir(parents=True, exist_ok=True)
+            AnyPath(self.regenie_path, region_category).mkdir(parents=True, exist_ok=True)
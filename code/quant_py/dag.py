@@ -0,0 +1,149 @@
+# Pipeline stages and the DAG formed by their declared inputs and outputs.
+#
+# Each stage is a function of the `RunConfig` which reads its declared inputs and writes its declared outputs.
+# There are no explicit dependencies: a stage depends on every stage writing one of its inputs, so adding
+# a provenance is a matter of registering its stage(s) with the right paths.
+
+import glob
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+
+
+@dataclass
+class Stage:
+    """
+    A named pipeline step.
+
+    :param name: unique stage name, used on the command line (provenance stages use the provenance key)
+    :param func: `func(config)` runs the stage
+    :param inputs: `inputs(config)` lists the files (or glob patterns) the stage reads
+    :param outputs: `outputs(config)` lists the files (or directories) the stage writes
+    :param optional: optional stages (e.g. copying raw data) only run when asked for by name
+    :param signature: `signature(config)` lists `[name, value]` entries compared, with the inputs, to tell whether
+        the stage is up to date (e.g. the digest of its spec and its code version), see `pipeline.input_signature`
+    """
+    name: str
+    func: Callable[[RunConfig], None]
+    inputs: Callable[[RunConfig], list[AnyPath]]
+    outputs: Callable[[RunConfig], list[AnyPath]]
+    optional: bool = False
+    description: str = field(default="", repr=False)
+    signature: Callable[[RunConfig], list[list]] | None = field(default=None, repr=False)
+
+
+STAGES: dict[str, Stage] = {}
+
+
+def stage(
+    name: str,
+    inputs: Callable[[RunConfig], list[AnyPath]],
+    outputs: Callable[[RunConfig], list[AnyPath]],
+    optional: bool = False,
+    description: str | None = None,
+    signature: Callable[[RunConfig], list[list]] | None = None,
+) -> Callable:
+    """
+    Registers the decorated `func(config)` as stage `name`.  Stages run in registration order unless their
+    inputs and outputs require otherwise.  The `description` defaults to the first line of the docstring.
+
+    e.g.
+    ```
+    @stage(
+        "2023_05_Bradford_path",
+        inputs=lambda config: [AnyPath(config.raw_data_path, "secondary_care", "*", "*", "1578_gh_lab_results_2023-06-09_noCR.ascii.redacted.tab")],
+        outputs=lambda config: [AnyPath(config.secondary_arrow_path, "2023_05_Bradford_path.arrow")],
+    )
+    def bradford_2023_05_path(config: RunConfig) -> None:
+        ...
+    ```
+    """
+    def register(func: Callable[[RunConfig], None]) -> Callable[[RunConfig], None]:
+        if name in STAGES:
+            raise ValueError(f"Stage {name} is already registered")
+        # `functools.partial` stages are described by the wrapped function
+        docstring = (getattr(func, "func", func).__doc__ or "").strip().split("\n")[0]
+        STAGES[name] = Stage(
+            name, func, inputs, outputs, optional, docstring if description is None else description, signature
+        )
+        return func
+    return register
+
+
+def expand(path: AnyPath) -> list[AnyPath]:
+    """The existing files (or directories) matching `path`, which may contain glob wildcards."""
+    path = AnyPath(path)
+    if not glob.has_magic(str(path)):
+        return [path] if path.exists() else []
+    parts = path.parts
+    first_wildcard = next(i for i, part in enumerate(parts) if glob.has_magic(part))
+    return sorted(AnyPath(*parts[:first_wildcard]).glob("/".join(parts[first_wildcard:])))
+
+
+def _writes_to(output: AnyPath, input_pattern: AnyPath) -> bool:
+    """Whether a (possibly wildcarded) declared output can be read by a (possibly wildcarded) declared input."""
+    output, input_pattern = str(output), str(input_pattern)
+    return (
+        output == input_pattern
+        or fnmatchcase(output, input_pattern)
+        or fnmatchcase(input_pattern, output)
+        # a directory output (e.g. raw_datasets/secondary_care/...) contains the files read from it
+        or input_pattern.startswith(output.rstrip("/") + "/")
+    )
+
+
+def upstream_stages(config: RunConfig, stages: dict[str, Stage] | None = None) -> dict[str, list[str]]:
+    """For every stage, the stages writing one of its inputs."""
+    stages = STAGES if stages is None else stages
+    outputs = {name: [AnyPath(path) for path in s.outputs(config)] for name, s in stages.items()}
+    return {
+        name: [
+            other for other in stages
+            if other != name and any(
+                _writes_to(output, input_pattern)
+                for output in outputs[other]
+                for input_pattern in s.inputs(config)
+            )
+        ]
+        for name, s in stages.items()
+    }
+
+
+def execution_order(config: RunConfig, names: list[str], stages: dict[str, Stage] | None = None) -> list[str]:
+    """
+    `names` and every stage they (transitively) depend on, upstream first.  Optional upstream stages are only
+    included if named.  Ties are broken by registration order.
+    """
+    stages = STAGES if stages is None else stages
+    unknown = [name for name in names if name not in stages]
+    if unknown:
+        raise KeyError(f"Unknown stage(s): {', '.join(unknown)}. Known stages: {', '.join(stages)}")
+
+    upstream = upstream_stages(config, stages)
+    selected = set()
+    to_visit = list(names)
+    while to_visit:
+        name = to_visit.pop()
+        if name in selected or (stages[name].optional and name not in names):
+            continue
+        selected.add(name)
+        to_visit.extend(upstream[name])
+
+    ordered, done = [], set()
+    while len(ordered) < len(selected):
+        ready = [
+            name for name in stages
+            if name in selected and name not in done and all(
+                dependency in done or dependency not in selected for dependency in upstream[name]
+            )
+        ]
+        if not ready:
+            cycle = sorted(selected - done)
+            raise ValueError(f"Stages depend on each other's outputs: {', '.join(cycle)}")
+        ordered.append(ready[0])
+        done.add(ready[0])
+    return ordered
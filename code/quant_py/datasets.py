@@ -0,0 +1,72 @@
+# The reference combo files as hive-partitioned Parquet datasets.
+#
+# `Combined_all_sources` and `Combined_traits_..._pre_10d_windowing` are read by every later stage and by ad hoc
+# queries, most of which only want some provenances, some traits or some persons.  Each is written as a folder of
+# Parquet files, one per key of `PARTITION_KEYS` (the trait once the readings are mapped to traits), e.g.
+#
+#   2025_10_Combined_all_sources/source=secondary_care/provenance=2023_05_Barts_path/0.parquet
+#   ..._pre_10d_windowing/source=primary_care/provenance=2024_12_Discovery_path/trait=HbA1c/0.parquet
+#
+# The rows of each file are sorted by person and date (`SORT_COLUMNS`), in row groups of `ROW_GROUP_SIZE` rows
+# with their statistics, so that a scan (`scan_dataset`) filtered on `source`, `provenance` or `trait` only opens
+# the files of the matching keys, and one filtered on a range of persons only reads the row groups overlapping it.
+# The keys are kept in the files too, with their `Enum`s, so that the columns and their types are those of the
+# frame written.  The person index of a dataset is written with it (see `person_index.py`).
+#
+# A dataset is removed before it is written, so that no file of an earlier run's keys is left in it.  The keys are
+# never null (every reading has its source and provenance, and the pre 10d windowing readings are those within their
+# trait's range): a null key fails the write, as polars 1.31 does not filter the rows of a null key of an `Enum`
+# column against a predicate on it.
+
+import shutil
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from .dag import expand
+from .person_index import write_person_index
+
+PARTITION_KEYS = {
+    "combined_all_sources": ["source", "provenance"],
+    "pre_10d_windowing": ["source", "provenance", "trait"],
+}
+
+SORT_COLUMNS = ["person_id", "test_date"]
+
+NULL_KEY = "__HIVE_DEFAULT_PARTITION__"
+
+COMPRESSION = "zstd"
+ROW_GROUP_SIZE = 100_000
+
+
+def dataset_files(path: AnyPath) -> AnyPath:
+    """The pattern of the files of the dataset at `path`, e.g. for the inputs of the stages reading it."""
+    return AnyPath(path, "**", "*.parquet")
+
+
+def sink_dataset(lf: pl.LazyFrame, stage: str, path: AnyPath) -> None:
+    """
+    `lf` written to the dataset at `path`, partitioned on `stage`'s `PARTITION_KEYS`, through the TRE sink, and its
+    person index.
+    """
+    path = AnyPath(path)
+    if path.exists():
+        shutil.rmtree(path)
+    lf.TRE.sink_parquet(
+        path,
+        partition_by=PARTITION_KEYS[stage],
+        sort_by=SORT_COLUMNS,
+        compression=COMPRESSION,
+        row_group_size=ROW_GROUP_SIZE,
+        statistics=True,
+        mkdir=True,
+    )
+    null_keys = sorted(str(folder.relative_to(path)) for folder in path.glob(f"**/*={NULL_KEY}"))
+    if null_keys:
+        raise ValueError(f"{path}: null keys {null_keys} (the keys of a dataset cannot be null)")
+    write_person_index(path, {file: pl.scan_parquet(file) for file in expand(dataset_files(path))})
+
+
+def scan_dataset(path: AnyPath) -> pl.LazyFrame:
+    """The dataset at `path`, its files pruned on the filters on its keys."""
+    return pl.scan_parquet(dataset_files(path), hive_partitioning=True)
@@ -0,0 +1,138 @@
+# Date parsing: the `test_date` of a provenance from one or more raw columns, in one of several formats.
+#
+# A provenance declares the formats its dates may be written in (`date_formats = ["%Y-%m-%d %H:%M", ...]`, or
+# a single `date_format`) and, optionally, several candidate columns (`test_date = ["ReportDate", "Report",
+# "RequestDate"]`), the first one holding a date giving `test_date`.  Every candidate string is parsed once
+# with each format, the first format which parses it winning.  With `fix_year_typo`, a leading `4` of the year
+# (a typo of the Barts extracts, `4022-05-01 09:30`) is read as `2` first.
+#
+# A date column repeats far fewer distinct strings than it has rows, so each batch is parsed by parsing its
+# distinct strings only, which are then joined back (as the result rules do, see `result_rules.py`).
+#
+# Every row also gets a `_date_format` label (`date_format_labels`): the candidate column and format which gave
+# its date (`ReportDate: %Y-%m-%d %H:%M`, `... (4xxx year)` when the year typo was fixed), or "unparsable" or
+# "null".  `provenance_plan` reports the number of rows per label with `TRE.count_with_logging`.
+
+import polars as pl
+
+YEAR_TYPO = (r"^4(\d{3})", "2$1")
+YEAR_TYPO_SUFFIX = " (4xxx year)"
+
+UNPARSABLE = "unparsable"
+NULL = "null"
+
+
+def format_labels(formats: list[str], fix_year_typo: bool = False) -> list[str]:
+    """The labels of the formats of one column: the formats, then (with `fix_year_typo`) the typo-fixed ones."""
+    return formats + ([f"{date_format}{YEAR_TYPO_SUFFIX}" for date_format in formats] if fix_year_typo else [])
+
+
+def date_format_labels(columns: list[str], formats: list[str], fix_year_typo: bool = False) -> list[str]:
+    """The `_date_format` labels of a date parsed from `columns`: each column's format labels, "unparsable", "null"."""
+    return [
+        f"{column}: {label}" for column in columns for label in format_labels(formats, fix_year_typo)
+    ] + [UNPARSABLE, NULL]
+
+
+def decode_dates(raw: pl.Series, formats: list[str], fix_year_typo: bool = False) -> pl.DataFrame:
+    """
+    `raw` (the date strings), with their `date` (null when no format parses them) and `format_index` (the index
+    of the label of the format which did, in `format_labels`).
+    """
+    raw_col = pl.col("raw")
+    fixed = raw_col.str.replace(*YEAR_TYPO) if fix_year_typo else raw_col
+    parsed = [f"_parsed_{i}" for i in range(len(formats))]
+    index = None
+    for i, name in enumerate(parsed):
+        index = (pl.when if index is None else index.when)(pl.col(name).is_not_null()).then(pl.lit(i, pl.UInt32))
+    if fix_year_typo:
+        # the labels of the typo-fixed formats follow those of the formats
+        index = pl.when(fixed != raw_col).then(index + len(formats)).otherwise(index)
+
+    return (
+        raw.rename("raw")
+        .to_frame()
+        .with_columns(
+            # each format parses each string once
+            fixed.str.to_date(date_format, strict=False).alias(name)
+            for date_format, name in zip(formats, parsed)
+        )
+        .select(
+            "raw",
+            date=pl.coalesce(parsed),
+            format_index=index,
+        )
+    )
+
+
+def parse_dates(
+    lf: pl.LazyFrame,
+    columns: list[str],
+    formats: list[str],
+    fix_year_typo: bool = False,
+    strict: bool = False,
+    alias: str = "test_date",
+) -> pl.LazyFrame:
+    """
+    `lf` with `alias`, the first date of the string `columns` (in order) parsed with one of `formats`, and its
+    `_date_format` label (`date_format_labels`).  With `strict`, a non-null string which none of the formats
+    parses fails the scan, as a strict `str.to_date` would.
+    """
+    if not formats:
+        raise ValueError(f"no date formats to parse {columns} with")
+    labels = date_format_labels(columns, formats, fix_year_typo)
+    label_dtype = pl.Enum(labels)
+    number_of_labels = len(format_labels(formats, fix_year_typo))
+
+    def decoder(offset: int):
+        def decode(batch: pl.Series) -> pl.Series:
+            decoded = decode_dates(batch.unique(), formats, fix_year_typo)
+            if strict:
+                unparsable = decoded.filter(pl.col("raw").is_not_null() & pl.col("date").is_null())
+                if not unparsable.is_empty():
+                    raise pl.exceptions.InvalidOperationError(
+                        f"{batch.name}: {unparsable.height} strings match none of {formats}, "
+                        f"e.g. {unparsable.get_column('raw').head(3).to_list()}"
+                    )
+            decoded = decoded.select(
+                "raw",
+                "date",
+                date_format=pl.col("format_index").replace_strict(
+                    range(number_of_labels),
+                    labels[offset:offset + number_of_labels],
+                    return_dtype=label_dtype,
+                ),
+            )
+            return (
+                batch.rename("raw")
+                .to_frame()
+                .join(decoded, on="raw", how="left", nulls_equal=True, maintain_order="left")
+                .select(pl.struct("date", "date_format"))
+                .to_series()
+            )
+        return decode
+
+    decoded = [f"_{column}_date" for column in columns]
+    lf = lf.with_columns(
+        pl.col(column)
+        .map_batches(
+            decoder(i * number_of_labels),
+            return_dtype=pl.Struct({"date": pl.Date, "date_format": label_dtype}),
+            is_elementwise=True,
+        )
+        .alias(name)
+        for i, (column, name) in enumerate(zip(columns, decoded))
+    )
+    return (
+        lf
+        .with_columns(
+            pl.coalesce(pl.col(name).struct.field("date") for name in decoded).alias(alias),
+            pl.coalesce(
+                *(pl.col(name).struct.field("date_format") for name in decoded),
+                pl.when(pl.any_horizontal(pl.col(columns).is_not_null()))
+                .then(pl.lit(UNPARSABLE, label_dtype))
+                .otherwise(pl.lit(NULL, label_dtype)),
+            ).alias("_date_format"),
+        )
+        .drop(decoded)
+    )
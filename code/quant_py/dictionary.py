@@ -0,0 +1,138 @@
+# The global string dictionary of the low-cardinality columns: `original_term`, `result_value_units` and `trait`.
+#
+# A few thousand distinct terms and units are repeated over tens of millions of readings, so these columns are
+# stored dictionary-encoded from the ingest on:
+#
+#   - ingest intermediates (`{provenance_key}.arrow`, the NDA file): `pl.Categorical`, each file with its own
+#     dictionary, since an ingest cannot know the terms of its raw files before scanning them
+#   - combined files (from `*_combined.arrow` to `Combined_all_sources.arrow`): `pl.Enum` of the global
+#     dictionary, read with `scan_encoded`; the `traits_denormalised` and `units_converter` keys are cast to the
+#     same `Enum`, so that the alias and unit joins compare integer codes
+#
+# The dictionary of each column is kept in `QUANT_PY/string_dictionary/{column}.json`, shared by all pipeline
+# versions.  It is append-only: new values are added at the end (and make a new version), so the code of a value
+# never changes and an `Enum` of an earlier version is a prefix of the current one.  `REFERENCED_VALUES`, which
+# the pipeline's code compares with or writes, are always in it (an `Enum` column cannot be compared with a
+# string which is not one of its categories).
+
+import datetime
+import json
+import os
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+from .dag import expand
+from .intermediates import scan_intermediate
+from .persons import encode_person_ids
+
+DICTIONARY_COLUMNS = ["original_term", "result_value_units", "trait"]
+
+REFERENCED_VALUES = {
+    "original_term": ["POCT Blood Ketones"], # `combined_all_sources`
+    "result_value_units": ["millimol/L", "%", "% total Hb", "%Hb", "per cent"], # `combined_all_sources`, HbA1c
+    "trait": ["HbA1c"],
+}
+
+
+def dictionary_path(config: RunConfig, column: str) -> AnyPath:
+    return AnyPath(config.string_dictionary_path, f"{column}.json")
+
+
+def load_dictionary(config: RunConfig, column: str) -> dict:
+    """The dictionary of `column`: its `values`, in code order, and its `versions`."""
+    path = dictionary_path(config, column)
+    if not path.exists():
+        return {"column": column, "values": [], "versions": []}
+    return json.loads(path.read_text())
+
+
+def _save_dictionary(config: RunConfig, column: str, dictionary: dict) -> None:
+    path = dictionary_path(config, column)
+    temporary_path = AnyPath(path.parent, f".{path.name}.tmp")
+    temporary_path.write_text(json.dumps(dictionary, indent=2))
+    os.replace(temporary_path, path)
+
+
+def update_dictionary(config: RunConfig, column: str, values: list[str]) -> pl.Enum:
+    """
+    The `Enum` of the dictionary of `column`, with `values` (and its `REFERENCED_VALUES`) added if they are not in
+    it yet, as a new version.
+    """
+    dictionary = load_dictionary(config, column)
+    known_values = set(dictionary["values"])
+    new_values = sorted(
+        {value for value in [*REFERENCED_VALUES.get(column, []), *values] if value is not None} - known_values
+    )
+    if new_values:
+        dictionary["values"].extend(new_values)
+        dictionary["versions"].append({
+            "version": len(dictionary["versions"]) + 1,
+            "size": len(dictionary["values"]),
+            "pipeline_version": config.version_folder_name,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        })
+        _save_dictionary(config, column, dictionary)
+    return pl.Enum(dictionary["values"])
+
+
+def _distinct_values(lf: pl.LazyFrame, column: str) -> list[str]:
+    """
+    The values of string, `Categorical` or `Enum` `column` of `lf`.  The streamed batches of an arrow file each
+    have their own `Categorical` dictionary, so the categories are read as strings rather than merged.
+    """
+    return lf.select(pl.col(column).cast(pl.Utf8).unique()).collect(engine="streaming").to_series().to_list()
+
+
+def scan_encoded_groups(config: RunConfig, *groups: list[AnyPath]) -> list[pl.LazyFrame]:
+    """
+    For each group of `paths` (which may contain glob wildcards), the files matching them concatenated,
+    with their `DICTIONARY_COLUMNS` cast to the `Enum` of the global dictionary, which is first updated with the
+    values of all the groups (so that all the groups have the same schema), and their pseudonyms replaced by
+    person IDs (see `persons.py`).
+
+    Each file is cast on its own: the local dictionaries of `Categorical` columns of different files would
+    otherwise be merged, re-encoding every row.  `Categorical` columns are cast to `Enum` through strings, as the
+    streaming engine (polars 1.31) fails to cast them directly.
+    """
+    group_files = []
+    for paths in groups:
+        files = [file for path in paths for file in expand(path)]
+        if not files:
+            raise FileNotFoundError(f"No files match {[str(path) for path in paths]}")
+        group_files.append(files)
+    scans = [[scan_intermediate(file) for file in files] for files in group_files]
+    all_scans = [scan for group_scans in scans for scan in group_scans]
+    enums = dictionary_enums(config, all_scans)
+    encoded_scans = iter(encode_person_ids(config, [scan.pipe(encode_dictionary_columns, enums) for scan in all_scans]))
+    return [pl.concat([next(encoded_scans) for _ in group_scans]) for group_scans in scans]
+
+
+def dictionary_enums(config: RunConfig, scans: list[pl.LazyFrame]) -> dict[str, pl.Enum]:
+    """The `Enum` of each of the `DICTIONARY_COLUMNS` of `scans`, its dictionary first updated with their values."""
+    columns = [column for column in DICTIONARY_COLUMNS if column in scans[0].collect_schema()]
+    return {
+        column: update_dictionary(
+            config,
+            column,
+            list({value for scan in scans for value in _distinct_values(scan, column)}),
+        )
+        for column in columns
+    }
+
+
+def encode_dictionary_columns(
+    frame: pl.DataFrame | pl.LazyFrame, enums: dict[str, pl.Enum]
+) -> pl.DataFrame | pl.LazyFrame:
+    """`frame` with its columns cast to their `enums` (see `dictionary_enums`), through strings."""
+    return frame.with_columns(pl.col(column).cast(pl.Utf8).cast(enum) for column, enum in enums.items())
+
+
+def scan_encoded(config: RunConfig, *paths: AnyPath) -> pl.LazyFrame:
+    """
+    The files matching `paths` (which may contain glob wildcards) concatenated, with their
+    `DICTIONARY_COLUMNS` cast to the `Enum` of the global dictionary, which is first updated with their values,
+    and their pseudonyms replaced by person IDs.
+    """
+    return scan_encoded_groups(config, list(paths))[0]
@@ -0,0 +1,106 @@
+# Filters, to be used in a polars `.filter`.
+#
+# Because polars filter **keeps** rows which match the criteria, if we want to exclude something we define
+# the complement.  For example, `EXCLUDE_NULL_UNITS` uses `.is_not_null()` which means only non_null values
+# will be preserved; ergo, null units will be excluded, hence the naming convention.
+
+import datetime
+
+import polars as pl
+
+# Non-HES filters
+
+EXCLUDE_NULL_UNITS = [
+    pl.col("result_value_units").is_not_null()
+]
+
+
+EXCLUDE_READINGS_WITH_IMPLAUSIBLE_DATES = [
+    pl.col("age_at_test") >= 0,
+    pl.col("test_date") <= datetime.datetime.today(),
+]
+
+
+# G&H has volunteers from age 16+
+EXCLUDE_READINGS_WITH_INDIVS_UNDER_SIXTEEN = [
+    pl.col("age_at_test") >= 16
+]
+
+
+EXCLUDE_READINGS_WITH_VALUES_OUTSIDE_EXPECTED_RANGE = [
+    pl.col("range_position").eq("ok")
+]
+
+
+# HES filters
+
+IN_APC_ONLY = (
+    pl.col("region_types").list.contains("APC"),
+    ~pl.col("region_types").list.contains("buffer_before"),
+    ~pl.col("region_types").list.contains("buffer_after"),
+)
+
+IN_APC_ANY = (
+    pl.col("region_types").list.contains("APC"),
+)
+
+IN_BUFFER_BEFORE_ONLY = (
+    pl.col("region_types").list.contains("buffer_before"),
+    ~pl.col("region_types").list.contains("APC"),
+    ~pl.col("region_types").list.contains("buffer_after"),
+)
+
+IN_BUFFER_BEFORE_ANY = (
+    pl.col("region_types").list.contains("buffer_before"),
+)
+
+IN_BUFFER_AFTER_ONLY = (
+    ~pl.col("region_types").list.contains("buffer_before"),
+    ~pl.col("region_types").list.contains("APC"),
+    pl.col("region_types").list.contains("buffer_after"),
+)
+
+IN_BUFFER_AFTER_ANY = (
+    pl.col("region_types").list.contains("buffer_after"),
+)
+
+IN_BUFFERS_ONLY = (
+    (
+        pl.col("region_types").list.contains("buffer_before")
+        | pl.col("region_types").list.contains("buffer_after")
+    )
+    & ~pl.col("region_types").list.contains("APC"),
+)
+
+IN_BUFFERS_ANY = (
+    pl.col("region_types").list.contains("buffer_before")
+    | pl.col("region_types").list.contains("buffer_after")
+)
+
+IN_TOTAL_EXCLUSION_ZONE = (
+    pl.col("region_types").list.contains("APC")
+    | pl.col("region_types").list.contains("buffer_before")
+    | pl.col("region_types").list.contains("buffer_after"),
+)
+
+OUT_OF_APC = (
+    ~pl.col("region_types").list.contains("APC")
+    | pl.col("region_types").is_null()
+)
+
+OUT_OF_TOTAL_EXCLUSION_ZONE = (
+    (
+        ~pl.col("region_types").list.contains("APC")
+        & ~pl.col("region_types").list.contains("buffer_before")
+        & ~pl.col("region_types").list.contains("buffer_after")
+    )
+    | pl.col("region_types").is_null()
+)
+
+# The three versions of every output file: readings within an APC + buffer, readings out of any APC + buffer,
+# and all readings regardless of hospitalisation status.
+REGION_CATEGORY_FILTERS = {
+    "in_hospital": IN_TOTAL_EXCLUSION_ZONE,
+    "out_hospital": OUT_OF_TOTAL_EXCLUSION_ZONE,
+    "all": ( True )
+}
@@ -0,0 +1,171 @@
+# Content fingerprints of the ingest stages, to reuse the arrow file of an unchanged provenance.
+#
+# A new pipeline version copies the raw data to its own folder (new paths and modification times) and starts
+# without arrow files, so the runner's own checks (see `pipeline.py`) re-run every ingest although most
+# extracts (e.g. `2022_04_Discovery`) never change.  The fingerprint of every completed ingest is therefore kept
+# in a manifest shared by all versions, `QUANT_PY/ingest_manifest/{name}.json`:
+#
+#   - name, size, modification time and content hash (BLAKE2b) of every raw input; the hash of a file whose
+#     path, size and modification time are in the manifest is taken from there rather than re-computed
+#   - the provenance spec (see `provenances/*.toml`)
+#   - the code version: the polars version and a hash of the modules turning the raw files into the arrow file
+#
+# An ingest whose raw file names, sizes and hashes, spec and code version match a recorded run, and whose arrow
+# file is still there unchanged, copies that file instead of reading the raw files again.
+
+import datetime
+import hashlib
+import json
+import os
+import shutil
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+
+HASH_BLOCK_BYTES = 8 * 2**20
+
+
+def content_hash(path: AnyPath) -> str:
+    """BLAKE2b (128 bit) hex digest of the contents of `path`."""
+    digest = hashlib.blake2b(digest_size=16)
+    with AnyPath(path).open("rb") as file:
+        while block := file.read(HASH_BLOCK_BYTES):
+            digest.update(block) # releases the GIL, so files are hashed in parallel threads
+    return digest.hexdigest()
+
+
+def code_version(modules: list[ModuleType]) -> str:
+    """The polars version and a hash of the source of `modules`."""
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(Path(module.__file__).read_bytes())
+    return f"polars {pl.__version__}, code {digest.hexdigest()[:16]}"
+
+
+def stage_signature(spec: dict, modules: list[ModuleType]) -> list[list]:
+    """The spec and code entries of an ingest stage's signature (see `dag.Stage`)."""
+    spec_digest = hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+    return [["spec", spec_digest[:16]], ["code", code_version(modules)]]
+
+
+def manifest_path(config: RunConfig, name: str) -> AnyPath:
+    return AnyPath(config.ingest_manifest_path, f"{name}.json")
+
+
+def load_manifest(config: RunConfig, name: str) -> list[dict]:
+    """The recorded runs of ingest stage `name`, oldest first."""
+    path = manifest_path(config, name)
+    return json.loads(path.read_text()) if path.exists() else []
+
+
+def _save_manifest(config: RunConfig, name: str, records: list[dict]) -> None:
+    path = manifest_path(config, name)
+    temporary_path = AnyPath(path.parent, f".{path.name}.tmp")
+    temporary_path.write_text(json.dumps(records, indent=2))
+    os.replace(temporary_path, path)
+
+
+def _stat(path: AnyPath) -> tuple[int, int]:
+    stat = AnyPath(path).stat()
+    return stat.st_size, getattr(stat, "st_mtime_ns", int(stat.st_mtime * 1e9))
+
+
+def input_fingerprints(files: list[AnyPath], records: list[dict]) -> list[dict]:
+    """`path`, `name`, `size`, `mtime_ns` and `hash` of `files`, re-using the hashes in `records` where possible."""
+    known_hashes = {
+        (file["path"], file["size"], file["mtime_ns"]): file["hash"]
+        for record in records
+        for file in record["inputs"]
+    }
+
+    def fingerprint(file: AnyPath) -> dict:
+        size, mtime_ns = _stat(file)
+        return {
+            "path": str(file),
+            "name": AnyPath(file).name,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "hash": known_hashes.get((str(file), size, mtime_ns)) or content_hash(file),
+        }
+
+    with ThreadPoolExecutor() as executor:
+        return sorted(executor.map(fingerprint, files), key=lambda file: (file["name"], file["path"]))
+
+
+def fingerprint_digest(inputs: list[dict], spec: dict | None, code: str) -> str:
+    """The digest compared between runs: raw file names, sizes and hashes, spec and code version."""
+    return hashlib.sha256(
+        json.dumps(
+            {
+                "inputs": [[file["name"], file["size"], file["hash"]] for file in inputs],
+                "spec": spec,
+                "code_version": code,
+            },
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+
+
+def reusable_output(records: list[dict], digest: str) -> AnyPath | None:
+    """The output of the latest recorded run with `digest` which still exists unchanged, if any."""
+    for record in reversed(records):
+        if record["digest"] != digest:
+            continue
+        output = AnyPath(record["output"])
+        if output.exists() and list(_stat(output)) == [record["output_size"], record["output_mtime_ns"]]:
+            return output
+    return None
+
+
+def reuse_or_build(
+    config: RunConfig,
+    name: str,
+    files: list[AnyPath],
+    output: AnyPath,
+    build: Callable[[], None],
+    spec: dict | None = None,
+    code_modules: list[ModuleType] = (),
+) -> None:
+    """
+    Runs `build()` to write `output` from the raw `files`, unless an earlier run of ingest stage `name` (in any
+    pipeline version) had the same fingerprint, in which case its output is copied (or kept, if it is `output`).
+    Either way the run is recorded in the stage's manifest, which keeps the latest run per output.
+    """
+    records = load_manifest(config, name)
+    inputs = input_fingerprints(files, records)
+    code = code_version(code_modules)
+    digest = fingerprint_digest(inputs, spec, code)
+
+    previous_output = reusable_output(records, digest) if config.reuse_unchanged_ingests else None
+    if previous_output is None:
+        build()
+    elif str(previous_output) == str(output):
+        print(f"[{name}] Raw files, spec and code unchanged, keeping {output}")
+    else:
+        print(f"[{name}] Raw files, spec and code unchanged, copying {previous_output}")
+        temporary_output = AnyPath(output.parent, f".{output.name}.tmp")
+        shutil.copy2(previous_output, temporary_output)
+        os.replace(temporary_output, output)
+
+    output_size, output_mtime_ns = _stat(output)
+    # the latest run per output
+    records = [record for record in records if record["output"] != str(output)]
+    records.append({
+        "digest": digest,
+        "inputs": inputs,
+        "code_version": code,
+        "output": str(output),
+        "output_size": output_size,
+        "output_mtime_ns": output_mtime_ns,
+        "version": config.version_folder_name,
+        "reused": previous_output is not None,
+        "completed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    })
+    _save_manifest(config, name, records)
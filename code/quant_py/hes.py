@@ -0,0 +1,298 @@
+# HES (hospital episode statistics) functions: admission windows, buffers and region types.
+#
+# At present we only consider APC episodes >2days.  However, the functions are able handle AE/ECDS/CC/OP.
+# They can also further be modified to consider "padding".  Padding is not currently used (i.e. set to zero days).
+#
+# ```
+# ------------OAPC------------|        APC         |------------OAPC------------
+# ----------|  Buffer before  |        APC         |   Buffer after  |----------
+# ----------|                 TOTAL EXCLUSION ZONE                   |----------
+# -- OTEZ --|                                                        |-- OTEZ --
+#
+# Padding (not currently used):
+# ----| Buffer before  | Pad.  |        APC         | Pad.  | Buffer after |----
+# ```
+#
+# * APC = Admitted patient care
+# * OAPC = Out of admitted patient care
+# * OTEZ = Out of total exclusion zone (herein `out_hospital`)
+
+from itertools import chain, combinations
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+from .filters import (
+    IN_APC_ONLY,
+    IN_APC_ANY,
+    IN_BUFFER_BEFORE_ONLY,
+    IN_BUFFER_BEFORE_ANY,
+    IN_BUFFER_AFTER_ONLY,
+    IN_BUFFER_AFTER_ANY,
+    IN_BUFFERS_ONLY,
+    IN_BUFFERS_ANY,
+    IN_TOTAL_EXCLUSION_ZONE,
+    OUT_OF_APC,
+    OUT_OF_TOTAL_EXCLUSION_ZONE,
+)
+from .intermediates import intermediate_path, scan_intermediate
+from .persons import encode_person_id
+
+# We are not considering CC, AE, ECDS, and certanly not OP; included for future-proofing
+# hospital_stay_type_enum = pl.Enum(["AE", "APC", "ECDS", "CC", "OP"])
+hospital_stay_type_enum = pl.Enum(["APC"])
+# adding buffers to list of possible
+region_types_enum =  pl.Enum(list(hospital_stay_type_enum.categories) + ["buffer_before", "buffer_after"])
+
+BUFFER_BEFORE_DAYS = 14
+BUFFER_AFTER_DAYS = 14
+
+
+def add_buffers(
+    lf: pl.LazyFrame,
+    buffer_before_duration_in_days: pl.UInt16 = BUFFER_BEFORE_DAYS,
+    buffer_after_duration_in_days: pl.UInt16 = BUFFER_AFTER_DAYS,
+    padding_before_duration_in_days: pl.UInt16 = 0,
+    padding_after_duration_in_days: pl.UInt16 = 0,
+    id_column: pl.Utf8 = "id",
+    hospital_start_date_column: pl.Utf8 = "start_date",
+    hospital_end_date_column: pl.Utf8 = "end_date"
+) -> pl.LazyFrame:
+    """
+    Adds Buffer Before|After, Padding Before|After to the hospital stay periods.
+
+    :param lf: input LazyFrame containing pseudo_nhs_number, start_date, end_date representing hospital admission/discharge dates
+    :param buffer_before_duration_in_days: Days before hospital stay considered as buffer
+    :param buffer_after_duration_in_days: Days after hospital stay considered as buffer
+    :param padding_before_duration_in_days: Padding between hospital stay and buffer before
+    :param padding_after_duration_in_days: Padding between hospital stay and buffer after
+    :param hospital_start_date_column: Column name for hospital start date
+    :param hospital_end_date_column: Column name for hospital end date
+    :return: LazyFrame with additional region types
+    """
+
+#     lf = lf.rename({id_column: "pseudo_nhs_number"}, strict=False)
+
+    lf = lf.rename({
+            id_column: "id",
+            hospital_start_date_column: "start_date",
+            hospital_end_date_column: "end_date",
+        })
+
+    lf_extended = (
+        lf.with_columns([
+            (pl.col("start_date") - pl.duration(days=buffer_before_duration_in_days + padding_before_duration_in_days)).alias("buffer_before_start"),
+            (pl.col("start_date") - pl.duration(days=padding_before_duration_in_days)).alias("padding_before_end"),
+            (pl.col("end_date") + pl.duration(days=padding_after_duration_in_days)).alias("padding_after_start"),
+            (pl.col("end_date") + pl.duration(days=buffer_after_duration_in_days + padding_after_duration_in_days)).alias("buffer_after_end"),
+        ])
+    )
+
+    buffer_before = lf_extended.select([
+        pl.col("id"),
+        pl.col("buffer_before_start").alias("start_date"),
+        pl.col("padding_before_end").alias("end_date"),
+        pl.concat_list(pl.lit("buffer_before", dtype=region_types_enum)).alias("region_types")
+#         pl.lit(["buffer_before"], dtype=region_types_enum).alias("region_types")
+    ])
+
+    hospital_stay = lf.select([
+        pl.col("id"),
+        pl.col("start_date"),
+        pl.col("end_date"),
+        pl.concat_list(pl.lit("APC", dtype=region_types_enum)).alias("region_types")
+#         pl.lit(["APC"], dtype=region_types_enum).alias("region_types")
+    ])
+
+    buffer_after = lf_extended.select([
+        pl.col("id"),
+        pl.col("padding_after_start").alias("start_date"),
+        pl.col("buffer_after_end").alias("end_date"),
+        pl.concat_list(pl.lit("buffer_after", dtype=region_types_enum)).alias("region_types")
+#         pl.lit(["buffer_after"], dtype=region_types_enum).alias("region_types")
+    ])
+
+    return (
+        pl.concat([
+            buffer_before,
+            hospital_stay,
+            buffer_after
+        ])
+        .sort(["id", "start_date"])
+        .rename({
+            "id":id_column
+        })
+
+    )
+
+
+def split_overlapping_intervals_and_remerge(
+    lf: pl.LazyFrame,
+    id_column: pl.Utf8 = "pseudo_nhs_number",
+    start_date_column: pl.Utf8 = "start_date",
+    end_date_column: pl.Utf8 = "end_date",
+) -> pl.LazyFrame:
+    lf = lf.rename({
+        id_column: "id",
+        start_date_column: "start_date",
+        end_date_column: "end_date",
+    })
+
+    return (
+        lf
+        .sort(["id", "start_date", "end_date"], descending=[False, False, True])
+        .select([
+            pl.col("id"),
+            pl.col("start_date").alias("start_boundary"),
+            pl.col("end_date").alias("end_boundary")
+        ])
+        .unpivot(index=["id"], on=["start_boundary", "end_boundary"], variable_name="type", value_name="boundary")
+        .select(["id", "boundary"])
+        .unique()
+        .sort(["id", "boundary"])
+        .with_columns(
+            pl.col("boundary").shift(-1).over("id").alias("end_date")
+        )
+        .drop_nulls()
+        .join_where(
+            lf,
+            pl.col("id").eq(pl.col("id_right")) &
+            (pl.col("boundary") >= pl.col("start_date")) &
+            (pl.col("end_date") <= pl.col("end_date_right")),
+            suffix="_right"
+        )
+        .group_by(["id", "boundary", "end_date"], maintain_order=True)
+        .agg(pl.col("region_types").explode().unique().sort().alias("region_types"))
+        .rename({"boundary": "start_date"})
+        .with_columns(
+            (pl.col("start_date") > pl.col("end_date").shift(1)).fill_null(True).alias("new_group") |
+            (pl.col("id") != pl.col("id").shift(1)).fill_null(True) |
+            (pl.col("region_types") != pl.col("region_types").shift(1)).fill_null(True)
+        )
+        .with_columns(
+            pl.col("new_group")
+            .cum_sum()
+            .alias("group")
+        )
+        .group_by(["id", "group", "region_types"], maintain_order=True)
+        .agg(
+            pl.col("start_date").min(),
+            pl.col("end_date").max()
+        )
+        .select(
+            pl.col("id").alias(id_column),
+            pl.col("start_date").alias(start_date_column),
+            pl.col("end_date").alias(end_date_column),
+            pl.col("region_types"),
+        )
+    )
+
+
+def combined_hes_path(config: RunConfig) -> AnyPath:
+    """The concatenated, de-duplicated HES episodes written by the `hes_apc` stage."""
+    return intermediate_path(
+        config,
+        "hes_apc",
+        config.combined_datasets_arrow_path,
+        f"{config.yr}_{config.mon}_Combined_HES"
+    )
+
+
+def hes_final_admission_windows(config: RunConfig) -> pl.LazyFrame:
+    """
+    > "This is where the magic happens." SR, April 2025
+
+    The admission windows (see `admission_windows`) of all the HES episodes, with person IDs.
+    """
+    return (
+        scan_intermediate(
+            combined_hes_path(config)
+        )
+        .pipe(encode_person_id, config)
+        .pipe(admission_windows)
+    )
+
+
+def admission_windows(episodes: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    1. The unfiltered HES data: `episodes`, with person IDs.
+    2. Coalesce overlapping admission windows (including de-duplication).
+    3. (Optional) filter for HES type.  At present we only import APC data.
+    4. Only accept APC episodes >2 days in duration.
+    5. Extend accepted episodes by buffer period.
+    6. Split overlapping intervals and re-merge.
+
+    Each person's windows only depend on their own episodes, so those of a few persons can be computed from their
+    episodes alone (see `lookup.get_person`).
+    """
+    return (
+        episodes
+        .pipe(split_overlapping_intervals_and_remerge,
+             id_column="person_id",
+             start_date_column="hospital_admission_datetime",
+             end_date_column="hospital_discharge_datetime"
+             )
+    # Filter not required at present as we only import APC data
+    #     .filter(
+    #         pl.col("hospital_stay_type").eq("APC")
+    #     )
+        .with_columns(
+            pl.col("hospital_admission_datetime").dt.round("1d").dt.date().alias("start_date"),
+            pl.col("hospital_discharge_datetime").dt.round("1d").dt.date().alias("end_date"),
+        )
+        .with_columns(
+            ((pl.col("end_date") - pl.col("start_date")) )
+            .alias("admission_duration")
+        )
+        .filter(
+            pl.col("admission_duration") > pl.duration(days=2)
+        )
+        .pipe(
+            add_buffers,
+            id_column="person_id",
+        )
+        .pipe(
+            split_overlapping_intervals_and_remerge,
+            id_column="person_id",
+        )
+        .sort(["person_id", "start_date"])
+    )
+
+
+def hes_columns_for_joining() -> pl.LazyFrame:
+    """
+    One row per possible `region_types` value with a boolean column per HES filter.
+
+    This may be useful for troubleshooting/regenie/bespoke set/a paper on impact of hospitalisation but at
+    present not needed for pipeline which will use `region_types` (a polars `List`) column only.
+    """
+    region_options = list(region_types_enum.categories)
+
+    subsets = list(chain.from_iterable(combinations(region_options, r) for r in range(len(region_options) + 1)))
+
+    return (
+        pl.LazyFrame(
+            [{**{col: (col in subset) for col in region_options}, "subset": subset } for subset in subsets]
+        )
+        .with_columns(
+            pl.when(pl.col("subset").list.len() > 0)
+            .then(
+                pl.col("subset").cast(pl.List(region_types_enum)).alias("region_types")
+            )
+        )
+        .select(
+            pl.col("region_types"),
+            pl.all_horizontal(IN_APC_ONLY).fill_null(False).alias("IN_APC_ONLY"),
+            pl.all_horizontal(IN_APC_ANY).fill_null(False).alias("IN_APC_ANY"),
+            pl.all_horizontal(IN_BUFFER_BEFORE_ONLY).fill_null(False).alias("IN_BUFFER_BEFORE_ONLY"),
+            pl.all_horizontal(IN_BUFFER_BEFORE_ANY).fill_null(False).alias("IN_BUFFER_BEFORE_ANY"),
+            pl.all_horizontal(IN_BUFFER_AFTER_ONLY).fill_null(False).alias("IN_BUFFER_AFTER_ONLY"),
+            pl.all_horizontal(IN_BUFFER_AFTER_ANY).fill_null(False).alias("IN_BUFFER_AFTER_ANY"),
+            pl.all_horizontal(IN_BUFFERS_ONLY).fill_null(False).alias("IN_BUFFERS_ONLY"),
+            pl.all_horizontal(IN_BUFFERS_ANY).fill_null(False).alias("IN_BUFFERS_ANY"),
+            pl.all_horizontal(IN_TOTAL_EXCLUSION_ZONE).fill_null(False).alias("IN_TOTAL_EXCLUSION_ZONE"),
+            pl.all_horizontal(OUT_OF_APC).fill_null(False).alias("OUT_OF_APC"),
+            pl.all_horizontal(OUT_OF_TOTAL_EXCLUSION_ZONE).fill_null(False).alias("OUT_OF_TOTAL_EXCLUSION_ZONE"),
+        )
+    )
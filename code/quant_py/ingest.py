@@ -0,0 +1,187 @@
+# Running several provenance ingest stages at once, in a process pool, within a RAM budget.
+#
+# Ingesting an extract is mostly CSV decoding of one (large) file, which leaves cores idle while it waits on I/O,
+# so a few extracts ingested side by side finish sooner than one after the other.  Each worker is a separate
+# (spawned) process with its own polars thread pool of `POLARS_MAX_THREADS = cpu_count // workers` threads.
+#
+# The number of workers is chosen from the raw file sizes: it is the largest number of extracts whose estimated
+# peak memory fits in the budget together, counting the largest extracts first, so any that many extracts fit.
+# An extract's peak memory is estimated as a fixed worker overhead plus a multiple of its raw file size; the
+# throughput report records the actual peak RSS of every extract to tune `MEMORY_PER_INPUT_BYTE` against.
+
+import datetime
+import multiprocessing
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from . import stages as _stages # noqa: F401 (registers the stages)
+from .config import RunConfig
+from .dag import STAGES
+from .provenance import raw_files
+from .sources import PROVENANCE_SPECS
+from .tre import TREStage
+
+# The stages which can be ingested in parallel: one per provenance spec, each reading its own raw files
+INGEST_SPECS = {key: spec for specs in PROVENANCE_SPECS.values() for key, spec in specs.items()}
+
+# polars runtime, scan buffers and the streaming engine's morsels of one worker
+WORKER_OVERHEAD_BYTES = 512 * 2**20
+# the `unique` on `hash` holds all de-duplicated rows, which in arrow take about as much as the raw text
+MEMORY_PER_INPUT_BYTE = 1.5
+
+
+def input_bytes(config: RunConfig, name: str) -> int:
+    """Size of the raw files read by ingest stage `name`."""
+    return sum(file.stat().st_size for file in raw_files(config, INGEST_SPECS[name]))
+
+
+def estimated_peak_bytes(size: int) -> int:
+    """Estimated peak RSS of a worker ingesting `size` bytes of raw files."""
+    return WORKER_OVERHEAD_BYTES + int(MEMORY_PER_INPUT_BYTE * size)
+
+
+def plan_workers(estimates: list[int], ram_budget_bytes: int, max_workers: int) -> int:
+    """The largest number of workers (at most `max_workers`) for which the largest `estimates` fit the budget."""
+    workers, reserved = 0, 0
+    for estimate in sorted(estimates, reverse=True)[:max_workers]:
+        if workers and reserved + estimate > ram_budget_bytes:
+            break
+        workers += 1
+        reserved += estimate
+    return max(workers, 1)
+
+
+def _init_worker(polars_max_threads: int, run_info: dict, plan_path: AnyPath | None, profile_sinks: bool) -> None:
+    # Before any query runs, since polars sizes its thread pool on first use
+    os.environ["POLARS_MAX_THREADS"] = str(polars_max_threads)
+    TREStage.run_info = run_info
+    TREStage.plan_path = plan_path
+    TREStage.profile_sinks = profile_sinks
+    TREStage.log_path = None # the records are sent back to (and logged by) the parent
+
+
+def _run_ingest_stage(config: RunConfig, name: str) -> dict:
+    TREStage.records = []
+    wall_start = time.perf_counter()
+    STAGES[name].func(config)
+    return {
+        "wall_seconds": time.perf_counter() - wall_start,
+        "polars_threads": pl.thread_pool_size(),
+        "records": TREStage.records,
+    }
+
+
+def parallel_ingest(
+    config: RunConfig,
+    names: list[str],
+    ram_budget_gb: float,
+    max_workers: int | None = None,
+    on_completed: Callable[[str], None] | None = None,
+) -> pl.DataFrame:
+    """
+    Runs the ingest stages `names` in a process pool whose size is chosen so that their estimated peak memory
+    fits in `ram_budget_gb`, largest extracts first, and returns (and saves to the logs) a throughput report:
+    raw bytes, estimated and actual peak RSS, rows out, wall time, MB/s and rows/s per extract.
+
+    `on_completed(name)` is called (in this process) as each stage completes, e.g. to record it as up to date.
+    The stage telemetry of the workers is added to this run's (see `TREStage`).  If any stage fails, the others
+    are still completed before the first error is raised.
+
+    e.g.
+    ```
+    parallel_ingest(config, primary_keys, ram_budget_gb=48)
+    ```
+    """
+    sizes = {name: input_bytes(config, name) for name in names}
+    estimates = {name: estimated_peak_bytes(size) for name, size in sizes.items()}
+    ram_budget_bytes = int(ram_budget_gb * 2**30)
+    cpu_count = os.cpu_count() or 1
+    workers = plan_workers(list(estimates.values()), ram_budget_bytes, min(max_workers or cpu_count, len(names)))
+    polars_max_threads = max(1, cpu_count // workers)
+
+    print(
+        f"[ingest] {len(names)} stage(s), {sum(sizes.values()) / 2**30:.2f} GiB of raw files: {workers} worker(s) "
+        f"x {polars_max_threads} polars thread(s) within {ram_budget_gb} GiB"
+    )
+    for name in names:
+        if estimates[name] > ram_budget_bytes:
+            print(f"[{name}] Estimated peak memory {estimates[name] / 2**30:.1f} GiB exceeds the ingest RAM budget")
+
+    rows = []
+    errors = {}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        # forking a process which already runs polars threads can deadlock
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(polars_max_threads, TREStage.run_info, TREStage.plan_path, TREStage.profile_sinks),
+    ) as executor:
+        futures = {
+            executor.submit(_run_ingest_stage, config, name): name
+            for name in sorted(names, key=sizes.get, reverse=True) # longest first
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[{name}] Failed: {e!r}")
+                errors[name] = e
+                continue
+
+            TREStage.records.extend(result["records"])
+            TREStage.write_log()
+            rows_out = sum(record["rows_out"] or 0 for record in result["records"])
+            rows.append({
+                "stage": name,
+                "input_bytes": sizes[name],
+                "estimated_peak_bytes": estimates[name],
+                "peak_rss_bytes": max((record["peak_rss_bytes"] for record in result["records"]), default=None),
+                "rows_out": rows_out,
+                "wall_seconds": result["wall_seconds"],
+                "input_mb_per_second": sizes[name] / 2**20 / result["wall_seconds"],
+                "rows_per_second": rows_out / result["wall_seconds"],
+                "workers": workers,
+                "polars_threads": result["polars_threads"],
+            })
+            print(
+                f"[{name}] Ingested {sizes[name] / 2**20:.0f} MiB in {result['wall_seconds']:.1f}s "
+                f"({rows[-1]['input_mb_per_second']:.1f} MiB/s, {rows[-1]['rows_per_second']:.0f} rows/s)"
+            )
+            if on_completed is not None:
+                on_completed(name)
+    wall_seconds = time.perf_counter() - started
+
+    report = pl.DataFrame(
+        rows,
+        schema={
+            "stage": pl.Utf8,
+            "input_bytes": pl.UInt64,
+            "estimated_peak_bytes": pl.UInt64,
+            "peak_rss_bytes": pl.UInt64,
+            "rows_out": pl.UInt64,
+            "wall_seconds": pl.Float64,
+            "input_mb_per_second": pl.Float64,
+            "rows_per_second": pl.Float64,
+            "workers": pl.UInt32,
+            "polars_threads": pl.UInt32,
+        },
+    )
+    run_id = TREStage.run_info.get("run_id") or datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    report.write_parquet(
+        AnyPath(config.logs_path, f"{config.yr}_{config.mon}_{config.version}_{run_id}_ingest_throughput.parquet")
+    )
+    print(
+        f"[ingest] {report['input_bytes'].sum() / 2**20:.0f} MiB in {wall_seconds:.1f}s "
+        f"({report['input_bytes'].sum() / 2**20 / wall_seconds:.1f} MiB/s overall)"
+    )
+
+    if errors:
+        raise RuntimeError(f"Ingest stage(s) failed: {', '.join(errors)}") from next(iter(errors.values()))
+    return report
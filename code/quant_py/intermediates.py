@@ -0,0 +1,87 @@
+# The file format of the combined intermediates, chosen per stage.
+#
+# The combined files (`combined_datasets/arrow/*_Combined_*`) are large, so disk throughput and space matter on
+# the TRE VM (the reference `Combined_all_sources` is a partitioned Parquet dataset, see `datasets.py`).
+# Each of the stages writing them (`FORMATTED_STAGES`) writes uncompressed Arrow IPC by default, or the format
+# set for it in `RunConfig.intermediate_formats`, e.g.
+#
+#   quant_py run ... --intermediate-format primary_care_combined=parquet-zstd:500000
+#
+# A format is `ipc`, `ipc-lz4`, `ipc-zstd` or `parquet-<compression>[:<row group size>]` (`parquet-zstd`,
+# `parquet-lz4`, `parquet-snappy`, `parquet-uncompressed`).  The file suffix follows the format (`.arrow` or
+# `.parquet`), and `scan_intermediate` reads either.  `quant_py benchmark formats` times each format on the
+# reference combo (see `benchmarks.py`).
+
+from dataclasses import dataclass
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+
+FORMATTED_STAGES = ["hes_apc", "primary_care_combined", "secondary_care_combined"]
+
+IPC_COMPRESSIONS = ["uncompressed", "lz4", "zstd"]
+PARQUET_COMPRESSIONS = ["uncompressed", "lz4", "snappy", "zstd"]
+
+
+@dataclass(frozen=True)
+class IntermediateFormat:
+    """An intermediate file format: `ipc` or `parquet`, its compression and (Parquet) row group size."""
+    format: str = "ipc"
+    compression: str = "uncompressed"
+    row_group_size: int | None = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "IntermediateFormat":
+        """The format described by `spec`, e.g. `ipc`, `ipc-zstd`, `parquet-zstd` or `parquet-zstd:500000`."""
+        name, _, row_group_size = spec.partition(":")
+        kind, _, compression = name.partition("-")
+        compressions = {"ipc": IPC_COMPRESSIONS, "parquet": PARQUET_COMPRESSIONS}.get(kind)
+        if compressions is None:
+            raise ValueError(f"{spec}: unknown format {kind!r} (expected ipc or parquet)")
+        compression = compression or ("uncompressed" if kind == "ipc" else "zstd")
+        if compression not in compressions:
+            raise ValueError(f"{spec}: unknown {kind} compression {compression!r} (expected one of {compressions})")
+        if row_group_size and kind != "parquet":
+            raise ValueError(f"{spec}: a row group size only applies to parquet")
+        return cls(kind, compression, int(row_group_size) if row_group_size else None)
+
+    def __str__(self) -> str:
+        spec = "ipc" if self == IntermediateFormat() else f"{self.format}-{self.compression}"
+        return f"{spec}:{self.row_group_size}" if self.row_group_size else spec
+
+    @property
+    def suffix(self) -> str:
+        return ".arrow" if self.format == "ipc" else ".parquet"
+
+
+def intermediate_format(config: RunConfig, stage: str) -> IntermediateFormat:
+    """The format of the intermediate written by `stage` (default: uncompressed IPC)."""
+    return IntermediateFormat.parse(dict(config.intermediate_formats).get(stage, "ipc"))
+
+
+def intermediate_path(config: RunConfig, stage: str, folder: AnyPath, name: str) -> AnyPath:
+    """`folder/name` with the suffix of `stage`'s format."""
+    return AnyPath(folder, f"{name}{intermediate_format(config, stage).suffix}")
+
+
+def sink_intermediate(lf: pl.LazyFrame, config: RunConfig, stage: str, path: AnyPath) -> None:
+    """`lf` written to `path` in `stage`'s format, through the TRE sink (telemetry, query plan capture)."""
+    file_format = intermediate_format(config, stage)
+    if file_format.format == "ipc":
+        lf.TRE.sink_ipc(path, compression=file_format.compression)
+    else:
+        lf.TRE.sink_parquet(
+            path,
+            compression=file_format.compression,
+            row_group_size=file_format.row_group_size,
+            statistics=True,
+        )
+
+
+def scan_intermediate(path: AnyPath) -> pl.LazyFrame:
+    """The intermediate (or glob of intermediates) at `path`, Arrow IPC or Parquet according to its suffix."""
+    if AnyPath(path).suffix == ".parquet":
+        return pl.scan_parquet(path)
+    return pl.scan_ipc(path)
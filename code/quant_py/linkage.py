@@ -0,0 +1,196 @@
+# Linkage to valid pseudoNHS numbers, demographics and genotyped/exome-sequenced volunteers.
+#
+# In quant_py, we now use the DvH's `2025_02_10__MegaLinkage_forTRE.csv` (TM).  There are approximately 1,000
+# rows excluded by the pseudoNHS validation.  Possible reasons:
+# 1. subject asked to be removed/withdrawn
+# 2. subject died
+# 3. subject had multiple pseudoNHS which have been merged
+
+import polars as pl
+
+from .config import RunConfig
+from .persons import encode_person_id
+
+
+def valid_pseudo_nhs_numbers(config: RunConfig) -> pl.LazyFrame:
+    """Distinct, non-null pseudoNHS numbers in the mega-linkage file."""
+    return (
+        pl.scan_csv(
+            config.mega_linkage_path,
+            infer_schema=False,
+        )
+        .rename({"pseudonhs_2024-07-10":"pseudo_nhs_number"})
+        .pipe(encode_person_id, config)
+        .select(
+            pl.col("person_id"),
+        )
+        .TRE
+        .filter_with_logging(
+            pl.col("person_id").is_not_null(),
+            label="person_id.is_not_null()"
+        )
+        .TRE
+        .unique_with_logging(
+            "person_id",
+        )
+    )
+
+
+def s1qst_dob_and_gender(config: RunConfig) -> pl.LazyFrame:
+    """DOBs (and gender) for all people who have a questionnaire (with an Oragene_ID)."""
+    return (
+        pl.scan_csv(
+            config.s1qst_path,
+            infer_schema=False
+        )
+        .select(
+            pl.col("S1QST_Oragene_ID"),
+            pl.col("S1QST_Gender"),
+            pl.col("S1QST_MM-YYYY_ofBirth"),
+        )
+        .TRE
+        .filter_with_logging(
+            pl.col("S1QST_MM-YYYY_ofBirth").ne("NA"),
+            label="EXCLUDING `NA` DATE"
+        )
+        .with_columns(
+            pl.concat_str(pl.lit("01-"), pl.col("S1QST_MM-YYYY_ofBirth")).str.to_date(format="%d-%m-%Y").alias("dob"),
+            pl.col("S1QST_Gender")
+                .replace_strict({"1":"M","2":"F"})
+                .cast(pl.Enum(["F","M"])).alias("gender"),
+        )
+        .with_columns(
+            pl.col("dob").dt.year().alias("year_of_birth")
+        )
+    #     .TRE
+    #     .unique_with_logging()
+        .TRE
+        .unique_with_logging(subset=["S1QST_Oragene_ID"])
+
+        .select(
+            pl.col("S1QST_Oragene_ID").alias("OrageneID"),
+            pl.col("dob"),
+            pl.col("gender")
+        )
+    #     .group_by("S1QST_Oragene_ID")
+    #     .agg(
+    #         pl.col("S1QST_MM-YYYY_ofBirth").n_unique().alias("MM-YYYY_ofBirth_count")
+    #     )
+    #     .sort("MM-YYYY_ofBirth_count")
+    )
+
+
+def valid_demographics(config: RunConfig) -> pl.LazyFrame:
+    """Valid pseudoNHS numbers with their OrageneID and, where known, questionnaire `dob` and `gender`."""
+    return (
+        pl.scan_csv(
+            config.mega_linkage_path,
+            infer_schema=False,
+        )
+        .rename({"pseudonhs_2024-07-10":"pseudo_nhs_number"})
+        .pipe(encode_person_id, config)
+        .select(
+            pl.col("person_id"),
+            pl.col("OrageneID")
+        )
+        .TRE
+        .filter_with_logging(
+            pl.col("person_id").is_not_null(),
+            label="person_id.is_not_null()"
+        )
+        .TRE
+        .unique_with_logging(
+            "person_id",
+        )
+        .TRE
+        .join_with_logging(
+            s1qst_dob_and_gender(config),
+            on="OrageneID",
+            how="left",
+            label="Add dob and gender columns"
+        )
+    )
+
+
+def valid_regenie_55k(config: RunConfig) -> pl.LazyFrame:
+    """Mega-linkage rows with an exome_id (and pseudoNHS number), for the 55k BroadExomeIDs regenie files."""
+    return (
+        pl.scan_csv(
+            config.mega_linkage_path,
+            infer_schema=False,
+            new_columns=[
+                "OrageneID",
+                "Number of OrageneIDs with this NHS number (i.e. taken part twice or more)",
+                "s1qst_gender",
+                "HasValidNHS",
+                "pseudo_nhs_number",
+                "gsa_id",
+                "44028exomes_release_2023-JUL-07",
+                "exome_id",
+            ]
+        )
+        .pipe(encode_person_id, config)
+        .TRE
+        .filter_with_logging(
+            pl.col("exome_id").is_not_null(),
+            pl.col("person_id").is_not_null(), # there are some rows with NON-NULL exome_id but NULL pseudo_nhs_number
+            label="Only include NON-NULL exome_id and NON-NULL pseudo_nhs_number for 55k Regenie"
+        )
+        .TRE
+        .filter_with_logging(
+            pl.col("OrageneID").is_not_null(),
+            label="Sanity check to ensure no NULL OrageneID. row count should remain unchanged"
+        )
+        .TRE
+        .unique_with_logging(
+            ["person_id"],
+            label="Sanity check: row count should remain unchanged when uniquing by person_id"
+        )
+        .TRE
+        .unique_with_logging(
+            ["OrageneID"],
+            label="Sanity check: row count should remain unchanged when uniquing by OrageneID"
+        )
+    )
+
+
+def valid_regenie_51k(config: RunConfig) -> pl.LazyFrame:
+    """Mega-linkage rows with a gsa_id (and pseudoNHS number), for the 51k GSA Topmed regenie files."""
+    return (
+        pl.scan_csv(
+            config.mega_linkage_path,
+            infer_schema=False,
+            new_columns=[
+                "OrageneID",
+                "Number of OrageneIDs with this NHS number (i.e. taken part twice or more)",
+                "s1qst_gender",
+                "HasValidNHS",
+                "pseudo_nhs_number",
+                "gsa_id",
+                "44028exomes_release_2023-JUL-07",
+                "exome_id",
+            ]
+        )
+        .pipe(encode_person_id, config)
+        .TRE
+        .filter_with_logging(
+            pl.col("gsa_id").is_not_null(),
+            pl.col("person_id").is_not_null(), # there are some rows with NON-NULL exome_id but NULL pseudo_nhs_number
+            label="Only include NON-NULL gsa_id and NON-NULL pseudo_nhs_number for 51k Regenie"
+        )
+        .TRE
+        .filter_with_logging(
+            pl.col("OrageneID").is_not_null(),
+            label="Sanity check to ensure no NULL OrageneID. row count should remain unchanged"
+        )
+        .TRE
+        .unique_with_logging(
+            ["person_id"],
+            label="Sanity check: row count should remain unchanged when uniquing by person_id"
+        )
+        .TRE
+        .unique_with_logging(
+            ["OrageneID"],
+            label="Sanity check: row count should remain unchanged when uniquing by OrageneID"
+        )
+    )
@@ -0,0 +1,69 @@
+# Looking up participants: the readings, trait readings and HES admission windows of a few persons, read through
+# the person indexes (see `person_index.py`) rather than by scanning the reference combo files, e.g. to debug
+# a participant's readings or to plot the admission windows of a few persons:
+#
+#   person = get_person(config, ["<pseudoNHS number>", ...])
+#   person.admission_windows
+#
+# The frames hold `person_id`, as the files they are read from (see `persons.py`): `decode_person_ids` restores
+# the pseudonyms.  A lookup only reads the person dictionary: a pseudonym not in it has no rows.
+
+from dataclasses import dataclass
+
+import polars as pl
+
+from .config import RunConfig
+from .hes import admission_windows, combined_hes_path
+from .person_index import read_persons
+from .persons import PERSON_ID_DTYPE, load_person_dictionary
+from .stages.combine import combined_all_sources_path
+from .stages.traits import pre_10d_windowing_path
+
+
+@dataclass(frozen=True)
+class Person:
+    """The rows of some persons in the reference combo files and their HES admission windows."""
+    readings: pl.DataFrame
+    trait_readings: pl.DataFrame
+    admission_windows: pl.DataFrame
+
+
+def person_ids(config: RunConfig, pseudo_nhs_numbers: list[str]) -> pl.DataFrame:
+    """
+    The `pseudo_nhs_number`s and `person_id`s of `pseudo_nhs_numbers` in the person dictionary (the pseudonyms not
+    in it are left out).
+    """
+    return (
+        load_person_dictionary(config)
+        .filter(pl.col("pseudo_nhs_number").is_in(pseudo_nhs_numbers))
+        .select("pseudo_nhs_number", "person_id")
+    )
+
+
+def get_person(config: RunConfig, ids: list[str]) -> Person:
+    """
+    The readings (`Combined_all_sources`), trait readings (`..._pre_10d_windowing`) and HES admission windows
+    (`hes_final_admission_windows`) of the persons with pseudoNHS numbers `ids`, read through the person indexes
+    of the files written by the run.  The admission windows are computed from the persons' HES episodes alone.
+    """
+    dictionary = person_ids(config, ids)
+    ids = dictionary.get_column("person_id").to_list()
+    episodes = read_persons(combined_hes_path(config), ids)
+    return Person(
+        readings=read_persons(combined_all_sources_path(config), ids),
+        trait_readings=read_persons(pre_10d_windowing_path(config), ids),
+        admission_windows=(
+            episodes.lazy()
+            # as `encode_person_id`, but without adding to the dictionary
+            .with_columns(
+                pl.col("pseudo_nhs_number").replace_strict(
+                    dictionary.get_column("pseudo_nhs_number"),
+                    dictionary.get_column("person_id"),
+                    return_dtype=PERSON_ID_DTYPE,
+                )
+            )
+            .rename({"pseudo_nhs_number": "person_id"})
+            .pipe(admission_windows)
+            .collect()
+        ),
+    )
@@ -0,0 +1,185 @@
+# Combining intermediates: a streaming k-way merge of files sorted by the fingerprint of their readings.
+#
+# Every ingest intermediate is written de-duplicated and sorted on the fingerprint (`hash`, `hash_low`, see
+# `hashing.py`), and so is every combined file, since each is the merge of such files.  Rather than a `unique`
+# over their union (a hash table holding all the distinct readings), `merged_sorted` reads each input file once,
+# sequentially, `BATCH_ROWS` rows at a time through a batched reader (the record batches of an Arrow IPC file,
+# or of the row groups of a Parquet file), and merges them:
+#
+#   - the bound is the smallest last fingerprint among the buffered batches of the inputs not read to the end
+#   - the rows up to the bound are taken from every buffer, sorted, and written without the rows equal to the
+#     one before them (the same reading from another input); an input's next rows all have greater fingerprints,
+#     so the duplicates of a row are all in the same chunk
+#   - the inputs whose buffer was taken up to its end read their next batch
+#
+# so that the memory held is that of one batch per input, whatever the size of the inputs.  An input whose
+# fingerprints are not strictly increasing (e.g. an intermediate of an earlier version) fails the merge.
+#
+# The merged chunks are written to `RunConfig.merge_spill_path` (in parts of at least `BATCH_ROWS` rows) and read
+# back, in order, as the plan written by the stage: the inputs are read outside the polars engine, which cannot
+# run inside a streaming sink (polars 1.31 hangs on a lazy source collecting file scans), e.g.
+#
+#     with merged(config, stage, *paths) as lf:
+#         lf.pipe(sink_intermediate, ...)
+#
+# `merged` casts the dictionary columns of every batch to their `Enum` (a few thousand categories), and replaces
+# the pseudonyms by person IDs once, in the plan read back: the person dictionary has millions of entries, and
+# mapping through it builds a hash table of them every time.
+
+import shutil
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from cloudpathlib import AnyPath
+
+from .columns import HASH_COLUMN_NAMES
+from .config import RunConfig
+from .dag import expand
+from .dictionary import dictionary_enums, encode_dictionary_columns
+from .intermediates import scan_intermediate
+from .persons import encode_person_id
+
+BATCH_ROWS = 250_000
+
+HIGH, LOW = (pl.col(name) for name in HASH_COLUMN_NAMES)
+
+
+def _at_most(high: int, low: int) -> pl.Expr:
+    return (HIGH < high) | ((HIGH == high) & (LOW <= low))
+
+
+def _is_increasing() -> pl.Expr:
+    return ((HIGH > HIGH.shift()) | ((HIGH == HIGH.shift()) & (LOW > LOW.shift()))).fill_null(True)
+
+
+def _last(df: pl.DataFrame) -> tuple[int, int]:
+    return df.get_column(HASH_COLUMN_NAMES[0])[-1], df.get_column(HASH_COLUMN_NAMES[1])[-1]
+
+
+def _record_batches(path: AnyPath, batch_rows: int) -> tuple[pa.Schema, Iterator[pa.RecordBatch]]:
+    """The schema and record batches, in order, of the Arrow IPC or Parquet file at `path`."""
+    if AnyPath(path).suffix == ".parquet":
+        reader = pq.ParquetFile(str(path))
+        return reader.schema_arrow, reader.iter_batches(batch_size=batch_rows)
+    reader = pa.ipc.open_file(pa.memory_map(str(path)))
+    return reader.schema, (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+
+class _Input:
+    """One sorted input file of the merge, read `batch_rows` rows at a time (each batch `transform`ed)."""
+
+    def __init__(
+        self,
+        path: AnyPath,
+        name: str,
+        batch_rows: int,
+        transform: Callable[[pl.DataFrame], pl.DataFrame],
+    ) -> None:
+        self.name, self.batch_rows, self.transform = name, batch_rows, transform
+        schema, self.record_batches = _record_batches(path, batch_rows)
+        self.buffer = transform(pl.from_arrow(schema.empty_table()))
+        # the rows read beyond the buffered batch
+        self.pending = self.buffer
+        self.exhausted = False
+        self.last = None
+
+    @property
+    def is_read(self) -> bool:
+        return self.exhausted and self.pending.is_empty()
+
+    def read(self) -> None:
+        """The next batch into the (empty) buffer, the record batches cut or joined to `batch_rows` rows."""
+        while self.pending.height < self.batch_rows and not self.exhausted:
+            record_batch = next(self.record_batches, None)
+            if record_batch is None:
+                self.exhausted = True
+            else:
+                self.pending = pl.concat([self.pending, self.transform(pl.from_arrow(record_batch))])
+        batch, self.pending = self.pending.head(self.batch_rows), self.pending.slice(self.batch_rows)
+        if batch.is_empty():
+            return
+        if not batch.select(_is_increasing().all()).item() or (
+            self.last is not None and not batch.head(1).select(~_at_most(*self.last)).item()
+        ):
+            raise ValueError(f"{self.name}: not sorted and de-duplicated on {HASH_COLUMN_NAMES}, cannot be merged")
+        self.buffer = batch
+        self.last = _last(batch)
+
+    def take(self, bound: tuple[int, int] | None) -> pl.DataFrame:
+        """The buffered rows up to `bound` (all of them if None), removed from the buffer."""
+        rows = self.buffer.height if bound is None else self.buffer.select(_at_most(*bound).sum()).item()
+        taken, self.buffer = self.buffer.head(rows), self.buffer.slice(rows)
+        return taken
+
+
+def _merged_chunks(inputs: list[_Input]) -> Iterator[pl.DataFrame]:
+    while True:
+        for source in inputs:
+            if source.buffer.is_empty() and not source.is_read:
+                source.read()
+        buffered = [source for source in inputs if not source.buffer.is_empty()]
+        if not buffered:
+            return
+        unread = [_last(source.buffer) for source in buffered if not source.is_read]
+        bound = min(unread) if unread else None
+        chunk = pl.concat([source.take(bound) for source in buffered]).sort(HASH_COLUMN_NAMES)
+        yield chunk.filter(_is_increasing())
+
+
+@contextmanager
+def merged_sorted(
+    paths: list[AnyPath],
+    spill_path: AnyPath,
+    names: list[str] | None = None,
+    batch_rows: int = BATCH_ROWS,
+    transform: Callable[[pl.DataFrame], pl.DataFrame] | None = None,
+) -> Iterator[pl.LazyFrame]:
+    """
+    The rows of the Arrow IPC or Parquet files at `paths`, each sorted and de-duplicated on the fingerprint, merged
+    into one sorted and de-duplicated plan (see the module notes), spilled to `spill_path`, which is removed on
+    exit.  Every batch read is `transform`ed first, and `names` (default: the paths) name the inputs in errors.
+    """
+    if not paths:
+        raise ValueError("no inputs to merge")
+    names = names or [str(path) for path in paths]
+    transform = transform or (lambda batch: batch)
+    spill_path = AnyPath(spill_path)
+    if spill_path.exists():
+        # the chunks of an interrupted run
+        shutil.rmtree(spill_path)
+    spill_path.mkdir(parents=True)
+    try:
+        inputs = [_Input(path, name, batch_rows, transform) for path, name in zip(paths, names)]
+        parts, pending = 0, []
+        for chunk in _merged_chunks(inputs):
+            pending.append(chunk)
+            if sum(part.height for part in pending) >= batch_rows:
+                pl.concat(pending).write_ipc(AnyPath(spill_path, f"{parts:06d}.arrow"))
+                parts, pending = parts + 1, []
+        if pending or not parts:
+            pl.concat(pending or [inputs[0].buffer]).write_ipc(AnyPath(spill_path, f"{parts:06d}.arrow"))
+        # the parts are scanned in the order of their (zero-padded) names
+        yield pl.scan_ipc(AnyPath(spill_path, "*.arrow"))
+    finally:
+        shutil.rmtree(spill_path, ignore_errors=True)
+
+
+@contextmanager
+def merged(config: RunConfig, stage: str, *paths: AnyPath) -> Iterator[pl.LazyFrame]:
+    """
+    The files matching `paths` (which may contain glob wildcards) merged on the fingerprint, encoded as by
+    `dictionary.scan_encoded`, spilled to `stage`'s folder of `RunConfig.merge_spill_path`.
+    """
+    files = sorted({str(file): file for path in paths for file in expand(path)}.values(), key=str)
+    if not files:
+        raise FileNotFoundError(f"No files match {[str(path) for path in paths]}")
+    enums = dictionary_enums(config, [scan_intermediate(file) for file in files])
+    with merged_sorted(
+        files,
+        AnyPath(config.merge_spill_path, stage),
+        transform=lambda batch: encode_dictionary_columns(batch, enums),
+    ) as lf:
+        yield lf.pipe(encode_person_id, config)
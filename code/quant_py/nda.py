@@ -0,0 +1,205 @@
+# The NHS England National Diabetes Audit (NDA) pulls: every table of a pull read into one arrow file.
+#
+# A pull (declared in `provenances/nda.toml`) is a folder of pipe-separated tables, `NIC338864_NDA_{table}.txt`,
+# one per measure (`BMI`, `CHOL`, `HBA1C`, `BP`, ...).  Its spec maps each table to readings:
+#
+#   date          the date column (parsed with the pull's `date_formats`, see `dates.py`)
+#   values        [{ column, original_term, units }, ...]: each value column gives one reading per row, e.g.
+#                 the diastolic and systolic values of the `BP` table
+#   complete      rows missing any of the values are dropped (default: only the missing values are)
+#
+# `nda_plan` unpivots every table to the target columns and concatenates them into one plan, so that the tables
+# are scanned concurrently by the streaming engine in a single pass.  The pull's `person_column`, `separator` and
+# `ignore` (tables which hold no readings) apply to all its tables; a file of the pull matching no table (and
+# not ignored) is an error.
+#
+# With `RunConfig.quarantine_rejected_rows`, the rows dropped for missing values are written to
+# `data/quarantine/{pull}.parquet` (see `quarantine.py`).
+
+import re
+import sys
+from contextlib import nullcontext
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from . import columns, dates, hashing
+from .columns import CATEGORICAL_TARGET_COLUMNS, HASH_COLUMN_NAMES, TARGET_OUTPUT_COLUMNS_WITH_HASH
+from .config import RunConfig
+from .dag import expand
+from .dates import date_format_labels, parse_dates
+from .fingerprints import reuse_or_build
+from .hashing import with_hash
+from .quarantine import FILE_COLUMN, LINE_COLUMN, Quarantine
+from .sources import ALL_PROVENANCE_OPTIONS, ALL_SOURCE_OPTIONS
+from .tre import TREAudit
+
+NDA_TABLE_PATTERN = re.compile(r"_NDA_(?P<table>[^.]+)\.txt$")
+
+# The modules turning the NDA files into the arrow file, for `fingerprints.code_version`
+NDA_CODE_MODULES = [sys.modules[__name__], columns, dates, hashing]
+
+
+def nda_raw_files_pattern(config: RunConfig, spec: dict) -> AnyPath:
+    return AnyPath(config.nhse_data_path, spec["path"])
+
+
+def nda_arrow_path(config: RunConfig, spec: dict) -> AnyPath:
+    return AnyPath(config.nda_arrow_path, f"{spec['key']}.arrow")
+
+
+def nda_quarantine_path(config: RunConfig, spec: dict) -> AnyPath:
+    return AnyPath(config.quarantine_path, f"{spec['key']}.parquet")
+
+
+def nda_tables(files: list[AnyPath], spec: dict) -> dict[str, AnyPath]:
+    """The file of each table of pull `spec` among its raw `files`."""
+    found = {}
+    for file in files:
+        match = NDA_TABLE_PATTERN.search(AnyPath(file).name)
+        if match is None:
+            raise ValueError(f"{spec['key']}: {file} is not an NDA table file")
+        found[match["table"]] = file
+
+    unmapped = sorted(set(found) - set(spec["tables"]) - set(spec.get("ignore", [])))
+    if unmapped:
+        raise ValueError(f"{spec['key']}: no mapping for the NDA tables {unmapped} (add them to provenances/nda.toml)")
+    missing = sorted(set(spec["tables"]) - set(found))
+    if missing:
+        raise FileNotFoundError(f"{spec['key']}: no files for the NDA tables {missing}")
+    return {table: found[table] for table in spec["tables"]}
+
+
+def nda_table_plan(file: AnyPath, table: str, spec: dict) -> pl.LazyFrame:
+    """The readings of one `table` of pull `spec`, read from `file`, in the target columns."""
+    table_spec = spec["tables"][table]
+    values = table_spec["values"]
+    value_columns = [value["column"] for value in values]
+    quarantined = Quarantine.is_active()
+
+    lf = (
+        pl.scan_csv(
+            file,
+            separator=spec["separator"],
+            infer_schema=False,
+            # the values are parsed by the CSV reader; the other columns are read as strings
+            schema_overrides={column: pl.Float64 for column in value_columns},
+            row_index_name=LINE_COLUMN if quarantined else None,
+        )
+        .select(
+            pl.col(spec["person_column"]).alias("pseudo_nhs_number"),
+            pl.col(table_spec["date"]).alias("test_date"),
+            *value_columns,
+            *((pl.lit(str(file)).alias(FILE_COLUMN), pl.col(LINE_COLUMN).cast(pl.UInt64) + 2) if quarantined else ()),
+        )
+    )
+
+    has_values = (pl.all_horizontal if table_spec.get("complete") else pl.any_horizontal)(
+        pl.col(value_columns).is_not_null()
+    )
+    lf = Quarantine.reject(
+        lf,
+        has_values,
+        rule_id=f"nda.{table}/missing_value",
+        # the values, e.g. `|120` for a BP reading without its diastolic value
+        result=(
+            pl.concat_str(pl.col(value_columns).cast(pl.Utf8).fill_null(""), separator="|")
+            if len(value_columns) > 1 else pl.col(value_columns[0]).cast(pl.Utf8)
+        ),
+    )
+    lf = lf.filter(has_values)
+
+    formats = spec["date_formats"]
+    return (
+        lf
+        .pipe(parse_dates, ["test_date"], formats, strict=True)
+        .TRE
+        .count_with_logging(
+            "_date_format",
+            date_format_labels(["test_date"], formats),
+            label=f"{table} test_date formats",
+        )
+        .unpivot(
+            on=value_columns,
+            index=["pseudo_nhs_number", "test_date", *((FILE_COLUMN, LINE_COLUMN) if quarantined else ())],
+            variable_name="_value_column",
+            value_name="result",
+        )
+        # the missing values of incomplete rows
+        .filter(pl.col("result").is_not_null())
+        .with_columns(
+            pl.col("_value_column").replace_strict(
+                value_columns, [value["original_term"] for value in values], return_dtype=pl.Utf8
+            ).alias("original_term"),
+            pl.col("_value_column").replace_strict(
+                value_columns, [value["units"] for value in values], return_dtype=pl.Utf8
+            ).alias("result_value_units"),
+        )
+        .select("pseudo_nhs_number", "test_date", "original_term", "result", "result_value_units")
+    )
+
+
+def nda_plan(files: list[AnyPath], spec: dict) -> pl.LazyFrame:
+    """The lazy plan reading every table of pull `spec` from its raw `files` into the target output columns."""
+    return (
+        pl.concat(
+            [nda_table_plan(file, table, spec) for table, file in nda_tables(files, spec).items()],
+            how="vertical",
+        )
+        .with_columns(
+            provenance=pl.lit(spec["key"], pl.Enum(ALL_PROVENANCE_OPTIONS)),
+            source=pl.lit(spec["source"], pl.Enum(ALL_SOURCE_OPTIONS)),
+        )
+        .pipe(with_hash)
+        .unique(subset=HASH_COLUMN_NAMES)
+        # for the combine stages to merge (see `merge.py`)
+        .sort(HASH_COLUMN_NAMES)
+        .select(
+            TARGET_OUTPUT_COLUMNS_WITH_HASH
+        )
+        .with_columns(
+            CATEGORICAL_TARGET_COLUMNS,
+        )
+    )
+
+
+def sink_nda(config: RunConfig, spec: dict) -> None:
+    """
+    Reads every table of NDA pull `spec` (in place from the NHS England sublicence) to its arrow file, unless its
+    files, spec and code are those of an earlier run (see `fingerprints.py`).
+    """
+    files = expand(nda_raw_files_pattern(config, spec))
+    if not files:
+        raise FileNotFoundError(f"{spec['key']}: no files match {nda_raw_files_pattern(config, spec)}")
+
+    def build() -> None:
+        with (
+            TREAudit(spec["key"]) as audit,
+            Quarantine(spec["key"]) if config.quarantine_rejected_rows else nullcontext() as quarantine,
+        ):
+            (
+                nda_plan(files, spec)
+                .TRE
+                .sink_ipc(
+                    nda_arrow_path(config, spec),
+                    side_sinks=(
+                        {nda_quarantine_path(config, spec): quarantine.sink(nda_quarantine_path(config, spec))}
+                        if quarantine is not None else None
+                    ),
+                )
+            )
+        audit.write(AnyPath(config.logs_path, f"{config.yr}_{config.mon}_{spec['key']}_row_count_audit.parquet"))
+
+    if config.quarantine_rejected_rows:
+        # an earlier run's arrow file comes without the rejected rows
+        build()
+        return
+    reuse_or_build(
+        config,
+        spec["key"],
+        files,
+        nda_arrow_path(config, spec),
+        build,
+        spec=spec,
+        code_modules=NDA_CODE_MODULES,
+    )
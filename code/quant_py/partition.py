@@ -0,0 +1,172 @@
+# Ragged delimited files: counting and splitting their lines by number of fields.
+#
+# Some raw extracts (e.g. the Barts 2023_12 and 2024_09 `.tab` files) have a few lines with more or fewer fields
+# than the header.  `field_counts` gives the number of lines per number of separators (the "buckets"), and
+# `partition_by_field_count` writes one file per bucket with a manifest of the bucket row counts, e.g. to
+# inspect the raggedness of a new extract:
+#
+#   quant_py partition .../GandH_Measurements__20240423.ascii.redacted2.tab
+#
+# The pipeline does not need the bucket files: `keep_number_of_separators` (see `provenance.py`) reads the
+# dominant bucket straight from the raw file.
+#
+# The file is cut into byte ranges at line boundaries and the ranges are processed in parallel threads (the
+# polars reader releases the GIL).  Every bucket is written to a temporary file and renamed into place once
+# complete, and the buckets of an earlier run are replaced, so re-running gives the same files.
+
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import polars as pl
+
+# Single-column read of a delimited file: one row per line (no quoting, and a separator not in the data)
+LINE_SCAN = {"has_header": False, "separator": "\x00", "quote_char": None, "new_columns": ["line"], "infer_schema": False}
+
+DEFAULT_CHUNK_BYTES = 64 * 2**20
+
+
+def line_ranges(file: Path, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> tuple[bytes, list[tuple[int, int]]]:
+    """The header line of `file` and the `(start, end)` byte ranges of about `chunk_bytes` of whole lines after it."""
+    with open(file, "rb") as raw:
+        header = raw.readline()
+        size = os.fstat(raw.fileno()).st_size
+        ranges = []
+        start = raw.tell()
+        while start < size:
+            raw.seek(min(start + chunk_bytes, size))
+            raw.readline() # on to the end of the line
+            end = min(raw.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+def _lines(file: Path, start: int, end: int, separator: str) -> pl.DataFrame:
+    """The non-empty lines in `file[start:end]` with their number of `separator`s."""
+    with open(file, "rb") as raw:
+        raw.seek(start)
+        data = raw.read(end - start)
+    return (
+        pl.read_csv(io.BytesIO(data), **LINE_SCAN)
+        .filter(pl.col("line").is_not_null())
+        .with_columns(separators=pl.col("line").str.count_matches(separator, literal=True))
+    )
+
+
+def _count_chunk(file: Path, start: int, end: int, separator: str) -> pl.DataFrame:
+    return _lines(file, start, end, separator).group_by("separators").agg(rows=pl.len())
+
+
+def _partition_chunk(file: Path, start: int, end: int, separator: str, parts_path: Path, index: int) -> pl.DataFrame:
+    lines = _lines(file, start, end, separator)
+    for (separators, ), bucket in lines.group_by("separators"):
+        bucket.select("line").write_csv(
+            parts_path / f"{separators}.{index:06d}",
+            include_header=False,
+            quote_style="never",
+        )
+    return lines.group_by("separators").agg(rows=pl.len())
+
+
+def _manifest(chunk_counts: list[pl.DataFrame]) -> pl.DataFrame:
+    return (
+        pl.concat(chunk_counts)
+        .group_by("separators")
+        .agg(pl.col("rows").sum().cast(pl.UInt64))
+        .with_columns(
+            fields=pl.col("separators") + 1,
+            share=pl.col("rows") / pl.col("rows").sum(),
+        )
+        .sort("separators")
+        .select("separators", "fields", "rows", "share")
+    )
+
+
+def field_counts(
+    file: Path | str,
+    separator: str = "\t",
+    workers: int | None = None,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> pl.DataFrame:
+    """The number of lines (after the header) of `file` per number of separators, without writing anything."""
+    file = Path(file)
+    _, ranges = line_ranges(file, chunk_bytes)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        chunk_counts = list(executor.map(lambda r: _count_chunk(file, *r, separator), ranges))
+    return _manifest(chunk_counts)
+
+
+def dominant_number_of_separators(counts: pl.DataFrame) -> int:
+    """The most common number of separators in `counts` (from `field_counts`, or a partition manifest)."""
+    if counts.is_empty():
+        raise ValueError("No lines after the header")
+    return counts.sort("rows", descending=True)["separators"][0]
+
+
+def bucket_path(file: Path, separators: int | str, separator: str = "\t", output_path: Path | None = None) -> Path:
+    """`dir/name.ext` -> `output_path/name_tab{separators}.ext` (`_sep{separators}` for other separators)."""
+    marker = "tab" if separator == "\t" else "sep"
+    return Path(output_path or file.parent, f"{file.stem}_{marker}{separators}{file.suffix}")
+
+
+def partition_by_field_count(
+    file: Path | str,
+    separator: str = "\t",
+    output_path: Path | str | None = None,
+    workers: int | None = None,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> pl.DataFrame:
+    """
+    Splits `file` into one file per number of separators per line (see `bucket_path`), each starting with the
+    header line, and returns the manifest: the `separators`, `fields`, `rows` (excluding the header), `share`
+    of the lines and `path` of every bucket.  The manifest is also written as `{stem}_partitions.parquet`.
+
+    Empty lines are dropped.  Buckets from an earlier run of the same file are replaced (or removed), and
+    every file is renamed into place only once complete.
+    """
+    file = Path(file)
+    output_path = Path(output_path or file.parent)
+    output_path.mkdir(parents=True, exist_ok=True)
+    header, ranges = line_ranges(file, chunk_bytes)
+
+    with tempfile.TemporaryDirectory(dir=output_path, prefix=f".{file.stem}_parts_") as parts_path:
+        parts_path = Path(parts_path)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunk_counts = list(
+                executor.map(
+                    lambda index: _partition_chunk(file, *ranges[index], separator, parts_path, index),
+                    range(len(ranges)),
+                )
+            )
+        manifest = _manifest(chunk_counts).with_columns(
+            path=pl.col("separators").map_elements(
+                lambda separators: str(bucket_path(file, separators, separator, output_path)),
+                return_dtype=pl.Utf8,
+            )
+        )
+
+        for separators, path in manifest.select("separators", "path").iter_rows():
+            temporary_path = Path(parts_path, f"{separators}.bucket")
+            with open(temporary_path, "wb") as bucket:
+                bucket.write(header)
+                # in file order, since the chunks are
+                for part in sorted(parts_path.glob(f"{separators}.[0-9]*")):
+                    with open(part, "rb") as lines:
+                        shutil.copyfileobj(lines, bucket)
+            os.replace(temporary_path, path)
+
+    # Buckets of an earlier run with numbers of separators no longer present
+    bucket_paths = set(manifest["path"])
+    for previous_bucket in output_path.glob(bucket_path(file, "[0-9]*", separator).name):
+        if str(previous_bucket) not in bucket_paths:
+            previous_bucket.unlink()
+
+    manifest_path = Path(output_path, f"{file.stem}_partitions.parquet")
+    temporary_manifest_path = Path(output_path, f".{manifest_path.name}.tmp")
+    manifest.write_parquet(temporary_manifest_path)
+    os.replace(temporary_manifest_path, manifest_path)
+    return manifest
@@ -0,0 +1,103 @@
+# The person index of the files sorted by person: where the rows of each person are, so that the rows of a few
+# persons are read without scanning the whole file.
+#
+# The files of the reference combo datasets are sorted by person (see `datasets.py`), and so is `Combined_HES`
+# (by pseudonym).  When one is written, `write_person_index` records the run of rows of each person in each of
+# its files, next to it in `{name}.person_index.parquet`:
+#
+#   person_id   file                                                                  offset   rows
+#   1234        2025_10_Combined_all_sources/source=.../provenance=.../0.parquet     120000   37
+#
+# sorted by person, with `file` relative to the index's folder.  `read_persons` looks the persons up in the index
+# (its row groups pruned on their statistics) and reads only their slices of the files (the slice is pushed down
+# to the Parquet row groups or Arrow IPC record batches holding it).  See `lookup.get_person`.
+
+import os
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from .intermediates import scan_intermediate
+from .persons import PERSON_ID_DTYPE
+
+PERSON_INDEX_SCHEMA = {
+    "person_id": PERSON_ID_DTYPE,
+    "file": pl.Utf8,
+    "offset": pl.UInt64,
+    "rows": pl.UInt64,
+}
+
+
+def person_index_path(path: AnyPath) -> AnyPath:
+    """The person index of the file or dataset at `path`."""
+    path = AnyPath(path)
+    return AnyPath(path.parent, f"{path.stem}.person_index.parquet")
+
+
+def _runs(lf: pl.LazyFrame, file: str) -> pl.LazyFrame:
+    """The first row and number of rows of each person in `lf` (with person IDs), the rows of `file`."""
+    return (
+        lf
+        .select("person_id")
+        .with_row_index("offset")
+        .filter(pl.col("person_id").is_not_null())
+        .group_by("person_id")
+        .agg(
+            pl.col("offset").min(),
+            pl.len().alias("rows"),
+            pl.col("offset").max().alias("last"),
+        )
+        .with_columns(file=pl.lit(file))
+    )
+
+
+def write_person_index(path: AnyPath, scans: dict[AnyPath, pl.LazyFrame]) -> None:
+    """
+    Writes the person index of the file or dataset at `path`, whose files are the keys of `scans`, each scanned
+    with its `person_id` column (see `persons.py`).  The rows of a person have to be contiguous in each file.
+    """
+    index_path = person_index_path(path)
+    folder = index_path.parent
+    runs = pl.concat(
+        [_runs(lf, os.path.relpath(str(file), str(folder))) for file, lf in scans.items()]
+    ).collect(engine="streaming")
+    scattered = runs.filter(pl.col("last") - pl.col("offset") + 1 != pl.col("rows"))
+    if not scattered.is_empty():
+        raise ValueError(
+            f"{path}: the rows of {scattered.height} person(s) are not contiguous in "
+            f"{sorted(scattered.get_column('file').unique())} (the files have to be sorted by person)"
+        )
+    temporary_path = AnyPath(folder, f".{index_path.name}.tmp")
+    (
+        runs
+        .select(pl.col(name).cast(dtype) for name, dtype in PERSON_INDEX_SCHEMA.items())
+        .sort("person_id", "file", "offset")
+        .write_parquet(temporary_path, statistics=True)
+    )
+    os.replace(temporary_path, index_path)
+
+
+def read_persons(path: AnyPath, person_ids: list[int]) -> pl.DataFrame:
+    """The rows of the persons `person_ids` in the file or dataset at `path`, read through its person index."""
+    index_path = person_index_path(path)
+    if not index_path.exists():
+        raise FileNotFoundError(f"{index_path}: no person index (is {path} written?)")
+    index = pl.scan_parquet(index_path)
+    runs = (
+        index
+        .filter(pl.col("person_id").is_in(pl.Series(person_ids, dtype=PERSON_ID_DTYPE)))
+        .sort("file", "offset")
+        .collect()
+    )
+    if runs.is_empty():
+        # the columns of the indexed files
+        files = index.select("file").head(1).collect().get_column("file")
+        if files.is_empty():
+            return pl.DataFrame()
+        return scan_intermediate(AnyPath(index_path.parent, files[0])).clear().collect()
+    return pl.concat(
+        [
+            scan_intermediate(AnyPath(index_path.parent, file)).slice(offset, rows)
+            for file, offset, rows in runs.select("file", "offset", "rows").iter_rows()
+        ]
+    ).collect()
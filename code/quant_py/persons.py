@@ -0,0 +1,166 @@
+# The persistent person-ID dictionary: each pseudoNHS number mapped to a dense `UInt32` person ID.
+#
+# `pseudo_nhs_number` is a long string, and it is in every hash, de-duplication, join (HES admission windows,
+# valid pseudoNHS numbers, demographics, regenie IDs) and group_by after the ingest.  From the combine stages on
+# (the `*_combined.arrow` files and everything derived from them, including the reference combo files and their
+# person indexes), the HES admission windows and the linkage tables, the pseudonym is replaced by the `person_id`
+# column, so that `pseudo_nhs_number` always holds a pseudonym:
+#
+#   - ingest intermediates (`{provenance_key}.arrow`, the NDA file) and `Combined_HES.arrow`: `pseudo_nhs_number`
+#   - combined files, read with `dictionary.scan_encoded`, and `hes_final_admission_windows`: `person_id`
+#   - linkage tables (`linkage.py`): `person_id`
+#   - exported CSV files (`stages/outputs.py`): `pseudo_nhs_number` again, restored with `decode_person_ids`
+#
+# The dictionary is kept in `QUANT_PY/person_dictionary/person_ids.arrow`, shared by all pipeline versions.  It is
+# created from the mega-linkage file (the valid volunteers have the first IDs) and is append-only: pseudonyms not
+# in it yet (e.g. of readings of people not in the mega-linkage file) are added after the last ID, as a new
+# version, so the ID of a pseudonym never changes.  The versions are listed in `versions.json`.
+
+import datetime
+import json
+import os
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+
+PERSON_ID_DTYPE = pl.UInt32
+
+PERSON_DICTIONARY_SCHEMA = {
+    "pseudo_nhs_number": pl.Utf8,
+    "person_id": PERSON_ID_DTYPE,
+    "version": pl.UInt32,
+}
+
+
+def person_dictionary_file(config: RunConfig) -> AnyPath:
+    return AnyPath(config.person_dictionary_path, "person_ids.arrow")
+
+
+def _versions_file(config: RunConfig) -> AnyPath:
+    return AnyPath(config.person_dictionary_path, "versions.json")
+
+
+def load_person_dictionary(config: RunConfig) -> pl.DataFrame:
+    """The pseudonyms, their `person_id`s (in order, from 0) and the `version` which added them."""
+    path = person_dictionary_file(config)
+    if not path.exists():
+        return pl.DataFrame(schema=PERSON_DICTIONARY_SCHEMA)
+    return pl.read_ipc(path, memory_map=False)
+
+
+def _mega_linkage_pseudo_nhs_numbers(config: RunConfig) -> pl.Series:
+    return (
+        pl.scan_csv(config.mega_linkage_path, infer_schema=False)
+        .select(pl.col("pseudonhs_2024-07-10").alias("pseudo_nhs_number"))
+        .collect()
+        .to_series()
+    )
+
+
+def _append(config: RunConfig, dictionary: pl.DataFrame, pseudo_nhs_numbers: pl.Series) -> pl.DataFrame:
+    """`dictionary` with the (sorted) `pseudo_nhs_numbers` not in it yet added as a new version, saved."""
+    new_pseudo_nhs_numbers = (
+        pseudo_nhs_numbers
+        .rename("pseudo_nhs_number")
+        .drop_nulls()
+        .unique()
+        .to_frame()
+        .join(dictionary, on="pseudo_nhs_number", how="anti")
+        .get_column("pseudo_nhs_number")
+        .sort()
+    )
+    if new_pseudo_nhs_numbers.is_empty():
+        return dictionary
+    size = dictionary.height + new_pseudo_nhs_numbers.len()
+    if size > 2**32:
+        raise OverflowError(f"{size:,} pseudoNHS numbers do not fit in {PERSON_ID_DTYPE} person IDs")
+
+    versions = json.loads(_versions_file(config).read_text()) if _versions_file(config).exists() else []
+    version = len(versions) + 1
+    dictionary = pl.concat([
+        dictionary,
+        pl.DataFrame(
+            {
+                "pseudo_nhs_number": new_pseudo_nhs_numbers,
+                "person_id": pl.int_range(dictionary.height, size, dtype=PERSON_ID_DTYPE, eager=True),
+                "version": pl.repeat(version, new_pseudo_nhs_numbers.len(), dtype=pl.UInt32, eager=True),
+            },
+            schema=PERSON_DICTIONARY_SCHEMA,
+        ),
+    ])
+
+    path = person_dictionary_file(config)
+    temporary_path = AnyPath(path.parent, f".{path.name}.tmp")
+    dictionary.write_ipc(temporary_path, compression="zstd")
+    os.replace(temporary_path, path)
+    versions.append({
+        "version": version,
+        "size": size,
+        "pipeline_version": config.version_folder_name,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    })
+    _versions_file(config).write_text(json.dumps(versions, indent=2))
+    return dictionary
+
+
+def update_person_dictionary(config: RunConfig, pseudo_nhs_numbers: pl.Series) -> pl.DataFrame:
+    """
+    The person dictionary with `pseudo_nhs_numbers` added if they are not in it yet.  A new dictionary is first
+    created from the mega-linkage file.
+    """
+    dictionary = load_person_dictionary(config)
+    if dictionary.is_empty():
+        dictionary = _append(config, dictionary, _mega_linkage_pseudo_nhs_numbers(config))
+    return _append(config, dictionary, pseudo_nhs_numbers)
+
+
+def encode_person_ids(config: RunConfig, lfs: list[pl.LazyFrame]) -> list[pl.LazyFrame]:
+    """
+    `lfs` with their string `pseudo_nhs_number` column replaced by the `person_id` column (frames already encoded
+    are returned as they are), the dictionary first updated with their pseudonyms.
+    """
+    to_encode = ["pseudo_nhs_number" in lf.collect_schema() for lf in lfs]
+    if not any(to_encode):
+        return lfs
+    dictionary = update_person_dictionary(
+        config,
+        pl.concat([
+            lf.select(pl.col("pseudo_nhs_number").unique())
+            for lf, encode in zip(lfs, to_encode)
+            if encode
+        ])
+        .collect(engine="streaming")
+        .to_series(),
+    )
+    person_id = pl.col("pseudo_nhs_number").replace_strict(
+        dictionary.get_column("pseudo_nhs_number"),
+        dictionary.get_column("person_id"),
+        return_dtype=PERSON_ID_DTYPE,
+    )
+    return [
+        lf.with_columns(person_id).rename({"pseudo_nhs_number": "person_id"}) if encode else lf
+        for lf, encode in zip(lfs, to_encode)
+    ]
+
+
+def encode_person_id(lf: pl.LazyFrame, config: RunConfig) -> pl.LazyFrame:
+    """`lf` with its string `pseudo_nhs_number` column replaced by the `person_id` column, see `encode_person_ids`."""
+    return encode_person_ids(config, [lf])[0]
+
+
+def decode_person_ids(lf: pl.LazyFrame, config: RunConfig) -> pl.LazyFrame:
+    """`lf` with its `person_id` column replaced by the `pseudo_nhs_number` column of the pseudonyms, for exports."""
+    dictionary = load_person_dictionary(config)
+    return (
+        lf
+        .with_columns(
+            pl.col("person_id").replace_strict(
+                dictionary.get_column("person_id"),
+                dictionary.get_column("pseudo_nhs_number"),
+                return_dtype=pl.Utf8,
+            )
+        )
+        .rename({"person_id": "pseudo_nhs_number"})
+    )
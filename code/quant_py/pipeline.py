@@ -0,0 +1,189 @@
+# Running (a selection of) the pipeline stages in dependency order, skipping those whose outputs are up to date.
+#
+# A stage is re-run when it is forced, when one of its outputs is missing, or when the files it reads changed
+# (path, size or modification time) since it last completed.  For the ingest stages, so does a change to their
+# spec or code (their `signature`, see `dag.Stage`).  The input signatures of completed stages are kept in
+# `logs/stage_state.json`.  Since a re-run stage re-writes its outputs, everything downstream of it is then re-run
+# too.
+#
+# With an ingest RAM budget, the provenance ingest stages which have to run are run together in a process pool
+# (see `ingest.py`) before the first other stage which has to run.
+#
+# An ingest stage which does run still copies the arrow file of an earlier run (of any version) if its raw
+# files, spec and code are unchanged (see `fingerprints.py`), unless forced.
+
+import dataclasses
+import datetime
+import json
+
+from cloudpathlib import AnyPath
+
+from . import stages as _stages # noqa: F401 (registers the stages)
+from .config import RunConfig
+from .dag import STAGES, execution_order, expand, upstream_stages
+from .ingest import INGEST_SPECS, parallel_ingest
+from .tre import TREStage
+
+
+def state_path(config: RunConfig) -> AnyPath:
+    return AnyPath(config.logs_path, "stage_state.json")
+
+
+def load_state(config: RunConfig) -> dict:
+    path = state_path(config)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_state(config: RunConfig, state: dict) -> None:
+    state_path(config).write_text(json.dumps(state, indent=2, sort_keys=True))
+
+
+def input_signature(config: RunConfig, name: str) -> list[list]:
+    """
+    `[path, size, mtime_ns]` of every existing file matching the inputs of stage `name`, followed by the
+    entries of the stage's own `signature`, if any.
+    """
+    signature = []
+    for pattern in STAGES[name].inputs(config):
+        for path in expand(pattern):
+            stat = path.stat()
+            signature.append([str(path), stat.st_size, getattr(stat, "st_mtime_ns", int(stat.st_mtime * 1e9))])
+    extra = STAGES[name].signature
+    return sorted(signature) + ([] if extra is None else extra(config))
+
+
+def stale_reason(config: RunConfig, name: str, state: dict) -> str | None:
+    """Why stage `name` has to run, or `None` if its outputs are up to date."""
+    missing_outputs = [str(path) for path in STAGES[name].outputs(config) if not expand(path)]
+    if missing_outputs:
+        return f"missing output(s): {', '.join(missing_outputs)}"
+    if name not in state:
+        return "no record of a completed run"
+    if state[name]["inputs"] != input_signature(config, name):
+        return "input(s), spec or code changed"
+    return None
+
+
+def configure_telemetry(config: RunConfig, capture_query_plans: bool = False, profile_sinks: bool = False) -> str:
+    """
+    Points the stage telemetry (see `TREStage`) at this run's file under `logs` and returns the run ID.
+
+    With `capture_query_plans` each sink's optimised plan and streaming-engine nodes (flagging in-memory
+    fallbacks) are saved next to the logs.  `profile_sinks` additionally runs each sink through
+    `LazyFrame.profile()` for node timings; this uses the in-memory engine, so only enable it for sinks whose
+    output fits in memory.
+    """
+    run_id = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    TREStage.run_info = {"version": config.version, "yr": config.yr, "mon": config.mon, "run_id": run_id}
+    TREStage.records = []
+    TREStage.log_path = AnyPath(
+        config.logs_path,
+        f"{config.yr}_{config.mon}_{config.version}_{run_id}_stage_telemetry.parquet"
+    )
+    TREStage.plan_path = None
+    TREStage.profile_sinks = False
+    if capture_query_plans or profile_sinks:
+        TREStage.plan_path = AnyPath(
+            config.logs_path,
+            f"{config.yr}_{config.mon}_{config.version}_{run_id}_query_plans"
+        )
+        TREStage.plan_path.mkdir(parents=True, exist_ok=True)
+        TREStage.profile_sinks = profile_sinks
+    return run_id
+
+
+def _selected(stages: list[str] | None) -> list[str]:
+    """The named stages, or all non-optional stages."""
+    return list(stages) if stages else [name for name, s in STAGES.items() if not s.optional]
+
+
+def run(
+    config: RunConfig,
+    stages: list[str] | None = None,
+    force: bool = False,
+    dry_run: bool = False,
+    ingest_ram_budget_gb: float | None = None,
+    ingest_workers: int | None = None,
+) -> list[str]:
+    """
+    Runs `stages` (default: all non-optional stages) and the stages they depend on, in dependency order.
+
+    Up-to-date stages are skipped; `force` re-runs the selected stages (and so everything downstream of them)
+    even if up to date, but not the stages they depend on.  With `dry_run` nothing is run; the stages which would run
+    (and why) are only printed.  Returns the names of the stages (which would have been) run.
+
+    With `ingest_ram_budget_gb`, the provenance ingest stages are run in parallel (at most `ingest_workers` at
+    once) within that much memory, see `ingest.parallel_ingest`.
+
+    e.g.
+    ```
+    config = RunConfig(version="version011", yr="2025", mon="10")
+    configure_telemetry(config)
+    run(config, stages=["2024_12_Bradford_path"])
+    run(config, stages=primary_keys, ingest_ram_budget_gb=48)
+    ```
+    """
+    if force:
+        config = dataclasses.replace(config, reuse_unchanged_ingests=False)
+    config.make_directories()
+    state = load_state(config)
+    upstream = upstream_stages(config)
+    rerun = []
+    pending_ingest = {}
+
+    def record_completed(name: str, signature: list[list]) -> None:
+        state[name] = {
+            "inputs": signature,
+            "completed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "version": config.version_folder_name,
+        }
+        save_state(config, state)
+
+    def run_pending_ingest() -> None:
+        if pending_ingest:
+            parallel_ingest(
+                config,
+                list(pending_ingest),
+                ram_budget_gb=ingest_ram_budget_gb,
+                max_workers=ingest_workers,
+                on_completed=lambda name: record_completed(name, pending_ingest[name]),
+            )
+            pending_ingest.clear()
+
+    selected = _selected(stages)
+    for name in execution_order(config, selected):
+        upstream_rerun = [other for other in upstream[name] if other in rerun]
+        if force and name in selected:
+            reason = "forced"
+        elif upstream_rerun:
+            reason = f"upstream stage(s) re-run: {', '.join(upstream_rerun)}"
+        else:
+            reason = stale_reason(config, name, state)
+
+        if reason is None:
+            print(f"[{name}] Up to date, skipping")
+            continue
+        print(f"[{name}] {'Would run' if dry_run else 'Running'} ({reason})")
+        rerun.append(name)
+        if dry_run:
+            continue
+
+        if ingest_ram_budget_gb is not None and name in INGEST_SPECS:
+            pending_ingest[name] = input_signature(config, name)
+            continue
+        # the signature of the files written by the pending ingest stages
+        run_pending_ingest()
+        signature = input_signature(config, name)
+        STAGES[name].func(config)
+        record_completed(name, signature)
+    run_pending_ingest()
+    return rerun
+
+
+def status(config: RunConfig, stages: list[str] | None = None) -> None:
+    """Prints, for every selected stage (and its dependencies), whether it is up to date."""
+    state = load_state(config)
+    for name in execution_order(config, _selected(stages)):
+        reason = stale_reason(config, name, state)
+        completed_at = state.get(name, {}).get("completed_at", "never")
+        print(f"{name:<60} {'up to date' if reason is None else 'stale: ' + reason} (last completed: {completed_at})")
@@ -0,0 +1,522 @@
+# Provenance specs and the generic engine turning each into one lazy plan.
+#
+# Every provenance (i.e. individual data pull, e.g. `2023_05_Barts_path`) is declared in one of the
+# `provenances/<provider>.toml` files: where its raw file(s) are, how to preprocess and scan them, which raw
+# columns hold the target columns, which rows to exclude, how to clean `result` (or any other target
+# column) and how to parse dates and results.  `provenance_plan` compiles a spec into
+#
+#   scan `raw_columns` (preprocessing the lines) -> map columns -> raw filters -> clean -> cleaned filters
+#   -> result rules -> parse -> typed filters -> hash -> unique -> sort -> select TARGET_OUTPUT_COLUMNS_WITH_HASH
+#   -> CATEGORICAL_TARGET_COLUMNS
+#
+# and `sink_provenance` writes it to `{primary|secondary}_care/arrow/{provenance_key}.arrow` (and, optionally, the
+# rows rejected along the way to `quarantine/{provenance_key}.parquet`, see `quarantine.py`).  Adding the
+# next Discovery or Barts drop is a matter of adding its entry to the provider's file.
+#
+# Spec keys (a provider's `[defaults]` table applies to all its provenances):
+#
+#   description   one line shown by `quant_py stages`
+#   source        "primary_care" or "secondary_care"
+#   path          raw file (glob) relative to `raw_datasets`
+#   exclude_files names of files matching `path` which are not read
+#   preprocess    steps applied to the raw lines as they are scanned, in order (see `scan_preprocessed`):
+#                   { step = "drop_unmatched_double_quotes" }  drop lines with an unmatched double quote
+#                   { step = "delete_double_quotes" }          delete all double quotes
+#                   { step = "keep_number_of_separators", separators = N }  keep the lines with N separators;
+#                     `separators = "dominant"` keeps the most common number (which has to be the header's), see
+#                     `partition.py`
+#   scan          extra `pl.scan_csv` arguments (`infer_schema` is always False); only `separator` applies to
+#                 preprocessed files
+#   schema        raw column = type (one of `SCAN_DTYPES`) for the clean columns parsed by the CSV reader as they
+#                 are scanned, rather than read as strings and cast (a value which does not parse fails the scan,
+#                 as the strict cast would).  Other columns are read as strings.  Not for preprocessed files.
+#   columns       target column = raw column; a list of raw columns for `test_date` gives the first date among
+#                 them (see `dates.py`).  Unmapped target columns keep their name.
+#   units_from_original_term  [[regex, unit], ...] giving `result_value_units` when there is no units column
+#   filters       [[filters]] tables, see `filter_predicates`
+#   clean         target column = [{ strip_prefix = [...] }, { strip_suffix = [...] }, { replace = [regex, value] },
+#                 { replace_all = [regex, value] }, ...] applied in order; a step with `when = { column = value }`
+#                 only applies to matching rows
+#   result_rules  the rule set reading the free-text `result` into numbers, e.g. "barts.2023_05_path" (see
+#                 `result_rules.py`); the rows it rejects are dropped
+#   date_formats  the formats `test_date` may be in, the first which parses a date winning (see `dates.py`);
+#                 `date_format` for a single format (default: cast to `pl.Date`).  `date_strict` (default true for
+#                 a single column): fail on dates matching none; `fix_year_typo`: read a leading `4` of the year
+#                 as `2`.  The rows parsed with each format are counted in the row count audit.
+#   result_strict whether casting `result` to `pl.Float64` fails on unparsable values (default true)
+
+import re
+import sys
+from contextlib import nullcontext
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from . import columns, dates, hashing, partition, result_rules, utils
+from .columns import CATEGORICAL_TARGET_COLUMNS, HASH_COLUMN_NAMES, TARGET_OUTPUT_COLUMNS_WITH_HASH
+from .config import RunConfig
+from .dag import expand
+from .dates import date_format_labels, parse_dates
+from .fingerprints import reuse_or_build
+from .hashing import with_hash
+from .partition import LINE_SCAN, dominant_number_of_separators, field_counts
+from .quarantine import FILE_COLUMN, LINE_COLUMN, Quarantine
+from .result_rules import ACCEPTED_REASONS, apply_result_rules, load_rule_set
+from .sources import ALL_PROVENANCE_OPTIONS, ALL_SOURCE_OPTIONS
+from .tre import TREAudit, scan_projections
+
+TARGET_COLUMN_NAMES = ["pseudo_nhs_number", "test_date", "original_term", "result", "result_value_units"]
+
+FILTER_PHASES = ["raw", "cleaned", "typed"]
+
+# The types a spec's `schema` may declare
+SCAN_DTYPES = {"Utf8": pl.Utf8, "Float64": pl.Float64, "Int64": pl.Int64, "Date": pl.Date}
+
+# The code turning raw files into a provenance's arrow file, part of its fingerprint
+PROVENANCE_CODE_MODULES = [sys.modules[__name__], columns, dates, hashing, partition, result_rules, utils]
+
+
+def raw_files_pattern(config: RunConfig, spec: dict) -> AnyPath:
+    return AnyPath(config.raw_data_path, spec["path"])
+
+
+def raw_files(config: RunConfig, spec: dict) -> list[AnyPath]:
+    """The raw files matching the spec's `path`, less its `exclude_files`."""
+    return [
+        file for file in expand(raw_files_pattern(config, spec))
+        if file.name not in spec.get("exclude_files", [])
+    ]
+
+
+def provenance_arrow_path(config: RunConfig, spec: dict) -> AnyPath:
+    directory = config.primary_arrow_path if spec["source"] == "primary_care" else config.secondary_arrow_path
+    return AnyPath(directory, f"{spec['key']}.arrow")
+
+
+def scan_schema(spec: dict) -> dict[str, pl.DataType]:
+    """The spec's `schema`: the raw columns the CSV reader parses, with their polars types."""
+    unknown_dtypes = set(spec.get("schema", {}).values()) - set(SCAN_DTYPES)
+    if unknown_dtypes:
+        raise ValueError(f"{spec['key']}: unknown schema types {sorted(unknown_dtypes)}, expected one of {list(SCAN_DTYPES)}")
+    return {column: SCAN_DTYPES[dtype] for column, dtype in spec.get("schema", {}).items()}
+
+
+def quarantine_path(config: RunConfig, spec: dict) -> AnyPath:
+    return AnyPath(config.quarantine_path, f"{spec['key']}.parquet")
+
+
+def _unquoted(column: str) -> pl.Expr:
+    """`column` as read by `pl.scan_csv`: surrounding double quotes removed, `""` -> `"` and empty -> null."""
+    expr = pl.col(column)
+    is_quoted = expr.str.starts_with('"') & expr.str.ends_with('"') & expr.str.len_chars().ge(2)
+    return (
+        pl.when(is_quoted)
+        .then(expr.str.slice(1, expr.str.len_chars() - 2).str.replace_all('""', '"', literal=True))
+        .when(expr.ne(""))
+        .then(expr)
+        .alias(column)
+    )
+
+
+def _filter(lf: pl.LazyFrame, *predicates: pl.Expr, rule_id: str, label: str | None = None) -> pl.LazyFrame:
+    """`lf.filter(*predicates)` (logged if `label`led), its rejected rows quarantined under `rule_id`."""
+    lf = Quarantine.reject(lf, pl.all_horizontal(predicates), rule_id)
+    if label is not None:
+        return lf.TRE.filter_with_logging(*predicates, label=label)
+    return lf.filter(*predicates)
+
+
+def _with_line_numbers(lf: pl.LazyFrame, file: AnyPath, first_line: int) -> pl.LazyFrame:
+    """`lf`, scanned from `file` with a `LINE_COLUMN` row index starting at `first_line`, and its `FILE_COLUMN`."""
+    return lf.with_columns(
+        pl.col(LINE_COLUMN).cast(pl.UInt64) + first_line,
+        pl.lit(str(file)).alias(FILE_COLUMN),
+    )
+
+
+def scan_preprocessed(file: AnyPath, spec: dict, columns: list[str]) -> pl.LazyFrame:
+    """
+    Scans `file` line by line, applying the spec's `preprocess` steps to the raw lines in the same streaming
+    pass, and splits the lines kept into the header's `columns` (only those: the other fields, e.g. the free
+    text of the wide Barts files, are never materialised).
+
+    Nothing is written to disk; the lines dropped by each step are counted by the active `TREAudit` (and
+    quarantined by the active `Quarantine`).
+    """
+    separator = spec.get("scan", {}).get("separator", ",")
+    unsupported_scan_options = set(spec.get("scan", {})) - {"separator"}
+    if unsupported_scan_options:
+        raise ValueError(f"{spec['key']}: scan options {sorted(unsupported_scan_options)} do not apply to preprocessed files")
+    if spec.get("schema"):
+        raise ValueError(f"{spec['key']}: a schema does not apply to preprocessed files")
+
+    with AnyPath(file).open() as raw:
+        header = raw.readline().rstrip("\r\n")
+
+    line = pl.col("line")
+    quarantined = Quarantine.is_active()
+    lf = pl.scan_csv(file, skip_lines=1, **LINE_SCAN, row_index_name=LINE_COLUMN if quarantined else None)
+    if quarantined:
+        lf = _with_line_numbers(lf, file, first_line=2)
+    deletes_double_quotes = False
+    for i, step in enumerate(spec["preprocess"]):
+        rule_id = f"preprocess[{i}] {step['step']}"
+        if step["step"] == "drop_unmatched_double_quotes":
+            lf = _filter(
+                lf,
+                ~line.str.contains(f'{re.escape(separator)}"[^"]*{re.escape(separator)}'),
+                rule_id=rule_id,
+                label="Drop lines with an unmatched double quote",
+            )
+        elif step["step"] == "delete_double_quotes":
+            lf = lf.with_columns(line.str.replace_all('"', "", literal=True))
+            header = header.replace('"', "")
+            deletes_double_quotes = True
+        elif step["step"] == "keep_number_of_separators":
+            separators = step["separators"]
+            if separators == "dominant":
+                counts = field_counts(file, separator)
+                print(f"[{spec['key']}] Lines of {AnyPath(file).name} by number of separators:\n{counts}")
+                separators = dominant_number_of_separators(counts)
+                if separators != header.count(separator):
+                    raise ValueError(
+                        f"{spec['key']}: most lines of {file} have {separators} separators, the header "
+                        f"{header.count(separator)}"
+                    )
+            lf = _filter(
+                lf,
+                line.str.count_matches(separator, literal=True).eq(separators),
+                rule_id=rule_id,
+                label=f"Keep lines with {separators} separators",
+            )
+        else:
+            raise ValueError(f"{spec['key']}: unknown preprocessing step {step['step']!r}")
+
+    header_columns = [column.strip('"') for column in header.split(separator)]
+    missing_columns = [column for column in columns if column not in header_columns]
+    if missing_columns:
+        raise ValueError(f"{spec['key']}: no columns {missing_columns} in the header of {file}")
+    # the fields as a list column first: `list.get` on one `str.split` per column would split each line again
+    lf = lf.select(
+        line.str.split(separator).alias("_fields"),
+        *((pl.col(FILE_COLUMN), pl.col(LINE_COLUMN)) if quarantined else ()),
+    )
+    lf = lf.select(
+        *(
+            pl.col("_fields").list.get(header_columns.index(column), null_on_oob=True).alias(column)
+            for column in columns
+        ),
+        *((pl.col(FILE_COLUMN), pl.col(LINE_COLUMN)) if quarantined else ()),
+    )
+    if deletes_double_quotes:
+        return lf.with_columns(pl.col(column).replace("", None) for column in columns)
+    return lf.with_columns(_unquoted(column) for column in columns)
+
+
+def raw_columns(spec: dict) -> list[str]:
+    """
+    The raw columns provenance `spec` reads: those its target columns, `test_date` candidates and `clean`
+    conditions come from.
+    """
+    columns = spec.get("columns", {})
+    date_columns = columns.get("test_date", "test_date")
+    mapped_columns = [
+        columns.get(name, name)
+        for name in TARGET_COLUMN_NAMES
+        if not (name == "test_date" and isinstance(date_columns, list))
+        and not (name == "result_value_units" and "units_from_original_term" in spec)
+    ]
+    # columns used by `clean` conditions which are not target columns
+    condition_columns = {
+        name for steps in spec.get("clean", {}).values() for step in steps for name in step.get("when", {})
+    } - set(TARGET_COLUMN_NAMES)
+    return list(dict.fromkeys([
+        *mapped_columns,
+        *(date_columns if isinstance(date_columns, list) else []),
+        *sorted(condition_columns),
+    ]))
+
+
+def scan_provenance(files: list[AnyPath], spec: dict) -> pl.LazyFrame:
+    """
+    The `raw_columns` of provenance `spec` read from `files` (preprocessed on the fly if needed), projected
+    explicitly at the scan so that the reader skips the others.
+    """
+    columns = raw_columns(spec)
+    if spec.get("preprocess"):
+        return pl.concat([scan_preprocessed(file, spec, columns) for file in files])
+
+    scan_options = {**spec.get("scan", {}), "infer_schema": False, "schema_overrides": scan_schema(spec)}
+    if not Quarantine.is_active():
+        return pl.scan_csv(files, **scan_options).select(columns)
+    # One scan per file, to number its lines
+    first_line = (
+        1
+        + scan_options.get("skip_rows", 0)
+        + scan_options.get("skip_lines", 0)
+        + scan_options.get("has_header", True)
+        + scan_options.get("skip_rows_after_header", 0)
+    )
+    return pl.concat([
+        _with_line_numbers(
+            pl.scan_csv(file, **scan_options, row_index_name=LINE_COLUMN).select(*columns, LINE_COLUMN),
+            file,
+            first_line,
+        )
+        for file in files
+    ])
+
+
+def filter_predicates(filter_spec: dict) -> list[pl.Expr]:
+    """
+    The predicates of one `[[filters]]` table, all on its `column` (default `result`):
+
+        not_null = true, not_nan = true
+        exclude = [values]                 one `~is_in` for all the values
+        exclude_matching = [regexes]       one `~str.contains` per regex
+        exclude_starting = [prefixes], exclude_ending = [suffixes]
+        keep_matching = [regexes]
+
+    Tables with a `label` are logged (`TRE.filter_with_logging`); `phase` is one of `FILTER_PHASES` (default
+    "raw": on the mapped but uncleaned strings).
+    """
+    column = pl.col(filter_spec.get("column", "result"))
+    predicates = []
+    if filter_spec.get("not_null"):
+        predicates.append(column.is_not_null())
+    if filter_spec.get("not_nan"):
+        predicates.append(column.is_not_nan())
+    if filter_spec.get("exclude"):
+        predicates.append(~column.is_in(filter_spec["exclude"]))
+    predicates.extend(~column.str.contains(pattern) for pattern in filter_spec.get("exclude_matching", []))
+    predicates.extend(~column.str.starts_with(prefix) for prefix in filter_spec.get("exclude_starting", []))
+    predicates.extend(~column.str.ends_with(suffix) for suffix in filter_spec.get("exclude_ending", []))
+    predicates.extend(column.str.contains(pattern) for pattern in filter_spec.get("keep_matching", []))
+    return predicates
+
+
+def _apply_filters(lf: pl.LazyFrame, spec: dict, phase: str) -> pl.LazyFrame:
+    for i, filter_spec in enumerate(spec.get("filters", [])):
+        if filter_spec.get("phase", "raw") != phase:
+            continue
+        label = filter_spec.get("label")
+        lf = _filter(
+            lf,
+            *filter_predicates(filter_spec),
+            rule_id=f"filters[{i}]" + (f" {label}" if label else ""),
+            label=label,
+        )
+    return lf
+
+
+def cleaning_expr(column: str, steps: list[dict]) -> pl.Expr:
+    """`column` with the cleaning `steps` of a spec's `clean` table applied in order."""
+    expr = pl.col(column)
+    for step in steps:
+        cleaned = expr
+        for prefix in step.get("strip_prefix", []):
+            cleaned = cleaned.str.strip_prefix(prefix)
+        for suffix in step.get("strip_suffix", []):
+            cleaned = cleaned.str.strip_suffix(suffix)
+        if "replace" in step:
+            cleaned = cleaned.str.replace(*step["replace"])
+        if "replace_all" in step:
+            cleaned = cleaned.str.replace_all(*step["replace_all"])
+        if "when" in step:
+            condition = pl.all_horizontal(pl.col(name).eq(value) for name, value in step["when"].items())
+            cleaned = pl.when(condition).then(cleaned).otherwise(expr)
+        expr = cleaned
+    return expr.alias(column)
+
+
+def _units_from_original_term(rules: list[list[str]]) -> pl.Expr:
+    """`result_value_units` of the first `[regex, unit]` rule matching `original_term`, else null."""
+    (first_pattern, first_unit), *other_rules = rules
+    expr = pl.when(pl.col("original_term").str.contains(first_pattern)).then(pl.lit(first_unit))
+    for pattern, unit in other_rules:
+        expr = expr.when(pl.col("original_term").str.contains(pattern)).then(pl.lit(unit))
+    return expr.otherwise(None).alias("result_value_units")
+
+
+def date_formats(spec: dict) -> list[str]:
+    """The formats of provenance `spec`'s `test_date` (none: cast to `pl.Date`)."""
+    return spec.get("date_formats", [spec["date_format"]] if "date_format" in spec else [])
+
+
+def _parse_test_date(lf: pl.LazyFrame, spec: dict, date_columns: list[str]) -> pl.LazyFrame:
+    """`lf` with `test_date` parsed from `date_columns` in the spec's `date_formats`, the rows per format counted."""
+    formats = date_formats(spec)
+    fix_year_typo = spec.get("fix_year_typo", False)
+    return (
+        lf
+        .pipe(
+            parse_dates,
+            date_columns,
+            formats,
+            fix_year_typo=fix_year_typo,
+            strict=spec.get("date_strict", len(date_columns) == 1),
+        )
+        .TRE
+        .count_with_logging(
+            "_date_format",
+            date_format_labels(date_columns, formats, fix_year_typo),
+            label="test_date formats",
+        )
+    )
+
+
+def provenance_plan(files: list[AnyPath], spec: dict) -> pl.LazyFrame:
+    """The lazy plan reading the raw `files` of provenance `spec` into the target output columns."""
+    columns = spec.get("columns", {})
+    date_columns = columns.get("test_date", "test_date")
+    has_date_candidates = isinstance(date_columns, list)
+
+    mapped_columns = {
+        name: columns.get(name, name)
+        for name in TARGET_COLUMN_NAMES
+        if not (name == "test_date" and has_date_candidates)
+        and not (name == "result_value_units" and "units_from_original_term" in spec)
+    }
+
+    lf = (
+        scan_provenance(files, spec)
+        .select(
+            *(pl.col(raw_column).alias(name) for name, raw_column in mapped_columns.items()),
+            # `test_date` candidates and `clean` conditions
+            *(pl.col(name) for name in raw_columns(spec) if name not in mapped_columns.values()),
+            *((pl.col(FILE_COLUMN), pl.col(LINE_COLUMN)) if Quarantine.is_active() else ()),
+        )
+    )
+    if "units_from_original_term" in spec:
+        lf = lf.with_columns(_units_from_original_term(spec["units_from_original_term"]))
+
+    lf = _apply_filters(lf, spec, "raw")
+    if spec.get("clean"):
+        lf = lf.with_columns(cleaning_expr(column, steps) for column, steps in spec["clean"].items())
+    lf = _apply_filters(lf, spec, "cleaned")
+    if "result_rules" in spec:
+        rule_set = load_rule_set(spec["result_rules"])
+        lf = apply_result_rules(lf.with_columns(_result_string=pl.col("result")), rule_set)
+        lf = Quarantine.reject(
+            lf,
+            pl.col("result_rule").is_in(ACCEPTED_REASONS),
+            rule_id=pl.lit(f"{rule_set['id']}/") + pl.col("result_rule").cast(pl.Utf8),
+            result=pl.col("_result_string"),
+        )
+        lf = lf.TRE.filter_with_logging(
+            pl.col("result_rule").is_in(ACCEPTED_REASONS),
+            label=f"Result rules {rule_set['id']}",
+        )
+
+    if has_date_candidates or date_formats(spec):
+        lf = _parse_test_date(lf, spec, date_columns if has_date_candidates else ["test_date"])
+    else:
+        lf = lf.with_columns(pl.col("test_date").cast(pl.Date, strict=spec.get("date_strict", True)))
+    lf = (
+        lf.with_columns(
+            pl.col("result").cast(pl.Float64, strict=spec.get("result_strict", True)),
+            provenance=pl.lit(spec["key"], pl.Enum(ALL_PROVENANCE_OPTIONS)),
+            source=pl.lit(spec["source"], pl.Enum(ALL_SOURCE_OPTIONS)),
+        )
+    )
+    lf = _apply_filters(lf, spec, "typed")
+
+    return (
+        lf
+        .pipe(with_hash)
+        .unique(subset=HASH_COLUMN_NAMES)
+        # for the combine stages to merge (see `merge.py`)
+        .sort(HASH_COLUMN_NAMES)
+        .select(
+            TARGET_OUTPUT_COLUMNS_WITH_HASH
+        )
+        .with_columns(
+            CATEGORICAL_TARGET_COLUMNS
+        )
+    )
+
+
+def check_columns_read(plan: pl.LazyFrame, spec: dict) -> None:
+    """
+    Raises if a scan of `plan` (optimised) reads more columns than provenance `spec` uses: its `raw_columns`, or
+    the single column of raw lines of a preprocessed file.
+    """
+    expected_columns = 1 if spec.get("preprocess") else len(raw_columns(spec))
+    scans = scan_projections(plan)
+    if scans.is_empty():
+        raise ValueError(f"{spec['key']}: no file scan found in the plan")
+    unprojected_scans = scans.filter(pl.col("columns_read") > expected_columns)
+    if not unprojected_scans.is_empty():
+        raise ValueError(
+            f"{spec['key']}: scans read more than the {expected_columns} columns used:\n{unprojected_scans}"
+        )
+
+
+def is_audited(spec: dict) -> bool:
+    """
+    Whether the spec preprocesses its files, has labelled filters, result rules or date formats, i.e. has row
+    counts to report.
+    """
+    return (
+        bool(spec.get("preprocess"))
+        or "result_rules" in spec
+        or bool(date_formats(spec))
+        or any("label" in filter_spec for filter_spec in spec.get("filters", []))
+    )
+
+
+def sink_provenance(config: RunConfig, spec: dict) -> None:
+    """
+    Scans (and preprocesses), filters, cleans and de-duplicates provenance `spec` to its arrow intermediate, unless
+    its raw files, spec and code are those of an earlier run (see `fingerprints.py`).
+    """
+    files = raw_files(config, spec)
+    if not files:
+        raise FileNotFoundError(f"{spec['key']}: no files match {raw_files_pattern(config, spec)}")
+
+    def build() -> None:
+        # Only provenances with dropped lines or labelled filters to report are audited, the others run without
+        # checkpoints
+        with (
+            TREAudit(spec["key"]) if is_audited(spec) else nullcontext() as audit,
+            Quarantine(spec["key"]) if config.quarantine_rejected_rows else nullcontext() as quarantine,
+        ):
+            plan = provenance_plan(files, spec)
+            if quarantine is None:
+                # polars does not push projections through the caches of a quarantined plan, which reads every
+                # column of the raw files
+                check_columns_read(plan, spec)
+            (
+                plan
+                .TRE
+                .sink_ipc(
+                    provenance_arrow_path(config, spec),
+                    side_sinks=(
+                        {quarantine_path(config, spec): quarantine.sink(quarantine_path(config, spec))}
+                        if quarantine is not None else None
+                    ),
+                )
+            )
+
+        if audit is not None:
+            audit.write(
+                AnyPath(
+                    config.logs_path,
+                    f"{config.yr}_{config.mon}_{spec['key']}_row_count_audit.parquet"
+                )
+            )
+
+    if config.quarantine_rejected_rows:
+        # an earlier run's arrow file comes without the rejected rows
+        build()
+        return
+    reuse_or_build(
+        config,
+        spec["key"],
+        files,
+        provenance_arrow_path(config, spec),
+        build,
+        # the rules themselves, rather than the name of their set
+        spec={**spec, "result_rules": load_rule_set(spec["result_rules"])} if "result_rules" in spec else spec,
+        code_modules=PROVENANCE_CODE_MODULES,
+    )
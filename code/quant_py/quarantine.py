@@ -0,0 +1,111 @@
+# Quarantine of the rows rejected by an ingest stage, written in the same streaming pass as its arrow file.
+#
+# Without it, the only record of the lines dropped by the preprocessing, the spec's filters or the result rules
+# is a printed (or audited) count, and investigating them means scanning the raw file again.  With
+# `RunConfig.quarantine_rejected_rows` (`quant_py run --quarantine`), every rejection point of a provenance
+# plan also registers its rejected rows with the active `Quarantine`, and `sink_provenance` writes them to
+# `data/quarantine/{provenance_key}.parquet` (zstd) alongside the arrow file, in the same
+# `pl.collect_all` (so the raw file is scanned once).  The quarantine files of all provenances read as one
+# dataset:
+#
+#   pl.scan_parquet(AnyPath(config.quarantine_path, "*.parquet")).filter(pl.col("rule_id").str.starts_with("barts."))
+#
+# Every rejected row has its `provenance`, raw `file`, `line` (1-based, counting the header; a quoted field
+# spanning lines shifts the numbers after it), `rule_id` and either the raw line (`record`, for lines dropped
+# while preprocessing) or the values of the target columns at the point of rejection.
+#
+# The caches sharing the plan between the arrow file and the rejected rows stop projection pushdown, so a
+# quarantined ingest parses every column of the raw files (see `check_columns_read`).
+
+import polars as pl
+
+QUARANTINE_SCHEMA = {
+    "provenance": pl.Utf8,
+    "file": pl.Utf8,
+    "line": pl.UInt64,
+    "rule_id": pl.Utf8,
+    "record": pl.Utf8,
+    "pseudo_nhs_number": pl.Utf8,
+    "test_date": pl.Utf8,
+    "original_term": pl.Utf8,
+    "result": pl.Utf8,
+    "result_value_units": pl.Utf8,
+}
+
+# Columns carried along a quarantined plan, from the scan up to the final select
+FILE_COLUMN = "_file"
+LINE_COLUMN = "_line_number"
+
+
+class Quarantine:
+    """
+    Collects the rows rejected along a lazy plan, to be sunk together with the plan.
+
+    e.g.
+    ```
+    with Quarantine(provenance_key) as quarantine:
+        lf = ...  # `lf = Quarantine.reject(lf, keep, rule_id).filter(keep)` at every filter
+    pl.collect_all([lf.sink_ipc(..., lazy=True), quarantine.sink(path)])
+    ```
+    """
+    _active = None
+
+    def __init__(self, provenance: str) -> None:
+        self.provenance = provenance
+        self.rejected = []
+
+    def __enter__(self) -> "Quarantine":
+        Quarantine._active = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        Quarantine._active = None
+
+    @classmethod
+    def is_active(cls) -> bool:
+        return cls._active is not None
+
+    @classmethod
+    def reject(cls, lf: pl.LazyFrame, keep: pl.Expr, rule_id: str | pl.Expr, **columns: pl.Expr) -> pl.LazyFrame:
+        """
+        Registers the rows of `lf` which `lf.filter(keep)` drops (`keep` false or null) with the active
+        quarantine, if any, under `rule_id`.  `columns` override the quarantined values of target columns.
+
+        Returns `lf` to be filtered, cached: `pl.collect_all` then computes it once for both the rejected rows
+        and the plan continuing from it (the two differ in their pushed-down columns and predicates, so they are
+        not recognised as a common subplan otherwise).
+        """
+        if cls._active is None:
+            return lf
+        lf = lf.cache()
+        schema = lf.collect_schema()
+        values = {
+            name: columns[name] if name in columns else pl.col(name) if name in schema else pl.lit(None)
+            for name in QUARANTINE_SCHEMA
+            if name not in ("provenance", "file", "line", "rule_id")
+        }
+        if "record" not in columns and "line" in schema:
+            values["record"] = pl.col("line") # the raw line, while preprocessing
+        cls._active.rejected.append(
+            lf
+            .filter(~keep.fill_null(False))
+            .select(
+                provenance=pl.lit(cls._active.provenance),
+                file=pl.col(FILE_COLUMN),
+                line=pl.col(LINE_COLUMN),
+                rule_id=rule_id if isinstance(rule_id, pl.Expr) else pl.lit(rule_id),
+                **values,
+            )
+            .cast(QUARANTINE_SCHEMA)
+        )
+        return lf
+
+    def plan(self) -> pl.LazyFrame:
+        """All the rejected rows registered so far."""
+        if not self.rejected:
+            return pl.LazyFrame(schema=QUARANTINE_SCHEMA)
+        return pl.concat(self.rejected)
+
+    def sink(self, path) -> pl.LazyFrame:
+        """The lazy sink of the rejected rows to `path` (zstd Parquet), to be run with `pl.collect_all`."""
+        return self.plan().sink_parquet(path, compression="zstd", statistics=True, lazy=True)
@@ -0,0 +1,212 @@
+# Result-string rules: turning the free-text `result` of the Barts and Bradford extracts into numbers.
+#
+# The rules of every provenance are declared in the versioned `rules/<provider>.toml` files and referenced by
+# the provenance spec (`result_rules = "barts.2023_05_path"`).  A rule set has
+#
+#   exclude      literal tokens which are not results (e.g. "Pending", "**", "64 -")
+#   corrections  token = replacement, for known typos (e.g. "3.6.1" = "36.1")
+#   strip        steps applied in order, like a spec's `clean` steps:
+#                  { prefix = [...] }     strip each prefix in turn (if present)
+#                  { suffix = [...] }     strip each suffix in turn (if present)
+#                  { wrapper = [[open, close], ...] }  unwrap the (whole) remaining string from one pair
+#                a step may set `reason = "comparator"` (e.g. for "<" and ">")
+#   number       the regex the stripped string has to match (default `NUMBER`, an optionally signed decimal)
+#   include      ["provider.set", ...] whose `exclude` and `corrections` are added to this set's
+#
+# and is compiled (see `compile_rule_set`) into a single `is_in` lookup of the excluded tokens plus a single
+# anchored extraction regex, `^<prefixes> (<open> <prefixes> (?<value>number) <suffixes> <close> | ...) <suffixes>$`,
+# instead of one pass over the column per token, regex and strip.  Strings which do not match are rejected
+# as "unparsable", so the regexes which used to exclude words, dates, times, ranges etc. are not needed (and so are
+# "1e3", "nan" and "inf", which the cast to `Float64` used to read).
+#
+# The rules run on the distinct strings of every batch, which are then joined back (see `apply_result_rules`).
+#
+# Every row gets a `result_rule` reason code (`RESULT_REASONS`): how its value was read, or why it was
+# rejected (see `REJECTED_REASONS`).  A rule set's `id` (`barts.2023_05_path@1`) records the file version, to
+# be bumped whenever the rules of a file change.
+
+import re
+import tomllib
+from pathlib import Path
+
+import polars as pl
+
+RULES_PATH = Path(__file__).parent / "rules"
+
+NUMBER = r"[+-]?(?:\d+\.?\d*|\.\d+)"
+
+RESULT_REASONS = [
+    "numeric", # read as it is
+    "comparator", # a comparator (e.g. "<", "Less than ") stripped
+    "wrapped", # unwrapped, e.g. "{5}"
+    "stripped", # other prefix or suffix stripped
+    "corrected", # replaced by its correction
+    "null",
+    "excluded_token",
+    "unparsable",
+]
+REJECTED_REASONS = ["null", "excluded_token", "unparsable"]
+ACCEPTED_REASONS = [reason for reason in RESULT_REASONS if reason not in REJECTED_REASONS]
+
+RESULT_REASON_DTYPE = pl.Enum(RESULT_REASONS)
+
+
+def load_rule_file(provider: str) -> dict:
+    with open(RULES_PATH / f"{provider}.toml", "rb") as file:
+        return tomllib.load(file)
+
+
+def rule_files(name: str) -> list[Path]:
+    """The rule files rule set `provider.set` is read from, its includes' included."""
+    provider, set_name = name.split(".", 1)
+    included = load_rule_file(provider).get(set_name, {}).get("include", [])
+    return sorted({RULES_PATH / f"{provider}.toml", *(path for other in included for path in rule_files(other))})
+
+
+def load_rule_set(name: str) -> dict:
+    """Rule set `provider.set` of `rules/{provider}.toml`, with its includes resolved and its `id`."""
+    provider, set_name = name.split(".", 1)
+    rules = load_rule_file(provider)
+    if set_name not in rules:
+        raise KeyError(f"No rule set {set_name!r} in {RULES_PATH / provider}.toml")
+    rule_set = {"exclude": [], "corrections": {}, **rules[set_name]}
+
+    exclude, corrections = [], {}
+    for included_name in rule_set.get("include", []):
+        included = load_rule_set(included_name)
+        exclude.extend(included["exclude"])
+        corrections.update(included["corrections"])
+    exclude.extend(rule_set["exclude"])
+    corrections.update(rule_set["corrections"])
+
+    for step in rule_set.get("strip", []):
+        if step.get("reason", "stripped") not in ACCEPTED_REASONS:
+            raise ValueError(f"{name}: unknown reason {step['reason']!r}")
+
+    return {
+        **rule_set,
+        "exclude": list(dict.fromkeys(exclude)),
+        "corrections": corrections,
+        "id": f"{name}@{rules.get('version', 0)}",
+    }
+
+
+def _optional(literals: list[str]) -> str:
+    return "".join(f"(?:{re.escape(literal)})?" for literal in literals)
+
+
+def compile_rule_set(rule_set: dict) -> tuple[str, list[str], list[tuple[str, str]]]:
+    """
+    The anchored extraction regex of `rule_set`, the names of its value groups (one per wrapper, the last one
+    for unwrapped strings) and `(group, reason)` of its strip groups, in step order.
+    """
+    number = rule_set.get("number", NUMBER)
+    steps = rule_set.get("strip", [])
+    wrapper_index = next((i for i, step in enumerate(steps) if "wrapper" in step), len(steps))
+    outer_steps, inner_steps = steps[:wrapper_index], steps[wrapper_index + 1:]
+    wrappers = steps[wrapper_index]["wrapper"] if wrapper_index < len(steps) else []
+
+    strip_groups = []
+
+    def stripped(step_steps: list[dict], offset: int, suffix: str = "") -> tuple[str, str]:
+        """The regexes of the prefixes and the suffixes of `step_steps`, each step in its own group."""
+        prefixes, suffixes = "", ""
+        for i, step in enumerate(step_steps, start=offset):
+            group = f"s{i}{suffix}"
+            reason = step.get("reason", "stripped")
+            if "prefix" in step:
+                prefixes += f"(?P<{group}>{_optional(step['prefix'])})"
+            else:
+                # stripped from the end in turn, so the first suffix is the last in the string
+                suffixes = f"(?P<{group}>{_optional(step['suffix'][::-1])})" + suffixes
+            strip_groups.append((group, reason))
+        return prefixes, suffixes
+
+    outer_prefixes, outer_suffixes = stripped(outer_steps, 0)
+    alternatives, value_groups = [], []
+    for w, (open_, close) in enumerate([*wrappers, ("", "")]):
+        suffix = f"_{w}"
+        if w < len(wrappers):
+            strip_groups.append((f"wrapped{suffix}", "wrapped"))
+        inner_prefixes, inner_suffixes = stripped(inner_steps, wrapper_index + 1, suffix)
+        value_groups.append(f"value{suffix}")
+        alternatives.append(
+            f"{re.escape(open_)}{inner_prefixes}(?P<value{suffix}>{number}){inner_suffixes}{re.escape(close)}"
+        )
+    pattern = f"^{outer_prefixes}(?:{'|'.join(alternatives)}){outer_suffixes}$"
+    return pattern, value_groups, strip_groups
+
+
+def decode_results(raw: pl.Series, rule_set: dict) -> pl.DataFrame:
+    """
+    `raw` (the result strings), with their `value` (`pl.Float64`, null when rejected) and `result_rule` (their
+    reason code, `RESULT_REASON_DTYPE`) under `rule_set`.
+    """
+    pattern, value_groups, strip_groups = compile_rule_set(rule_set)
+    raw_col = pl.col("raw")
+    corrected = raw_col.replace(rule_set["corrections"]) if rule_set["corrections"] else raw_col
+    groups = pl.col("groups")
+    value = pl.coalesce(groups.struct.field(group) for group in value_groups)
+
+    def applied(group: str) -> pl.Expr:
+        if group.startswith("wrapped"):
+            return groups.struct.field(f"value_{group.split('_')[1]}").is_not_null()
+        return groups.struct.field(group).str.len_bytes() > 0
+
+    reason = (
+        pl.when(raw_col.is_null()).then(pl.lit("null"))
+        .when(raw_col.is_in(rule_set["exclude"])).then(pl.lit("excluded_token"))
+        .when(value.is_null()).then(pl.lit("unparsable"))
+        .when(corrected != raw_col).then(pl.lit("corrected"))
+    )
+    for group, group_reason in strip_groups:
+        reason = reason.when(applied(group)).then(pl.lit(group_reason))
+
+    return (
+        raw.rename("raw")
+        .to_frame()
+        .with_columns(groups=corrected.str.extract_groups(pattern))
+        .with_columns(result_rule=reason.otherwise(pl.lit("numeric")).cast(RESULT_REASON_DTYPE))
+        .select(
+            "raw",
+            value=pl.when(~pl.col("result_rule").is_in(REJECTED_REASONS)).then(value).cast(pl.Float64),
+            result_rule="result_rule",
+        )
+    )
+
+
+def apply_result_rules(lf: pl.LazyFrame, rule_set: dict, column: str = "result") -> pl.LazyFrame:
+    """
+    `lf` with `rule_set` applied to `column`: `column` becomes its value (null when rejected) and `result_rule`
+    its reason code; rejected rows are kept.
+
+    A results column repeats a few thousand distinct strings, so each batch is decoded by running the rules on
+    its distinct strings only (a capturing regex costs far more per string than a hash join).
+    """
+    def decode(batch: pl.Series) -> pl.Series:
+        decoded = decode_results(batch.unique(), rule_set)
+        return (
+            batch.rename("raw")
+            .to_frame()
+            .join(decoded, on="raw", how="left", nulls_equal=True, maintain_order="left")
+            .select(pl.struct("value", "result_rule"))
+            .to_series()
+        )
+
+    return (
+        lf
+        .with_columns(
+            pl.col(column)
+            .map_batches(
+                decode,
+                return_dtype=pl.Struct({"value": pl.Float64, "result_rule": RESULT_REASON_DTYPE}),
+                is_elementwise=True,
+            )
+            .alias("_result_rules")
+        )
+        .with_columns(
+            pl.col("_result_rules").struct.field("value").alias(column),
+            pl.col("_result_rules").struct.field("result_rule"),
+        )
+        .drop("_result_rules")
+    )
@@ -0,0 +1,87 @@
+# Provenances (i.e. individual data pulls) and the raw source files they are read from.
+#
+# Provenances are declared in `provenances/<provider>.toml` (see `provenance.py`, and `nda.py` for the NDA pulls
+# in `provenances/nda.toml`), so the provenance keys are those of the spec files, in file order.
+
+import tomllib
+from pathlib import Path
+
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+
+PROVENANCE_SPECS_PATH = Path(__file__).parent / "provenances"
+
+
+def load_provenance_specs(provider: str) -> dict[str, dict]:
+    """The provenance specs in `provenances/{provider}.toml`, in file order, with the provider defaults applied."""
+    with open(PROVENANCE_SPECS_PATH / f"{provider}.toml", "rb") as file:
+        specs = tomllib.load(file)
+    defaults = specs.pop("defaults", {})
+    return {
+        provenance_key: {**defaults, **spec, "key": provenance_key, "provider": provider}
+        for provenance_key, spec in specs.items()
+    }
+
+
+PROVENANCE_SPECS = {
+    provider: load_provenance_specs(provider)
+    for provider in ("discovery", "barts", "bradford")
+}
+
+primary_keys = list(PROVENANCE_SPECS["discovery"])
+
+NDA_SPECS = load_provenance_specs("nda")
+
+nda_keys = list(NDA_SPECS)
+
+barts_keys = list(PROVENANCE_SPECS["barts"])
+
+bradford_keys = list(PROVENANCE_SPECS["bradford"])
+
+ALL_PROVENANCE_OPTIONS = primary_keys + nda_keys + barts_keys + bradford_keys
+
+ALL_SOURCE_OPTIONS = ["primary_care", "secondary_care"]
+
+def source_files(config: RunConfig) -> dict[str, list[str]]:
+    """Raw source files (or globs) per health provider, as copied to `raw_datasets` by `copy_raw_data`."""
+    LIBRARY_RED_DATA_LOCATION = config.library_red_data_location
+    NHSE_SUBLICENSE_DATA_LOCATION = config.nhse_sublicense_data_location
+    return {
+        # primary care files
+        "primary_care": [
+            #f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2025_XX_Discovery/gh3_observations.csv", # placeholder
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2024_12_Discovery/gh3_observations.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2024_07_Discovery/gh3_observations.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2023_11_Discovery/gh3_observations.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2023_03_Discovery/gh3_observations.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2022_12_Discovery/GNH_thwfnech-phase2-outfiles_merge/cohort_gh2_observations_output_dataset_20221207.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2022_12_Discovery/GNH_bhr-phase2-outfiles_merge/gh2_observations_dataset_20221207.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2022_04_Discovery/GNH_thwfnech-phase2-outfiles_merge/GNH_thwfnech_observations_output_dataset_20220423.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__Discovery_7CCGs/2022_04_Discovery/GNH_bhr-phase2-outfiles_merge/GNH_bhr_observations_output_dataset_20220412.csv",
+            # Majority of NHSED data are secondary care but NDA is principally primary care
+            f"{NHSE_SUBLICENSE_DATA_LOCATION}/DSA__NHSDigitalNHSEngland/2024_10/NDA/NIC338864_NDA_*.txt", #one of ["BMI","BP","CHOL","HBAIC","CORE"]
+        ],
+        # repeat for secondary care
+        "secondary_care": [
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BartsHealth_NHS_Trust/2024_09_ResearchDataset/RDE_Pathology.ascii.nohisto.redacted2.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BartsHealth_NHS_Trust/2024_09_ResearchDataset/RDE_Measurements.ascii.redacted2.tab",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BartsHealth_NHS_Trust/2023_12_ResearchDatasetv1.6/GandH_Measurements__20240423.ascii.redacted2.tab",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BartsHealth_NHS_Trust/2023_12_ResearchDatasetv1.6/GH_Pathology__20231218.ascii.nohisto.redacted2.tab",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BartsHealth_NHS_Trust/2023_05_ResearchDatasetv1.5/GandH_Measurements_202305151304.ascii.redacted.tab",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BartsHealth_NHS_Trust/2023_05_ResearchDatasetv1.5/GH_Pathology_202305071651.ascii.redacted.nohisto.tab",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BartsHealth_NHS_Trust/2022_03_ResearchDatasetv1.3/GandH_Pathology_202203191143_redacted_noHistopathologyReport.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BartsHealth_NHS_Trust/2021_04_PathologyLab/*.csv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BradfordTeachingHospitals_NHSFoundation_Trust/2022_06_BTHNFT/1578_gh_cerner_measurements_2022-06-10_redacted.tsv",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BradfordTeachingHospitals_NHSFoundation_Trust/2023_05_BTHNFT/1578_gh_lab_results_2023-06-09_noCR.ascii.redacted.tab",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BradfordTeachingHospitals_NHSFoundation_Trust/2024_12_BTHNFT/1578_gh_lab_results_2024-12-05.ascii.redacted.tab",
+            f"{LIBRARY_RED_DATA_LOCATION}/DSA__BradfordTeachingHospitals_NHSFoundation_Trust/2024_12_BTHNFT/1578_gh_cerner_measurements_2024-12-05.ascii.redacted.tab",
+        ],
+    }
+
+
+def raw_data_destination(config: RunConfig, health_provider: str, source_file: str) -> AnyPath:
+    """Where `copy_raw_data` puts `source_file`: `raw_datasets/<health_provider>/<last two directories>/<name>`."""
+    source_file = AnyPath(source_file)
+    sub_path = AnyPath(health_provider, *source_file.parts[-3:-1]) # get last two segments (exculding file name), and prepend health_provider
+    return config.raw_data_path / sub_path / source_file.name
@@ -0,0 +1,2 @@
+# Importing the stage modules registers their stages (in this, i.e. the default execution, order).
+from . import copy, provenances, primary, bradford, barts, combine, hes, traits, outputs # noqa: F401
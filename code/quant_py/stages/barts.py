@@ -0,0 +1,65 @@
+# Secondary care: combining the Barts Health NHS Trust pathology and measurements.
+#
+# The individual provenances (and their preprocessing) are declared in `provenances/barts.toml`.
+
+from cloudpathlib import AnyPath
+
+from ..config import RunConfig
+from ..dag import stage
+from ..merge import merged
+
+
+@stage(
+    "barts_path_combined",
+    inputs=lambda config: [AnyPath(config.secondary_arrow_path, "*_Barts_path.arrow")],
+    outputs=lambda config: [AnyPath(config.secondary_arrow_path, f"{config.yr}_{config.mon}_Barts_path_combined.arrow")],
+)
+def barts_path_combined(config: RunConfig) -> None:
+    """All Barts pathology releases merged on the fingerprint (see `merge.py`)."""
+    with merged(
+        config,
+        "barts_path_combined",
+        AnyPath(
+            config.secondary_arrow_path,
+            "*_Barts_path.arrow"
+        )
+    ) as lf:
+        (
+            lf
+            .TRE
+            .sink_ipc(
+                AnyPath(
+                    config.secondary_arrow_path,
+                    f"{config.yr}_{config.mon}_Barts_path_combined.arrow"
+                )
+            )
+        )
+
+
+@stage(
+    "barts_measurements_combined",
+    inputs=lambda config: [AnyPath(config.secondary_arrow_path, "20*_Barts_measurements.arrow")],
+    outputs=lambda config: [
+        AnyPath(config.secondary_arrow_path, f"{config.yr}_{config.mon}_Barts_measurements_combined.arrow")
+    ],
+)
+def barts_measurements_combined(config: RunConfig) -> None:
+    """All Barts measurements releases merged on the fingerprint (see `merge.py`)."""
+    with merged(
+        config,
+        "barts_measurements_combined",
+        AnyPath(
+            config.secondary_arrow_path,
+            "20*_Barts_measurements.arrow"
+        )
+    ) as lf:
+        (
+            lf
+            .TRE
+            .sink_ipc(
+                AnyPath(
+                    config.secondary_arrow_path,
+                    f"{config.yr}_{config.mon}_Barts_measurements_combined.arrow"
+                )
+            )
+        )
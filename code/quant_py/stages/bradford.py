@@ -0,0 +1,74 @@
+# Secondary care: combining the Bradford Teaching Hospitals NHS Foundation Trust pathology and measurements.
+#
+# The individual provenances are declared in `provenances/bradford.toml`.
+
+from cloudpathlib import AnyPath
+
+from ..config import RunConfig
+from ..dag import stage
+from ..merge import merged
+from ..provenance import provenance_arrow_path
+from ..sources import PROVENANCE_SPECS
+
+
+@stage(
+    "bradford_path_combined",
+    inputs=lambda config: [
+        provenance_arrow_path(config, PROVENANCE_SPECS["bradford"]["2023_05_Bradford_path"]),
+        provenance_arrow_path(config, PROVENANCE_SPECS["bradford"]["2024_12_Bradford_path"]),
+    ],
+    outputs=lambda config: [AnyPath(config.secondary_arrow_path, f"{config.yr}_{config.mon}_Bradford_path_combined.arrow")],
+)
+def bradford_path_combined(config: RunConfig) -> None:
+    """Both Bradford lab results extracts merged on the fingerprint (see `merge.py`)."""
+    with merged(
+        config,
+        "bradford_path_combined",
+        AnyPath(
+            config.secondary_arrow_path,
+            "2023_05_Bradford_path.arrow"
+        ),
+        AnyPath(
+            config.secondary_arrow_path,
+            "2024_12_Bradford_path.arrow"
+        ),
+    ) as lf:
+        (
+            lf
+            .TRE
+            .sink_ipc(
+                AnyPath(
+                    config.secondary_arrow_path,
+                    f"{config.yr}_{config.mon}_Bradford_path_combined.arrow"
+                )
+            )
+        )
+
+
+@stage(
+    "bradford_measurements_combined",
+    inputs=lambda config: [AnyPath(config.secondary_arrow_path, "*_Bradford_measurements.arrow")],
+    outputs=lambda config: [
+        AnyPath(config.secondary_arrow_path, f"{config.yr}_{config.mon}_Bradford_measurements_combined.arrow")
+    ],
+)
+def bradford_measurements_combined(config: RunConfig) -> None:
+    """Both Bradford measurements extracts merged on the fingerprint (see `merge.py`)."""
+    with merged(
+        config,
+        "bradford_measurements_combined",
+        AnyPath(
+            config.secondary_arrow_path,
+            "*_Bradford_measurements.arrow"
+        )
+    ) as lf:
+        (
+            lf
+            .TRE
+            .sink_ipc(
+                AnyPath(
+                    config.secondary_arrow_path,
+                    f"{config.yr}_{config.mon}_Bradford_measurements_combined.arrow"
+                )
+            )
+        )
@@ -0,0 +1,86 @@
+# Combining the primary and secondary care readings into the reference `Combined_all_sources` dataset.
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from ..config import RunConfig
+from ..dag import stage
+from ..datasets import sink_dataset
+from ..intermediates import intermediate_path, sink_intermediate
+from ..merge import merged
+from ..person_index import person_index_path
+from .primary import combined_primary_care_path
+
+
+def combined_secondary_care_path(config: RunConfig) -> AnyPath:
+    return intermediate_path(
+        config,
+        "secondary_care_combined",
+        config.combined_datasets_arrow_path,
+        f"{config.yr}_{config.mon}_Combined_secondary_care",
+    )
+
+
+def combined_all_sources_path(config: RunConfig) -> AnyPath:
+    # a partitioned dataset (see `datasets.py`)
+    return AnyPath(config.reference_combo_files_path, f"{config.yr}_{config.mon}_Combined_all_sources")
+
+
+@stage(
+    "secondary_care_combined",
+    inputs=lambda config: [AnyPath(config.secondary_arrow_path, "*_combined.arrow")],
+    outputs=lambda config: [combined_secondary_care_path(config)],
+)
+def secondary_care_combined(config: RunConfig) -> None:
+    """The combined Barts and Bradford pathology and measurements merged on the fingerprint (see `merge.py`)."""
+    with merged(
+        config,
+        "secondary_care_combined",
+        AnyPath(
+            config.secondary_arrow_path,
+            "*_combined.arrow"
+        )
+    ) as lf:
+        (
+            lf
+            .pipe(sink_intermediate, config, "secondary_care_combined", combined_secondary_care_path(config))
+        )
+
+
+@stage(
+    "combined_all_sources",
+    inputs=lambda config: [combined_primary_care_path(config), combined_secondary_care_path(config)],
+    outputs=lambda config: [combined_all_sources_path(config), person_index_path(combined_all_sources_path(config))],
+)
+def combined_all_sources(config: RunConfig) -> None:
+    """
+    Primary and secondary care readings, merged on their fingerprint (see `merge.py`), with the units of unitless
+    POCT blood ketones readings filled in.
+    """
+    # the hashes are those taken at the ingest, which do not depend on the polars version (see `hashing.py`)
+    with merged(
+        config,
+        "combined_all_sources",
+        combined_primary_care_path(config),
+        combined_secondary_care_path(config),
+    ) as unique_readings:
+        combo = (
+            unique_readings
+            .with_columns(
+                pl.when(
+                    pl.col("original_term").eq("POCT Blood Ketones") &
+                    pl.col("result_value_units").is_null()
+                )
+                .then(
+                    pl.lit("millimol/L").alias("result_value_units")
+                )
+                .otherwise(
+                    pl.col("result_value_units")
+                )
+            )
+        )
+
+        (
+            combo
+            .pipe(sink_dataset, "combined_all_sources", combined_all_sources_path(config))
+        )
@@ -0,0 +1,40 @@
+# Copying the raw data from /library-red/ (and /nhsdigital-sublicence-red/) to `raw_datasets` on the ivm.
+#
+# Only run when asked for (`quant_py run ... --copy`); for consortium 2.0 use gcloud storage cp.  The files are
+# copied in parallel, resumably and verified, see `transfer.py`.
+
+from cloudpathlib import AnyPath
+
+from ..config import RunConfig
+from ..dag import expand, stage
+from ..sources import raw_data_destination, source_files
+from ..transfer import copy_files, copy_manifest_path
+
+
+def _all_source_files(config: RunConfig) -> list[tuple[str, str]]:
+    return [
+        (health_provider, file)
+        for health_provider, files in source_files(config).items()
+        for file in files
+    ]
+
+
+@stage(
+    "copy_raw_data",
+    inputs=lambda config: [AnyPath(file) for _, file in _all_source_files(config)],
+    outputs=lambda config: [
+        raw_data_destination(config, health_provider, file) for health_provider, file in _all_source_files(config)
+    ],
+    optional=True,
+)
+def copy_raw_data(config: RunConfig) -> None:
+    """
+    Copies the source files to `raw_datasets/<health_provider>/...`, `config.copy_workers` at a time; files
+    already copied are skipped.
+    """
+    files = [
+        (source_file, raw_data_destination(config, health_provider, str(source_file)))
+        for health_provider, file in _all_source_files(config)
+        for source_file in expand(file)
+    ]
+    copy_files(files, copy_manifest_path(config), workers=config.copy_workers)
@@ -0,0 +1,238 @@
+# Secondary care: HES admitted patient care (APC) episodes, used to place readings in or out of hospital.
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from ..config import RunConfig
+from ..dag import stage
+from ..hes import combined_hes_path, hospital_stay_type_enum, region_types_enum
+from ..intermediates import scan_intermediate, sink_intermediate
+from ..person_index import person_index_path, write_person_index
+from ..persons import encode_person_id
+from ..tre import TREAudit
+
+# The admission and discharge dates are parsed by the CSV reader; the other columns are read as strings
+HES_APC_SCHEMA = {"ADMIDATE": pl.Date, "DISDATE": pl.Date}
+
+
+@stage(
+    "hes_apc",
+    inputs=lambda config: [
+        AnyPath(config.nhse_data_path, "2021_09", "NIC338864_HES_APC_all_2021_11_25.txt"),
+        AnyPath(config.nhse_data_path, "2023_07", "HES", "*APC*.txt"),
+        AnyPath(config.nhse_data_path, "2023_07", "HES", "*apc*.csv"),
+        AnyPath(config.nhse_data_path, "2024_10", "HES", "FILE0220459_NIC338864_HES_APC_202399.txt"),
+        AnyPath(config.nhse_data_path, "2025_03", "HES", "*APC*.txt"),
+    ],
+    outputs=lambda config: [combined_hes_path(config), person_index_path(combined_hes_path(config))],
+)
+def hes_apc(config: RunConfig) -> None:
+    """All HES APC episodes (admission and discharge datetimes), de-duplicated, and their person index."""
+    # The HES logged filters are spread over several pulls and only executed by the `_Combined_HES.arrow` sink
+    with TREAudit("HES_APC") as hes_audit:
+        hes_2021_09_APC_txts = (
+        # (
+            pl.scan_csv(
+                [
+                AnyPath(config.nhse_data_path, "2021_09/NIC338864_HES_APC_all_2021_11_25.txt"),
+                        ],
+                separator="|",
+                infer_schema=False,
+                schema_overrides=HES_APC_SCHEMA,
+                null_values=[""],
+            )
+            .TRE
+            .filter_with_logging(
+                pl.col("ADMIDATE").is_not_null(),
+                label="EXCLUDE NULL ADMIDATE"
+            )
+            .with_columns(
+                pl.col("STUDY_ID").alias("pseudo_nhs_number"),
+                # no time info provided in this file so we assume earliest time of day
+                pl.col("ADMIDATE").cast(pl.Datetime).alias("hospital_admission_datetime"),
+                # no time info provided in this file so we assume latest time of day
+                (
+                    pl.col("DISDATE").cast(pl.Datetime) + pl.duration(hours=23, minutes=59, seconds=59)
+                ).alias("hospital_discharge_datetime"),
+                hospital_stay_type=pl.lit("APC", hospital_stay_type_enum),
+            )
+            .select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("hospital_admission_datetime"),
+                pl.col("hospital_discharge_datetime"),
+                pl.col("hospital_stay_type"),
+            )
+
+        )
+
+        hes_2023_07_APC_txts = (
+            pl.scan_csv(
+                [
+                AnyPath(config.nhse_data_path, "2023_07/HES/*APC*.txt"),
+
+                        ],
+                separator=",",
+                infer_schema=False,
+                schema_overrides=HES_APC_SCHEMA,
+                null_values=[""],
+            )
+            .TRE
+            .filter_with_logging(
+                pl.col("ADMIDATE").is_not_null(),
+                label="EXCLUDE NULL ADMIDATE"
+            )
+            .with_columns(
+                pl.col("STUDY_ID").alias("pseudo_nhs_number"),
+                # no time info provided in this file so we assume earliest time of day
+                pl.col("ADMIDATE").cast(pl.Datetime).alias("hospital_admission_datetime"),
+                # no time info provided in this file so we assume latest time of day
+                (
+                    pl.col("DISDATE").cast(pl.Datetime) + pl.duration(hours=23, minutes=59, seconds=59)
+                ).alias("hospital_discharge_datetime"),
+                hospital_stay_type=pl.lit("APC", hospital_stay_type_enum),
+            )
+            .select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("hospital_admission_datetime"),
+                pl.col("hospital_discharge_datetime"),
+                pl.col("hospital_stay_type"),
+            )
+        )
+
+        hes_2023_07_APC_csvs = (
+            pl.scan_csv(
+                [
+                AnyPath(config.nhse_data_path, "2023_07/HES/*apc*.csv"),
+                        ],
+                separator=",",
+                infer_schema=False,
+                schema_overrides=HES_APC_SCHEMA,
+                null_values=[""],
+            )
+            .TRE
+            .filter_with_logging(
+                pl.col("ADMIDATE").is_not_null(),
+                label="EXCLUDE NULL ADMIDATE"
+            )
+            .with_columns(
+                pl.col("STUDY_ID").alias("pseudo_nhs_number"),
+                # no time info provided in this file so we assume earliest time of day
+                pl.col("ADMIDATE").cast(pl.Datetime).alias("hospital_admission_datetime"),
+                # no time info provided in this file so we assume latest time of day
+                (
+                    pl.col("DISDATE").cast(pl.Datetime) + pl.duration(hours=23, minutes=59, seconds=59)
+                ).alias("hospital_discharge_datetime"),
+                hospital_stay_type=pl.lit("APC", hospital_stay_type_enum),
+            )
+            .select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("hospital_admission_datetime"),
+                pl.col("hospital_discharge_datetime"),
+                pl.col("hospital_stay_type"),
+            )
+        )
+
+        hes_2024_10_APC = (
+            pl.scan_csv(
+                AnyPath(config.nhse_data_path, "2024_10/HES/FILE0220459_NIC338864_HES_APC_202399.txt"),
+                separator="|",
+                infer_schema=False,
+                schema_overrides=HES_APC_SCHEMA,
+                null_values=[""],
+            )
+            .TRE
+            .filter_with_logging(
+                pl.col("ADMIDATE").is_not_null(),
+                label="EXCLUDE NULL ADMIDATE"
+            )
+            .with_columns(
+                pl.col("STUDY_ID").alias("pseudo_nhs_number"),
+                # no time info provided in this file so we assume earliest time of day
+                pl.col("ADMIDATE").cast(pl.Datetime).alias("hospital_admission_datetime"),
+                # no time info provided in this file so we assume latest time of day
+                (
+                    pl.col("DISDATE").cast(pl.Datetime) + pl.duration(hours=23, minutes=59, seconds=59)
+                ).alias("hospital_discharge_datetime"),
+                hospital_stay_type=pl.lit("APC", hospital_stay_type_enum),
+            )
+            .select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("hospital_admission_datetime"),
+                pl.col("hospital_discharge_datetime"),
+                pl.col("hospital_stay_type"),
+            )
+        )
+
+        hes_2025_03_APC_txts = (
+            pl.scan_csv(
+                [
+                AnyPath(config.nhse_data_path, "2025_03/HES/*APC*.txt"),
+
+                        ],
+                separator="|",
+                infer_schema=False,
+                schema_overrides=HES_APC_SCHEMA,
+                null_values=[""],
+            )
+            .TRE
+            .filter_with_logging(
+                pl.col("ADMIDATE").is_not_null(),
+                label="EXCLUDE NULL ADMIDATE"
+            )
+            .with_columns(
+                pl.col("STUDY_ID").alias("pseudo_nhs_number"),
+                # no time info provided in this file so we assume earliest time of day
+                pl.col("ADMIDATE").cast(pl.Datetime).alias("hospital_admission_datetime"),
+                # no time info provided in this file so we assume latest time of day
+                (
+                    pl.col("DISDATE").cast(pl.Datetime) + pl.duration(hours=23, minutes=59, seconds=59)
+                ).alias("hospital_discharge_datetime"),
+                hospital_stay_type=pl.lit("APC", hospital_stay_type_enum),
+            )
+            .select(
+                pl.col("pseudo_nhs_number"),
+                pl.col("hospital_admission_datetime"),
+                pl.col("hospital_discharge_datetime"),
+                pl.col("hospital_stay_type"),
+            )
+
+        )
+
+        hes_concat_unfiltered = (
+            pl.concat(
+               [
+                   hes_2021_09_APC_txts,
+                   hes_2023_07_APC_txts,
+                   hes_2023_07_APC_csvs,
+                   hes_2024_10_APC,
+                   hes_2025_03_APC_txts,
+               ]
+            )
+           .TRE
+            .unique_with_logging()
+            .with_columns(
+                pl.concat_list(
+                    pl.col("hospital_stay_type").cast(region_types_enum)
+                )
+                .alias("region_types")
+            )
+        ) # shape: pre-unique (942_302, 5); post-unique (345_918, 5)
+
+        (
+            hes_concat_unfiltered
+            # sorted by person for the person index (see `person_index.py`)
+            .sort("pseudo_nhs_number")
+            .pipe(sink_intermediate, config, "hes_apc", combined_hes_path(config))
+        )
+
+    write_person_index(
+        combined_hes_path(config),
+        {combined_hes_path(config): scan_intermediate(combined_hes_path(config)).pipe(encode_person_id, config)},
+    )
+
+    hes_audit.write(
+        AnyPath(
+            config.logs_path,
+            f"{config.yr}_{config.mon}_HES_APC_row_count_audit.parquet"
+        )
+    )
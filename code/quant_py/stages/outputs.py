@@ -0,0 +1,421 @@
+# Final outputs from the post 10 day windowing reference file: per trait readings and per individual stats,
+# per trait plots, and regenie phenotype and covariate files.  Each comes in three versions, see
+# `REGION_CATEGORY_FILTERS`.
+
+from collections.abc import Callable
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from ..columns import TARGET_TRAIT_PER_INDIVIDUAL_STATS_COLUMNS, TARGET_TRAIT_READINGS_AT_INDIVIDUAL_TIMEPOINTS_COLUMNS
+from ..config import RunConfig
+from ..dag import stage
+from ..filters import REGION_CATEGORY_FILTERS
+from ..linkage import valid_regenie_51k, valid_regenie_55k
+from ..persons import decode_person_ids
+from ..tre import TREStage
+from .traits import post_10d_windowing_path
+
+GNH_PALETTE = {
+    "COBALT_BLUE": "#32449b",
+    "EMERALD_GREEN": "#45c086",
+    "MAGENTA": "#c44887",
+    "PEACH_ORANGE": "#ff8070",
+    "INDIGO_PURPLE": "#312849",
+}
+
+
+def post_10d_windowing(config: RunConfig) -> pl.LazyFrame:
+    """The `post_10d_windowing` reference file all outputs are derived from."""
+    return pl.scan_parquet(post_10d_windowing_path(config))
+
+
+def _region_category_outputs(path: Callable[[RunConfig], AnyPath], suffix: str) -> Callable[[RunConfig], list[AnyPath]]:
+    """Declared outputs: `{path}/<region_category>/{yr}_{mon}_<trait>_<region_category>{suffix}` files."""
+    return lambda config: [AnyPath(path(config), "*", f"{config.yr}_{config.mon}_*{suffix}")]
+
+
+@stage(
+    "individual_trait_readings_at_unique_timepoints",
+    inputs=lambda config: [post_10d_windowing_path(config)],
+    outputs=_region_category_outputs(
+        lambda config: config.individual_trait_files_path, "_readings_at_unique_timepoints.csv"
+    ),
+)
+def individual_trait_readings_at_unique_timepoints(config: RunConfig) -> None:
+    """One csv per trait and region category of the windowed readings."""
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing = post_10d_windowing(config)
+
+    with TREStage("individual_trait_readings_at_unique_timepoints") as telemetry:
+        for region_category, FILTER in REGION_CATEGORY_FILTERS.items():
+            for (trait, ), df in (
+                combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing
+                .filter(
+                    FILTER
+                )
+                .select(
+                    TARGET_TRAIT_READINGS_AT_INDIVIDUAL_TIMEPOINTS_COLUMNS
+                )
+                .pipe(decode_person_ids, config)
+                .collect()
+                .group_by("trait")):
+                        output_path = AnyPath(
+                            config.individual_trait_files_path,
+                            region_category,
+                            f"{config.yr}_{config.mon}_{trait}_{region_category}_readings_at_unique_timepoints.csv"
+                        )
+                        df.write_csv(output_path)
+                        telemetry.record_output(output_path, rows=df.height)
+
+
+@stage(
+    "individual_trait_per_individual_stats",
+    inputs=lambda config: [post_10d_windowing_path(config)],
+    outputs=_region_category_outputs(lambda config: config.individual_trait_files_path, "_per_individual_stats.csv"),
+)
+def individual_trait_per_individual_stats(config: RunConfig) -> None:
+    """One csv per trait and region category of each individual's median/mean/min/max/earliest/latest values."""
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing = post_10d_windowing(config)
+
+    with TREStage("individual_trait_per_individual_stats") as telemetry:
+        for region_category, FILTER in REGION_CATEGORY_FILTERS.items():
+            per_trait_per_individual_stats = (
+                combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing
+                .filter(FILTER)
+                .group_by(["person_id", "trait", "minmax_outlier"])
+                .agg(
+                    pl.col("value").median().alias("median"),
+                    pl.col("value").mean().alias("mean"),
+                    pl.col("value").max().alias("max"),
+                    pl.col("value").min().alias("min"),
+                    pl.col("value").filter(pl.col("date").eq(pl.col("date").min())).first().alias("earliest"),
+                    pl.col("value").filter(pl.col("date").eq(pl.col("date").max())).first().alias("latest"),
+                    pl.count("value").alias("n")
+                )
+
+                .select(
+                    *TARGET_TRAIT_PER_INDIVIDUAL_STATS_COLUMNS
+                )
+                .pipe(decode_person_ids, config)
+                .collect()
+            )
+
+            for (trait, ), df in per_trait_per_individual_stats.group_by("trait"):
+                output_path = AnyPath(
+                    config.individual_trait_files_path,
+                    region_category,
+                    f"{config.yr}_{config.mon}_{trait}_{region_category}_per_individual_stats.csv"
+                )
+                df.write_csv(output_path)
+                telemetry.record_output(output_path, rows=df.height)
+
+
+def gender_plot_for_trait(config: RunConfig, trait: str, df: pl.DataFrame, region_category: str) -> None:
+    """Saves the by-gender histogram of log10 `trait` values in `df` as svg."""
+    import altair as alt # plotting is optional; only needed by `individual_trait_gender_plots`
+    alt.data_transformers.enable("vegafusion")
+
+    plot_data = (
+        df
+    )
+    median_value = plot_data.get_column("value").median()
+    mean_value = plot_data.get_column("value").mean()
+    min_value = plot_data.get_column("value").min()
+    max_value = plot_data.get_column("value").max()
+    n = plot_data.get_column("person_id").n_unique()
+    observation_count = plot_data.shape[0]
+    units = plot_data.get_column("unit").first()
+    ###Save  Plot
+    (
+        alt.Chart(
+            plot_data,
+            title=alt.Title(
+                 f"{trait} [{region_category}]",
+                subtitle=[
+                    f"Median: {median_value: .1f}",
+                    f"Mean: {mean_value: .1f}",
+                    f"Min: {min_value}",
+                    f"Max: {max_value}",
+                    f"n individuals: {n:,}",
+                    f"n observations: {observation_count:,}",
+                ],
+                anchor="start",
+                frame="group",
+            )
+        )
+        .mark_bar(stroke="black")
+        .encode(
+            alt.X("log_x:Q").bin(maxbins=48).title(f"Log10 {trait} ({units})"),#.scale(type="log"),
+            alt.Y("count()").title(None),
+            alt.Color("gender:N")
+            .scale(
+                range=[GNH_PALETTE["EMERALD_GREEN"], GNH_PALETTE["COBALT_BLUE"]],
+                domain=["F","M"]
+            ),
+            row="gender:N"
+
+        )
+        .properties(height=200, width=800)
+    ).save(
+        AnyPath(
+            config.individual_trait_plots_path,
+            region_category,
+            f"{config.yr}_{config.mon}_{trait.replace(' ','_')}_{region_category}.svg"
+        ),
+        format="svg"
+    )
+
+
+@stage(
+    "individual_trait_gender_plots",
+    inputs=lambda config: [post_10d_windowing_path(config)],
+    outputs=lambda config: [AnyPath(config.individual_trait_plots_path, "*", f"{config.yr}_{config.mon}_*.svg")],
+)
+def individual_trait_gender_plots(config: RunConfig) -> None:
+    """One histogram per trait and region category, split by gender."""
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing = post_10d_windowing(config)
+
+    post_qc_histogram_data = (
+        combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing
+        .with_columns(
+            pl.col("gender").cast(pl.Utf8).alias("gender"),
+            pl.col("value").replace(0,1e-10).log10().alias("log_x")
+        )
+        .filter(
+            pl.col("trait").is_not_null(),
+        )
+        .select(
+            pl.col("person_id"),
+            pl.col("trait"),
+            pl.col("value"),
+            pl.col("unit"),
+            pl.col("log_x"),
+            pl.col("gender"),
+            pl.col("region_types"),
+        )
+        .collect()
+    )
+
+    with TREStage("individual_trait_gender_plots") as telemetry:
+        for region_category, FILTER in REGION_CATEGORY_FILTERS.items():
+            print(region_category)
+            for (trait, ), df in post_qc_histogram_data.group_by("trait"):
+                df_filtered = df.filter(FILTER)
+                if df_filtered.is_empty():
+                    print(f"\t{trait} {region_category}: No readings, skipping...")
+                    continue
+                print(f"\t{trait}")
+                gender_plot_for_trait(config, trait, df_filtered, region_category=region_category)
+
+
+@stage(
+    "regenie_51k_phenotypes",
+    inputs=lambda config: [post_10d_windowing_path(config), config.mega_linkage_path],
+    outputs=_region_category_outputs(lambda config: config.regenie_path, "_regenie_51koct2024_GSA_Topmed_pheno.tsv"),
+)
+def regenie_51k_phenotypes(config: RunConfig) -> None:
+    """regenie phenotype files (median/min/max per trait) for the 51k GSA TOPMed imputed volunteers."""
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing = post_10d_windowing(config)
+
+    with TREStage("regenie_51k_phenotypes") as telemetry:
+        regenie_51k_data = (
+            combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing
+            .join(
+                valid_regenie_51k(config),
+                on="person_id",
+                how="inner"
+            )
+            .collect()
+        )
+
+        for region_category, FILTER in REGION_CATEGORY_FILTERS.items():
+            for trait_name, group in (
+                regenie_51k_data
+                .filter(FILTER)
+                .group_by("trait")
+            ):
+                trait = trait_name[0].replace(" ","_")
+
+                output_path = AnyPath(
+                    config.regenie_path,
+                    region_category,
+                    f"{config.yr}_{config.mon}_{trait}_{region_category}_regenie_51koct2024_GSA_Topmed_pheno.tsv"
+                )
+                phenotypes = (
+                    group.select(
+                        pl.lit("1").alias("FID"),
+                        pl.col("gsa_id").alias("IID"),
+                        pl.col("value").median().over("gsa_id").alias(f"{trait}.median"),
+                        pl.col("value").min().over("gsa_id").alias(f"{trait}.min"),
+                        pl.col("value").max().over("gsa_id").alias(f"{trait}.max"),
+                    )
+                    .unique()
+                )
+                phenotypes.write_csv(output_path, separator="\t")
+                telemetry.record_output(output_path, rows=phenotypes.height)
+
+
+@stage(
+    "regenie_55k_phenotypes",
+    inputs=lambda config: [post_10d_windowing_path(config), config.mega_linkage_path],
+    outputs=_region_category_outputs(lambda config: config.regenie_path, "_regenie_55k_BroadExomeIDs_pheno.tsv"),
+)
+def regenie_55k_phenotypes(config: RunConfig) -> None:
+    """regenie phenotype files (median/min/max per trait) for the 55k Broad exome-sequenced volunteers."""
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing = post_10d_windowing(config)
+
+    with TREStage("regenie_55k_phenotypes") as telemetry:
+        regenie_55k_data = (
+            combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing
+            .join(
+                valid_regenie_55k(config),
+                on="person_id",
+                how="inner"
+            )
+            .collect()
+        )
+
+        for region_category, FILTER in REGION_CATEGORY_FILTERS.items():
+            for trait_name, group in regenie_55k_data.group_by("trait"):
+                trait = trait_name[0].replace(" ","_")
+
+                output_path = AnyPath(
+                    config.regenie_path,
+                    region_category,
+                    f"{config.yr}_{config.mon}_{trait}_{region_category}_regenie_55k_BroadExomeIDs_pheno.tsv"
+                )
+                phenotypes = (
+                    group.select(
+                        pl.lit("1").alias("FID"),
+                        pl.col("exome_id").alias("IID"),
+                        pl.col("value").median().over("exome_id").alias(f"{trait}.median"),
+                        pl.col("value").min().over("exome_id").alias(f"{trait}.min"),
+                        pl.col("value").max().over("exome_id").alias(f"{trait}.max"),
+                    )
+                    .unique()
+                )
+                phenotypes.write_csv(output_path, separator="\t")
+                telemetry.record_output(output_path, rows=phenotypes.height)
+
+
+@stage(
+    "regenie_51k_age_at_test_covariates",
+    inputs=lambda config: [post_10d_windowing_path(config), config.mega_linkage_path],
+    outputs=lambda config: [
+        AnyPath(
+            config.regenie_covariate_files_path,
+            f"{config.yr}_{config.mon}_*_regenie_51koct2024_GSA_Topmed_age_at_test_megawide.tsv"
+        )
+    ],
+)
+def regenie_51k_age_at_test_covariates(config: RunConfig) -> None:
+    """regenie age at test covariates (one column per trait and statistic) for the 51k volunteers."""
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing = post_10d_windowing(config)
+
+    with TREStage("regenie_51k_age_at_test_covariates") as telemetry:
+        for region_category, FILTER in REGION_CATEGORY_FILTERS.items():
+            # Create a dictionary of region_category filtered dataframe
+            regenie_51k_data_megawide_age_at_test_partitioned_dict = (
+                combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing
+                .filter(FILTER)
+                .join(
+                    valid_regenie_51k(config),
+                    on="person_id",
+                    how="inner"
+                )
+                .select(
+                    pl.lit("1").alias("FID"),
+                    pl.col("gsa_id").alias("IID"),
+                    pl.col("trait"),
+                    pl.col("age_at_test").round(1).alias("AgeAtTest"),
+                    pl.col("age_at_test").pow(2).round(1).alias("AgeAtTest_Squared")
+                )
+                .collect()
+                .partition_by("trait", as_dict=True)
+            )
+
+            # Write the covariate file
+            output_path = AnyPath(
+                config.regenie_covariate_files_path,
+                f"{config.yr}_{config.mon}_{region_category}_regenie_51koct2024_GSA_Topmed_age_at_test_megawide.tsv"
+            )
+            covariates = (
+                pl.concat([
+                    lzdf
+                    .group_by(["FID", "IID"])
+                    .agg(
+                        pl.col("AgeAtTest").min().round(1).alias(f"AgeAtTest.{trait}.min"),
+                        pl.col("AgeAtTest_Squared").min().round(1).alias(f"AgeAtTest_Squared.{trait}.min"),
+                        pl.col("AgeAtTest").median().round(1).alias(f"AgeAtTest.{trait}.median"),
+                        pl.col("AgeAtTest_Squared").median().round(1).alias(f"AgeAtTest_Squared.{trait}.median"),
+                        pl.col("AgeAtTest").max().round(1).alias(f"AgeAtTest.{trait}.max"),
+                        pl.col("AgeAtTest_Squared").max().round(1).alias(f"AgeAtTest_Squared.{trait}.max"),
+                    )
+
+                    for (trait, ), lzdf in sorted(regenie_51k_data_megawide_age_at_test_partitioned_dict.items())
+                ],
+                how="align")
+                )
+            covariates.write_csv(output_path, separator="\t", null_value="NA")
+            telemetry.record_output(output_path, rows=covariates.height)
+
+
+@stage(
+    "regenie_55k_age_at_test_covariates",
+    inputs=lambda config: [post_10d_windowing_path(config), config.mega_linkage_path],
+    outputs=lambda config: [
+        AnyPath(
+            config.regenie_covariate_files_path,
+            f"{config.yr}_{config.mon}_*_regenie_55k_BroadExomeIDs_age_at_test_megawide.tsv"
+        )
+    ],
+)
+def regenie_55k_age_at_test_covariates(config: RunConfig) -> None:
+    """regenie age at test covariates (one column per trait and statistic) for the 55k volunteers."""
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing = post_10d_windowing(config)
+
+    with TREStage("regenie_55k_age_at_test_covariates") as telemetry:
+        for region_category, FILTER in REGION_CATEGORY_FILTERS.items():
+
+            regenie_55k_data_megawide_age_at_test_partitioned_dict = (
+                combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing
+                .filter(FILTER)
+                .join(
+                    valid_regenie_55k(config),
+                    on="person_id",
+                    how="inner"
+                )
+                .select(
+                    pl.lit("1").alias("FID"),
+                    pl.col("exome_id").alias("IID"),
+                    pl.col("trait"),
+                    pl.col("age_at_test").round(1).alias("AgeAtTest"),
+                    pl.col("age_at_test").pow(2).round(1).alias("AgeAtTest_Squared")
+                )
+                .collect()
+                .partition_by("trait", as_dict=True)
+            )
+
+            output_path = AnyPath(
+                config.regenie_covariate_files_path,
+                f"{config.yr}_{config.mon}_{region_category}_regenie_55k_BroadExomeIDs_age_at_test_megawide.tsv"
+            )
+            covariates = (
+                pl.concat([
+                    lzdf
+                    .group_by(["FID", "IID"])
+                    .agg(
+                        pl.col("AgeAtTest").min().round(1).alias(f"AgeAtTest.{trait}.min"),
+                        pl.col("AgeAtTest_Squared").min().round(1).alias(f"AgeAtTest_Squared.{trait}.min"),
+                        pl.col("AgeAtTest").median().round(1).alias(f"AgeAtTest.{trait}.median"),
+                        pl.col("AgeAtTest_Squared").median().round(1).alias(f"AgeAtTest_Squared.{trait}.median"),
+                        pl.col("AgeAtTest").max().round(1).alias(f"AgeAtTest.{trait}.max"),
+                        pl.col("AgeAtTest_Squared").max().round(1).alias(f"AgeAtTest_Squared.{trait}.max"),
+                    )
+
+                    for (trait, ), lzdf in sorted(regenie_55k_data_megawide_age_at_test_partitioned_dict.items())
+                ],
+                how="align")
+                )
+            covariates.write_csv(output_path, separator="\t", null_value="NA")
+            telemetry.record_output(output_path, rows=covariates.height)
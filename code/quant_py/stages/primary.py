@@ -0,0 +1,58 @@
+# Primary care: the NHS England National Diabetes Audit (NDA) pulls and combining them with the Discovery extracts.
+#
+# The Discovery extracts are declared in `provenances/discovery.toml`, the NDA pulls in `provenances/nda.toml`
+# (one stage per pull, see `nda.py`).
+
+import functools
+
+from cloudpathlib import AnyPath
+
+from ..config import RunConfig
+from ..dag import stage
+from ..fingerprints import stage_signature
+from ..intermediates import intermediate_path, sink_intermediate
+from ..merge import merged
+from ..nda import NDA_CODE_MODULES, nda_arrow_path, nda_raw_files_pattern, sink_nda
+from ..provenance import provenance_arrow_path
+from ..sources import NDA_SPECS, PROVENANCE_SPECS
+
+
+for _nda_key, _spec in NDA_SPECS.items():
+    stage(
+        _nda_key,
+        inputs=lambda config, spec=_spec: [nda_raw_files_pattern(config, spec)],
+        outputs=lambda config, spec=_spec: [nda_arrow_path(config, spec)],
+        description=_spec.get("description", ""),
+        signature=lambda config, spec=_spec: stage_signature(spec, NDA_CODE_MODULES),
+    )(functools.partial(sink_nda, spec=_spec))
+
+
+def combined_primary_care_path(config: RunConfig) -> AnyPath:
+    return intermediate_path(
+        config,
+        "primary_care_combined",
+        config.combined_datasets_arrow_path,
+        f"{config.yr}_{config.mon}_Combined_primary_care",
+    )
+
+
+@stage(
+    "primary_care_combined",
+    inputs=lambda config: [
+        *(provenance_arrow_path(config, spec) for spec in PROVENANCE_SPECS["discovery"].values()),
+        *(nda_arrow_path(config, spec) for spec in NDA_SPECS.values()),
+    ],
+    outputs=lambda config: [combined_primary_care_path(config)],
+)
+def primary_care_combined(config: RunConfig) -> None:
+    """All Discovery extracts and the NDA readings merged on the fingerprint (see `merge.py`)."""
+    with merged(
+        config,
+        "primary_care_combined",
+        AnyPath(config.primary_arrow_path, "20*_Discovery_path.arrow"),
+        *(nda_arrow_path(config, spec) for spec in NDA_SPECS.values()),
+    ) as lf:
+        (
+            lf
+            .pipe(sink_intermediate, config, "primary_care_combined", combined_primary_care_path(config))
+        )
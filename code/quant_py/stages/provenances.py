@@ -0,0 +1,31 @@
+# One stage per provenance spec in `provenances/*.toml`, run by the generic engine (see `provenance.py`).  A change
+# to a stage's spec, to the engine's code or to the file(s) of its result rules (`rules/*.toml`, declared as inputs)
+# re-runs it (see `pipeline.py`).
+
+import functools
+
+from cloudpathlib import AnyPath
+
+from ..config import RunConfig
+from ..dag import stage
+from ..fingerprints import stage_signature
+from ..provenance import PROVENANCE_CODE_MODULES, provenance_arrow_path, raw_files_pattern, sink_provenance
+from ..result_rules import rule_files
+from ..sources import PROVENANCE_SPECS
+
+
+def provenance_inputs(config: RunConfig, spec: dict) -> list[AnyPath]:
+    """The raw file(s) of provenance `spec` and the file(s) of its result rules."""
+    rules = rule_files(spec["result_rules"]) if "result_rules" in spec else []
+    return [raw_files_pattern(config, spec), *(AnyPath(path) for path in rules)]
+
+
+for _specs in PROVENANCE_SPECS.values():
+    for _provenance_key, _spec in _specs.items():
+        stage(
+            _provenance_key,
+            inputs=functools.partial(provenance_inputs, spec=_spec),
+            outputs=lambda config, spec=_spec: [provenance_arrow_path(config, spec)],
+            description=_spec.get("description", ""),
+            signature=lambda config, spec=_spec: stage_signature(spec, PROVENANCE_CODE_MODULES),
+        )(functools.partial(sink_provenance, spec=_spec))
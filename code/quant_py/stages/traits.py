@@ -0,0 +1,422 @@
+# Traits: matching readings to traits (via their aliases), unit conversion, range checks, restriction to valid
+# volunteers and their demographics, then 10 day windowing.
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+from ..columns import TARGET_COMBO_POST_10D_WINDOWING_COLUMNS
+from ..config import RunConfig
+from ..dag import stage
+from ..datasets import dataset_files, scan_dataset, sink_dataset
+from ..filters import (
+    EXCLUDE_NULL_UNITS,
+    EXCLUDE_READINGS_WITH_IMPLAUSIBLE_DATES,
+    EXCLUDE_READINGS_WITH_INDIVS_UNDER_SIXTEEN,
+    EXCLUDE_READINGS_WITH_VALUES_OUTSIDE_EXPECTED_RANGE,
+)
+from ..hes import combined_hes_path, hes_final_admission_windows
+from ..linkage import valid_demographics, valid_pseudo_nhs_numbers
+from ..person_index import person_index_path
+from ..traits import check_units_converter, range_enum, trait_aliases_long, traits_denormalised, units_converter
+from ..tre import TREAudit
+from ..utils import display_with
+from .combine import combined_all_sources_path
+
+
+def pre_10d_windowing_path(config: RunConfig) -> AnyPath:
+    # a partitioned dataset (see `datasets.py`)
+    return AnyPath(
+        config.reference_combo_files_path,
+        f"{config.yr}_{config.mon}_Combined_traits_NHS_and_demographics_restricted_pre_10d_windowing"
+    )
+
+
+def post_10d_windowing_path(config: RunConfig) -> AnyPath:
+    return AnyPath(
+        config.reference_combo_files_path,
+        f"{config.yr}_{config.mon}_Combined_traits_NHS_and_demographics_restricted_post_10d_windowing.parquet"
+    )
+
+
+def combo(config: RunConfig) -> pl.LazyFrame:
+    """The `Combined_all_sources` reference dataset."""
+    return scan_dataset(combined_all_sources_path(config))
+
+
+def combo_with_hes_region_types_column(config: RunConfig) -> pl.LazyFrame:
+    """
+    `combo` with the `region_types` (APC, buffer_before, buffer_after) of the HES admission windows each
+    reading's `test_date` falls in (null when out of hospital).
+    """
+    combo_dates_to_HES_region_lookup = (
+        combo(config)
+        .select(
+            pl.col("person_id"),
+            pl.col("test_date")
+        )
+        .unique()
+        .join_where(
+            hes_final_admission_windows(config),
+            pl.col("person_id").eq(pl.col("person_id_right"))
+            & pl.col("test_date").is_between(pl.col("start_date"), pl.col("end_date"), closed="left")
+        )
+        .select(
+            pl.col("person_id"),
+            pl.col("test_date"),
+            pl.col("region_types"),
+        )
+    )
+
+    return (
+        combo(config)
+        .join(
+            combo_dates_to_HES_region_lookup,
+            on=["person_id", "test_date"],
+            how="left",
+            validate="m:1"
+        )
+    )
+
+
+def combo_strict_trait_ranged(config: RunConfig, audit: TREAudit | None = None) -> pl.LazyFrame:
+    """
+    `combo_with_hes_region_types_column` joined to the traits, with the readings converted to the trait's
+    target units (`final`) and their position relative to the trait's accepted range (`range_position`).
+
+    The aliases and units of the join keys are cast to the `Enum`s of `combo` (aliases and units not in the
+    string dictionary, so in no reading, become null), so that both joins compare integer codes.
+    """
+    combo_schema = combo(config).collect_schema()
+    combo_strict_trait = (
+        combo_with_hes_region_types_column(config)
+            .join(
+                traits_denormalised(config)
+                .with_columns(
+                    pl.col("alias").cast(combo_schema["original_term"], strict=False)
+                ),
+                left_on=pl.col("original_term"),
+                right_on=pl.col("alias"),
+                how="left",
+            )
+    )
+    units_converter_encoded = (
+        units_converter(config)
+        .with_columns(
+            pl.col("result_value_units").cast(combo_schema["result_value_units"], strict=False)
+        )
+    )
+
+    return (
+        combo_strict_trait
+        ### Here we exclude all reading with null units
+        ### There are a number of traits we wish to recover in which either truly have no units
+        ### or in which we assume a unit for nulls
+        ### We deal with unitless traits in a bespoke per trait fashion above
+        ### (e.g. Blood_ketones' unitless POCT vals)
+        .TRE
+        .filter_with_logging(
+            EXCLUDE_NULL_UNITS,
+            label="EXCLUDE_NULL_UNITS",
+            audit=audit,
+        )
+
+        # This is where we allow result_value_units to be converted
+        # this allow for both "value modifying converstions" (e.g. nmol -> mmol by divide by 1,000)
+        # and for unit format converstion (e.g. MMOL/MOL -> mmol/mol)
+        .join(units_converter_encoded, left_on=["result_value_units", "target_units"], right_on=["result_value_units", "target"], how="left", coalesce=False) # shape: (69_727_105, 15)
+        .with_columns(
+            pl.col("multiplication_factor")
+        )
+
+        # values conversions according to
+        # 1) HbA1c formula, and
+        # 2) multiplication_factor
+
+        ### Aim to separate out these two...
+        .with_columns(
+            pl.when(
+                pl.col("trait").eq("HbA1c") &
+                pl.col("result_value_units").is_in(["%", "% total Hb","%Hb", "per cent"]),
+            )
+            .then(
+                (10.93 * pl.col("result") - 23.50)
+            )
+            .when(
+                pl.col("multiplication_factor").ne(1)
+            )
+            .then(
+                (pl.col("result") * pl.col("multiplication_factor"))
+            )
+            .otherwise(
+                pl.col("result")
+            )
+            .alias("final")
+        )
+
+        # categorise according to min/max range bounds:
+        .with_columns(
+            pl.when(
+                pl.col("final") < pl.col("min")
+            )
+            .then(
+                pl.lit("below_min").cast(range_enum)
+            )
+            .when(
+                pl.col("final").is_between(
+                    pl.col("min"),
+                    pl.col("max"),
+                    closed="both"
+                )
+            )
+            .then(
+                pl.lit("ok").cast(range_enum)
+            )
+            .when(
+                pl.col("final") > pl.col("max")
+            )
+            .then(
+                pl.lit("above_max").cast(range_enum)
+            )
+            .otherwise(
+                None
+            )
+            .alias("range_position")
+
+        )
+        .with_columns(
+            pl.col("final").replace(0,1e-10).log10().alias("final_log10")
+        )
+    )
+
+
+def _combo_inputs(config: RunConfig) -> list[AnyPath]:
+    return [dataset_files(combined_all_sources_path(config)), combined_hes_path(config)]
+
+
+@stage(
+    "units_counts",
+    inputs=_combo_inputs,
+    outputs=lambda config: [
+        AnyPath(config.logs_path, f"{config.yr}_{config.mon}_units_counts_all_terms.csv"),
+        AnyPath(config.logs_path, f"{config.yr}_{config.mon}_units_counts_all_terms.parquet"),
+    ],
+)
+def units_counts(config: RunConfig) -> None:
+    """Number of individuals per `original_term` and `result_value_units`, written to the logs."""
+    all_counts = (
+        combo_with_hes_region_types_column(config)
+        .select(
+            pl.col("person_id"),
+            pl.col("original_term"),
+            pl.col("result_value_units"),
+        )
+        .unique()
+        .group_by(
+            [
+                pl.col("original_term"),
+                pl.col("result_value_units"),
+            ]
+        )
+        .agg(
+            pl.len().alias("n")
+        )
+        .sort("n", descending=True)
+
+    )
+
+    (
+        all_counts
+    #     .filter(
+    #         pl.col("n") > 1 # It may prove insightful to look at n == 1 during development.
+    #     )
+        .TRE
+        .sink_csv(
+            AnyPath(
+                config.logs_path,
+                f"{config.yr}_{config.mon}_units_counts_all_terms.csv"
+            )
+        )
+    )
+
+    (
+        all_counts
+    #     .filter(
+    #         pl.col("n") > 1 # It may prove insightful to look at n == 1 during development.
+    #     )
+        .TRE
+        .sink_parquet(
+            AnyPath(
+                config.logs_path,
+                f"{config.yr}_{config.mon}_units_counts_all_terms.parquet"
+            )
+        )
+    )
+
+
+@stage(
+    "unrecovered_traits",
+    inputs=lambda config: [*_combo_inputs(config), config.trait_aliases_long_path],
+    outputs=lambda config: [AnyPath(config.logs_path, f"{config.yr}_{config.mon}_unrecovered_traits.arrow")],
+    optional=True,
+)
+def unrecovered_traits(config: RunConfig) -> None:
+    """
+    `original_term`s not matching any trait alias.  Use this as sanity check and/or to see if any immediate
+    TRAITS worth considering.
+    """
+    combo_traits_anti_case_sensitive = (
+        combo_with_hes_region_types_column(config)
+            .select(pl.col("original_term"))
+            .join(
+                trait_aliases_long(config),
+                left_on=pl.col("original_term").cast(pl.Utf8).str.strip_chars(),
+                right_on="alias",
+                how="anti",
+            )
+        .group_by("original_term")
+        .agg(pl.len())
+        .sort(by="len", descending=True)
+    )
+
+    (
+        combo_traits_anti_case_sensitive
+        .pipe(lambda _lf: display_with(_lf.collect()) or _lf)
+        .TRE
+        .sink_ipc(
+            AnyPath(
+                config.logs_path,
+                f"{config.yr}_{config.mon}_unrecovered_traits.arrow"
+            )
+        )
+
+    )
+
+
+@stage(
+    "pre_10d_windowing",
+    inputs=lambda config: [
+        *_combo_inputs(config),
+        config.unit_conversions_path,
+        config.trait_features_path,
+        config.trait_aliases_long_path,
+        config.mega_linkage_path,
+        config.s1qst_path,
+    ],
+    outputs=lambda config: [pre_10d_windowing_path(config), person_index_path(pre_10d_windowing_path(config))],
+)
+def pre_10d_windowing(config: RunConfig) -> None:
+    """Trait readings of valid volunteers with their demographics, within range and plausible."""
+    check_units_converter(config)
+
+    # Counted when the pre-10d windowing parquet is sunk (see below)
+    combo_audit = TREAudit("Combined_traits_NHS_and_demographics_restricted_pre_10d_windowing")
+
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums = (
+        combo_strict_trait_ranged(config, audit=combo_audit)
+        .join(
+            valid_pseudo_nhs_numbers(config),
+            on="person_id",
+            how="semi"
+        )
+    )
+
+    ## On 2025-05-25:
+    # pre-pseudo_nhs validation = 49_562 volunteers
+    # post-pseudo_nhs validation = 49_541 volunteers (i.e. 21 volunteer data excluded)
+
+    demographics = valid_demographics(config)
+
+    with combo_audit:
+        combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics = (
+            combo_strict_trait_ranged_valid_pseudo_nhs_nums
+            .TRE
+            .join_with_logging(
+                demographics,
+                on="person_id",
+                how="left",
+                label="Adding exome id and OrageneID"
+            )
+            .with_columns(
+                ((pl.col("test_date") - pl.col("dob")).dt.total_days() / 365.25).alias("age_at_test"),
+                pl.col("final").replace(0,1e-10).log10().alias("value_log10")
+            )
+            .TRE
+            .filter_with_logging(
+                EXCLUDE_READINGS_WITH_VALUES_OUTSIDE_EXPECTED_RANGE,
+                label="EXCLUDE_READINGS_WITH_VALUES_OUTSIDE_EXPECTED_RANGE"
+            )
+            .TRE
+            .filter_with_logging(
+                EXCLUDE_READINGS_WITH_IMPLAUSIBLE_DATES,
+                label="EXCLUDE_READINGS_WITH_IMPLAUSIBLE_DATES"
+            )
+            .TRE
+            .filter_with_logging(
+                EXCLUDE_READINGS_WITH_INDIVS_UNDER_SIXTEEN,
+                label="EXCLUDE_READINGS_WITH_INDIVS_UNDER_SIXTEEN"
+            )
+
+        #     .collect()
+        )
+
+        (
+            combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics
+            .pipe(sink_dataset, "pre_10d_windowing", pre_10d_windowing_path(config))
+        )
+
+    combo_audit.write(
+        AnyPath(
+            config.logs_path,
+            f"{config.yr}_{config.mon}_{combo_audit.name}_row_count_audit.parquet"
+        )
+    )
+
+
+@stage(
+    "post_10d_windowing",
+    inputs=lambda config: [dataset_files(pre_10d_windowing_path(config))],
+    outputs=lambda config: [post_10d_windowing_path(config)],
+)
+def post_10d_windowing(config: RunConfig) -> None:
+    """One reading per individual, trait and value in each 10 day window."""
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics = scan_dataset(pre_10d_windowing_path(config))
+
+    combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing = (
+        combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics
+        .filter(
+            pl.col("final").is_not_null()
+        )
+        .with_columns(
+            pl.col("test_date").alias("window_date")
+        )
+        .sort("window_date")
+        .group_by_dynamic(
+            index_column="window_date",
+            every="11d",
+            period="10d",
+            closed="both",
+            group_by=["person_id", "trait", "final"]
+        )
+        .agg(
+            pl.all().first()
+        )
+        .rename(
+            {
+                "target_units":"unit",
+                "final":"value",
+                "test_date":"date",
+                'range_position':"minmax_outlier",
+            }
+        )
+        .select(
+            TARGET_COMBO_POST_10D_WINDOWING_COLUMNS
+        )
+    )
+
+    (
+        combo_strict_trait_ranged_valid_pseudo_nhs_nums_plus_demographics_with_10d_windowing
+        .TRE
+        .sink_parquet(
+            post_10d_windowing_path(config)
+        )
+    )
@@ -0,0 +1,132 @@
+# Trait data from the input files.
+#
+# TRAIT_ALIASES_LONG and TRAIT_FEATURES are the result of many iterations/revisions/manual corrections and
+# clinical decisions.  They were originally derived from the QUANT_R version.  Processing code can be found in
+# older versions of `quant_by_pipeline`.  For extraction of further/new traits consider using
+# `trait_augmenter_SR_v0_3.ipynb`.
+
+import polars as pl
+
+from .config import RunConfig
+from .dictionary import update_dictionary
+
+range_enum = pl.Enum(["below_min", "ok", "above_max"])
+
+
+def target_units_enum(config: RunConfig) -> pl.Enum:
+    """
+    Units Enum from the `unit_conversions` file.
+
+    Here we restrict possible **target** units to the ones defined (and approved) in `units_conversions`.  This
+    acts as an additional QC step.
+    """
+    return pl.Enum(
+        pl.scan_csv(
+            config.unit_conversions_path
+        )
+        .select(
+            pl.col("target")
+        )
+        .unique()
+        .sort(by="target") # we should think about the sort order.
+        .collect()
+    )
+
+
+def units_converter(config: RunConfig) -> pl.LazyFrame:
+    """
+    The unit converting table (QUANT_R UNITS_MODIFIED renamed to UNIT_CONVERSIONS), e.g.
+    ```
+    result_value_units,target,multiplication_factor
+    Grams/decilitre,g/L,10
+    ```
+    Target units are restricted to `target_units_enum`.
+    """
+    return (
+        pl.scan_csv(
+            config.unit_conversions_path,
+            infer_schema=False,
+            schema_overrides={
+                "target": target_units_enum(config),
+                "multiplication_factor": pl.Float64,
+            }
+        )
+    )
+
+
+def check_units_converter(config: RunConfig) -> None:
+    """The `units_converter` table should not have duplicated rows in it; prints any it finds."""
+    converter = units_converter(config).collect()
+    duplicated = converter.is_duplicated()
+    if duplicated.any():
+        print(
+            f'''Duplicate row(s) found in `{config.unit_conversions_path.name}`
+            {converter.filter(duplicated)}
+            '''
+        )
+    else:
+        print(f"Bravo, no duplicates in `{config.unit_conversions_path.name}`")
+
+
+def trait_enum(config: RunConfig) -> pl.Enum:
+    """Trait Enum of the global string dictionary, updated with the traits of the input files."""
+    return update_dictionary(
+        config,
+        "trait",
+        pl.concat(
+            [
+                pl.scan_csv(config.trait_features_path).select(pl.col("trait").cast(pl.Utf8)),
+                pl.scan_csv(config.trait_aliases_long_path).select(pl.col("trait").cast(pl.Utf8)),
+            ]
+        )
+        .unique()
+        .collect()
+        .to_series()
+        .to_list()
+    )
+
+
+def trait_aliases_long(config: RunConfig) -> pl.LazyFrame:
+    """TRAIT, trait_alias pairs, with 1:m TRAIT:alias."""
+    return (
+        pl.scan_csv(
+            config.trait_aliases_long_path,
+        )
+    )
+
+
+def trait_features(config: RunConfig) -> pl.LazyFrame:
+    """
+    One TRAIT per line, details trait name, target units, min value accepted, max value accepted.
+
+    e.g. `HDL-C,millimol/L,0.05,4.65`
+    """
+    return (
+        pl.scan_csv(
+            config.trait_features_path,
+            schema_overrides={
+                "target_units": target_units_enum(config)
+            }
+        )
+    )
+
+
+def traits_denormalised(config: RunConfig) -> pl.LazyFrame:
+    """
+    The Trait : Features file (`traits_feature`) joined with the Trait : Alias file (`trait_aliases_long`), a
+    denormalised table suitable for joining to `combo`, with `trait` cast to `trait_enum`.
+
+    `trait` is cast after the join: the streaming engine (polars 1.31) mis-encodes the other `Enum` columns
+    (`target_units`) of a join on `Enum` keys.
+    """
+    return (
+        trait_features(config)
+        .join(
+            trait_aliases_long(config),
+            on="trait",
+            how="left",
+        )
+        .with_columns(
+            pl.col("trait").cast(trait_enum(config))
+        )
+    )
@@ -0,0 +1,168 @@
+# Bulk copy of the raw data (see `stages/copy.py`): parallel, resumable and verified.
+#
+# The raw extracts are tens of GB each and are copied from the library-red mount (or a bucket) to the VM's disk.
+# `copy_files` copies them in a thread pool (at most `workers` at a time), each in `CHUNK_BYTES` chunks:
+#
+#   - a file is written to `.{name}.part` next to its destination, with a sidecar `.{name}.part.json` recording
+#     the source's size and modification time and the BLAKE2b digest of every chunk written so far, so that an
+#     interrupted copy resumes after its last complete chunk (if the source has not changed since)
+#   - once complete, the `.part` file is read back and its chunk digests compared with those of the source bytes
+#     (its checksum is the digest of the chunk digests), then renamed to the destination
+#   - every completed copy is recorded in a manifest (`raw_datasets/copy_manifest.json`); a file whose source
+#     size and modification time and destination size match its record is skipped
+#
+# Sources may be any `AnyPath` (e.g. a local directory standing in for the bucket); destinations are local.
+
+import datetime
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cloudpathlib import AnyPath
+
+from .config import RunConfig
+
+CHUNK_BYTES = 64 * 2**20
+
+
+def copy_manifest_path(config: RunConfig) -> AnyPath:
+    return AnyPath(config.raw_data_path, "copy_manifest.json")
+
+
+def _chunk_digest(block: bytes) -> str:
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def checksum(chunk_digests: list[str]) -> str:
+    """The checksum of a file copied in chunks: the BLAKE2b digest of its chunk digests."""
+    return hashlib.blake2b("".join(chunk_digests).encode(), digest_size=16).hexdigest()
+
+
+def _stat(path: AnyPath) -> tuple[int, int]:
+    stat = AnyPath(path).stat()
+    return stat.st_size, getattr(stat, "st_mtime_ns", int(stat.st_mtime * 1e9))
+
+
+def _write_json(path: AnyPath, content) -> None:
+    temporary_path = AnyPath(path.parent, f".{path.name}.tmp")
+    temporary_path.write_text(json.dumps(content, indent=2))
+    os.replace(temporary_path, path)
+
+
+def _file_chunk_digests(path: AnyPath, chunk_bytes: int) -> list[str]:
+    with AnyPath(path).open("rb") as file:
+        return [_chunk_digest(block) for block in iter(lambda: file.read(chunk_bytes), b"")]
+
+
+def copy_file(source: AnyPath, destination: AnyPath, chunk_bytes: int = CHUNK_BYTES) -> dict:
+    """
+    Copies `source` to `destination` through a `.part` file, resuming an interrupted copy, and verifies it; returns
+    its manifest record.
+    """
+    source, destination = AnyPath(source), AnyPath(destination)
+    size, mtime_ns = _stat(source)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    part = AnyPath(destination.parent, f".{destination.name}.part")
+    progress_path = AnyPath(destination.parent, f".{destination.name}.part.json")
+    progress = {"source": str(source), "size": size, "mtime_ns": mtime_ns, "chunk_bytes": chunk_bytes, "chunks": []}
+
+    if part.exists() and progress_path.exists():
+        previous = json.loads(progress_path.read_text())
+        if {key: value for key, value in previous.items() if key != "chunks"} == {
+            key: value for key, value in progress.items() if key != "chunks"
+        }:
+            progress = previous
+    offset = len(progress["chunks"]) * chunk_bytes
+    if offset:
+        print(f"Resuming: {source} from byte {offset:,}")
+
+    with source.open("rb") as reader, open(part, "r+b" if offset else "wb") as writer:
+        # drop any incomplete chunk after the last recorded one
+        writer.truncate(offset)
+        writer.seek(offset)
+        reader.seek(offset)
+        while block := reader.read(chunk_bytes):
+            writer.write(block)
+            writer.flush()
+            os.fsync(writer.fileno())
+            progress["chunks"].append(_chunk_digest(block))
+            _write_json(progress_path, progress)
+
+    if _stat(source) != (size, mtime_ns):
+        raise OSError(f"{source} changed while being copied")
+    if _file_chunk_digests(part, chunk_bytes) != progress["chunks"]:
+        part.unlink()
+        progress_path.unlink()
+        raise OSError(f"{destination}: copy does not match {source}, removed")
+
+    os.utime(part, ns=(mtime_ns, mtime_ns))
+    os.replace(part, destination)
+    progress_path.unlink()
+    return {
+        "source": str(source),
+        "destination": str(destination),
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "checksum": checksum(progress["chunks"]),
+        "completed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def is_copied(record: dict | None, source: AnyPath) -> bool:
+    """Whether the copy `record`ed in the manifest is of `source` as it is now, and its destination still there."""
+    if record is None or record["source"] != str(source):
+        return False
+    destination = AnyPath(record["destination"])
+    return (
+        destination.exists()
+        and _stat(source) == (record["size"], record["mtime_ns"])
+        and destination.stat().st_size == record["size"]
+    )
+
+
+def copy_files(
+    files: list[tuple[AnyPath, AnyPath]],
+    manifest: AnyPath,
+    workers: int = 4,
+    chunk_bytes: int = CHUNK_BYTES,
+) -> list[dict]:
+    """
+    Copies each `(source, destination)` of `files` (see `copy_file`), at most `workers` at a time, skipping the
+    files `manifest` records as copied; returns the new records.  Failures are reported once all the other
+    files are copied.
+    """
+    from tqdm import tqdm # only needed when copying
+
+    records = {record["destination"]: record for record in json.loads(manifest.read_text())} if manifest.exists() else {}
+
+    to_copy = []
+    for source, destination in files:
+        if is_copied(records.get(str(destination)), source):
+            print(f"Skipped: {destination} already copied.")
+        else:
+            to_copy.append((source, destination))
+
+    copied, failures = [], []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(copy_file, source, destination, chunk_bytes): (source, destination)
+            for source, destination in to_copy
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Copying files"):
+            source, destination = futures[future]
+            try:
+                record = future.result()
+            except Exception as error:
+                failures.append(f"{source}: {error}")
+                continue
+            print(f"Copied: {source} -> {destination}")
+            copied.append(record)
+            # recorded as soon as copied, for an interrupted run to skip it
+            records[record["destination"]] = record
+            manifest.parent.mkdir(parents=True, exist_ok=True)
+            _write_json(manifest, sorted(records.values(), key=lambda record: record["destination"]))
+
+    if failures:
+        raise OSError(f"{len(failures)} of {len(to_copy)} files failed to copy:\n" + "\n".join(failures))
+    return copied
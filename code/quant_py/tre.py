@@ -0,0 +1,767 @@
+# Polars namespace additions
+# In subsequent version this code may be integrated with the establisted TRE Tools package
+
+import datetime
+import re
+import resource
+import threading
+import time
+from contextlib import ContextDecorator, nullcontext
+
+import polars as pl
+from cloudpathlib import AnyPath
+
+try:
+    import psutil # optional; used to sample peak RSS per pipeline stage
+except ImportError:
+    psutil = None
+
+
+def _describe_row_count_change(before: int, after: int) -> str:
+    """Formats the `(row count unchanged) (+x.x%)` suffix used by the `*_with_logging` methods."""
+    change_str = ""
+    if before > 0:
+        change = ((after - before) / before) * 100
+        change_str = f" ({'+' if change > 0 else ''}{change:.1f}%)"
+
+    unchanged = " (row count unchanged)" if after == before else ""
+    return f"{unchanged}{change_str}"
+
+
+def _flatten_predicates(*predicates, **constraints) -> list[pl.Expr]:
+    """Flattens `.filter()` style arguments (exprs, lists/tuples of exprs, `name=value`) into a list of exprs."""
+    flattened = []
+    for predicate in predicates:
+        if isinstance(predicate, (list, tuple)):
+            flattened.extend(_flatten_predicates(*predicate))
+        elif isinstance(predicate, str):
+            flattened.append(pl.col(predicate))
+        elif isinstance(predicate, bool):
+            flattened.append(pl.lit(predicate))
+        else:
+            flattened.append(predicate)
+    flattened.extend(pl.col(name).eq(value) for name, value in constraints.items())
+    return flattened
+
+
+def _attrition_exprs(predicates: list[pl.Expr]) -> list[pl.Expr]:
+    """
+    Aggregations giving, in a single `select`, the number of rows each predicate removes on its own
+    (`removed_alone_{i}`) and once applied after all the predicates before it (`removed_cumulative_{i}`).
+
+    As in `.filter()`, a null predicate value removes the row.
+    """
+    kept = [predicate.fill_null(False) for predicate in predicates]
+    exprs = [pl.len().alias("rows_before")]
+    kept_so_far = None
+    for i, keep in enumerate(kept):
+        kept_so_far = keep if kept_so_far is None else (kept_so_far & keep)
+        exprs.append((~keep).sum().alias(f"removed_alone_{i}"))
+        exprs.append((~kept_so_far).sum().alias(f"removed_cumulative_{i}"))
+    return exprs
+
+
+def _print_value_counts(label: str, total: int, counts: list[tuple[str, int]]) -> None:
+    """Prints the total line and one line per value (with its share of the rows) of a `count_with_logging`."""
+    print(f"[{label}] {total} rows")
+    for value, count in counts:
+        share = f" ({count / total * 100:.1f}%)" if total else ""
+        print(f"[{label}]   {value}: {count} rows{share}")
+
+
+def _print_filter_attrition(label: str, before: int, after: int, rules: list[dict]) -> None:
+    """Prints the before/after filter line and, for multi-predicate filters, one line per predicate."""
+    print(f"[{label}] Before filter: {before} rows, After filter: {after} rows{_describe_row_count_change(before, after)}")
+    if len(rules) < 2:
+        return
+    for rule in rules:
+        expr_str = rule["detail"] if len(rule["detail"]) <= 80 else f"{rule['detail'][:77]}..."
+        print(
+            f"[{label}]   rule {rule['rule']:>3} removes {rule['removed_alone']} rows alone, "
+            f"{rule['removed_cumulative']} rows cumulatively: {expr_str}"
+        )
+
+
+def _pass_through(lzdf: pl.LazyFrame, on_batch, projection_pushdown: bool = True) -> pl.LazyFrame:
+    """
+    Returns `lzdf` with a streamable `map_batches` node calling `on_batch(df)` on (and returning) every batch.
+    Without `projection_pushdown`, the node gets all the columns of `lzdf`, even those not used after it.
+    """
+    return lzdf.map_batches(
+        on_batch,
+        # Rows must be counted where the node sits, so nothing is pushed down through it
+        predicate_pushdown=False,
+        slice_pushdown=False,
+        projection_pushdown=projection_pushdown,
+        streamable=True,
+    )
+
+
+class TREAudit:
+    """
+    Deferred row-count auditing for the `TRE` namespace.
+
+    By default `filter_with_logging`, `unique_with_logging` and `join_with_logging` `.collect()` their input
+    and their output to print row counts, i.e. the upstream plan is fully run twice per logged step.  While a
+    `TREAudit` is active, these methods instead register a named checkpoint: a pass-through `map_batches` node
+    which counts the rows streaming past it.  All before/after counts are therefore gathered in the same
+    execution as the final `sink_ipc`/`sink_parquet` and reported (and optionally written) as one audit table.
+
+    Counting stops when the audit is closed, so a LazyFrame re-used after the `with` block (e.g. read again by
+    a later cell) does not inflate the counts.
+
+    e.g.
+    ```
+    with TREAudit(provenance_key) as audit:
+        (
+            pl.scan_csv(...)
+            .TRE
+            .filter_with_logging(..., label="...")
+            .sink_ipc(...)
+        )
+    audit.write(AnyPath(config.logs_path, f"{config.yr}_{config.mon}_{provenance_key}_row_count_audit.parquet"))
+    ```
+    """
+    _active = None
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.steps = []
+        self.counts = {}
+        self._is_open = False
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "TREAudit":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+        if exc_type is None:
+            self.report()
+
+    def start(self) -> "TREAudit":
+        """Makes this the active audit; `TRE` logging methods called from now on register checkpoints."""
+        self._is_open = True
+        TREAudit._active = self
+        return self
+
+    def stop(self) -> None:
+        """Stops counting and deactivates the audit."""
+        self._is_open = False
+        if TREAudit._active is self:
+            TREAudit._active = None
+
+    def checkpoint(
+        self,
+        lzdf: pl.LazyFrame,
+        key: str,
+        exprs: list[pl.Expr] | None = None,
+        projection_pushdown: bool = True,
+    ) -> pl.LazyFrame:
+        """
+        Returns `lzdf` with a pass-through node counting the rows which flow through it under `key`.
+
+        Optional `exprs` are aggregations (e.g. `_attrition_exprs`) evaluated on every batch and summed under
+        `{key}_{expr name}`; without `projection_pushdown` their columns are kept even if not used downstream.
+        """
+        self.counts[key] = 0
+        names = [expr.meta.output_name() for expr in exprs or []]
+        self.counts.update({f"{key}_{name}": 0 for name in names})
+
+        def _count_rows(df: pl.DataFrame) -> pl.DataFrame:
+            if self._is_open:
+                sums = df.select(exprs).row(0) if exprs else ()
+                with self._lock:
+                    self.counts[key] += df.height
+                    for name, value in zip(names, sums):
+                        self.counts[f"{key}_{name}"] += value
+            return df
+
+        return _pass_through(lzdf, _count_rows, projection_pushdown=projection_pushdown)
+
+    @property
+    def rows_in(self) -> int | None:
+        """Rows entering the first logged step, i.e. the input of the audited chain."""
+        return self.counts.get(self.steps[0]["keys"][0]) if self.steps else None
+
+    def register_step(
+        self,
+        operation: str,
+        label: str,
+        detail: str = "",
+        right: bool = False,
+        rules: list[str] | None = None,
+    ) -> tuple[str, ...]:
+        """Registers a logged step and returns the checkpoint keys for its before, after (and right) counts."""
+        step = len(self.steps) + 1
+        keys = (f"{step}_before", f"{step}_after") + ((f"{step}_right",) if right else ())
+        self.steps.append(
+            {
+                "step": step,
+                "operation": operation,
+                "label": label,
+                "detail": detail,
+                "keys": keys,
+                "rules": rules or [],
+            }
+        )
+        return keys
+
+    def _step_counts(self, step: dict) -> list[tuple[str, int]]:
+        """Rows per value of a count step (see `count_with_logging`)."""
+        before_key = step["keys"][0]
+        return [(value, self.counts.get(f"{before_key}_count_{i}")) for i, value in enumerate(step["rules"])]
+
+    def _step_rules(self, step: dict) -> list[dict]:
+        """Per-predicate counts of a filter step (see `_attrition_exprs`)."""
+        before_key = step["keys"][0]
+        return [
+            {
+                "rule": i + 1,
+                "detail": detail,
+                "removed_alone": self.counts.get(f"{before_key}_removed_alone_{i}"),
+                "removed_cumulative": self.counts.get(f"{before_key}_removed_cumulative_{i}"),
+            }
+            for i, detail in enumerate(step["rules"])
+        ]
+
+    def to_frame(self) -> pl.DataFrame:
+        """
+        One row per logged step with before/after (and, for joins, right) row counts.
+
+        Filters with several predicates also get one row per predicate (`rule` = 1, 2, …): `rows_before` and
+        `rows_after` are then the rows left before and after applying that predicate on top of the previous
+        ones, and `rows_removed_alone` the rows the predicate would remove on its own.  Count steps get one row
+        per value (`detail`), with the rows having it as `rows_after`.
+        """
+        rows = []
+        for step in self.steps:
+            before = self.counts.get(step["keys"][0])
+            rows.append(
+                {
+                    "audit": self.name,
+                    "step": step["step"],
+                    "rule": None,
+                    "operation": step["operation"],
+                    "label": step["label"],
+                    "detail": step["detail"],
+                    "rows_before": before,
+                    "rows_after": self.counts.get(step["keys"][1], before),
+                    "rows_right": self.counts.get(step["keys"][2]) if len(step["keys"]) > 2 else None,
+                    "rows_removed_alone": None,
+                }
+            )
+            if step["operation"] == "count":
+                rows.extend(
+                    {
+                        "audit": self.name,
+                        "step": step["step"],
+                        "rule": i + 1,
+                        "operation": step["operation"],
+                        "label": step["label"],
+                        "detail": value,
+                        "rows_before": before,
+                        "rows_after": count,
+                        "rows_right": None,
+                        "rows_removed_alone": None,
+                    }
+                    for i, (value, count) in enumerate(self._step_counts(step))
+                )
+                continue
+            if len(step["rules"]) < 2:
+                continue
+            removed_so_far = 0
+            for rule in self._step_rules(step):
+                rows.append(
+                    {
+                        "audit": self.name,
+                        "step": step["step"],
+                        "rule": rule["rule"],
+                        "operation": step["operation"],
+                        "label": step["label"],
+                        "detail": rule["detail"],
+                        "rows_before": before - removed_so_far,
+                        "rows_after": before - rule["removed_cumulative"],
+                        "rows_right": None,
+                        "rows_removed_alone": rule["removed_alone"],
+                    }
+                )
+                removed_so_far = rule["removed_cumulative"]
+
+        return pl.DataFrame(
+            rows,
+            schema={
+                "audit": pl.Utf8,
+                "step": pl.UInt32,
+                "rule": pl.UInt32,
+                "operation": pl.Utf8,
+                "label": pl.Utf8,
+                "detail": pl.Utf8,
+                "rows_before": pl.UInt64,
+                "rows_after": pl.UInt64,
+                "rows_right": pl.UInt64,
+                "rows_removed_alone": pl.UInt64,
+            },
+        )
+
+    def report(self) -> None:
+        """Prints the audited counts in the same format as the eager `*_with_logging` methods."""
+        for step in self.steps:
+            label = step["label"]
+            before = self.counts.get(step["keys"][0])
+            # count steps do not change the rows, and have no after checkpoint
+            after = self.counts.get(step["keys"][1], before)
+            change = _describe_row_count_change(before, after)
+            if step["operation"] == "join":
+                print(f"[{label}] Join type: {step['detail']}")
+                print(f"[{label}] Left: {before} rows, Right: {self.counts.get(step['keys'][2])} rows -> After: {after} rows{change}")
+            elif step["operation"] == "unique":
+                print(f"[{label}: on {step['detail']}] Before unique: {before} rows, After unique: {after} rows{change}")
+            elif step["operation"] == "count":
+                _print_value_counts(label, before, self._step_counts(step))
+            else:
+                _print_filter_attrition(label, before, after, self._step_rules(step))
+
+    def write(self, path: AnyPath) -> None:
+        """Writes the audit table as a single parquet file (e.g. under the logs directory)."""
+        self.to_frame().write_parquet(path)
+
+
+def _current_rss() -> int | None:
+    """Resident set size of this process in bytes (`None` without psutil)."""
+    return psutil.Process().memory_info().rss if psutil is not None else None
+
+
+def _high_water_rss() -> int:
+    """Peak resident set size of this process since it started, in bytes (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _bytes_on_disk(path: AnyPath) -> int | None:
+    """Size of a written file, or of all files under a written directory."""
+    path = AnyPath(path)
+    if path.is_file():
+        return path.stat().st_size
+    if path.is_dir():
+        return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+    return None
+
+
+# Fill colours used by polars' streaming physical plan graph (see `LazyFrame.show_graph(plan_stage="physical")`)
+_STREAMING_NODE_KINDS = {
+    "0.0 0.3 1.0": "in_memory_fallback",
+    "0.16 0.3 1.0": "memory_intensive",
+}
+_DOT_NODE_PATTERN = re.compile(r'(?m)^(\d+) \[label="((?:[^"\\]|\\.)*)"(?:,style=filled,fillcolor="([^"]*)")?\];$')
+
+
+def _streaming_nodes(lzdf: pl.LazyFrame) -> pl.DataFrame:
+    """
+    The nodes of the streaming engine's physical plan for `lzdf`, flagged as `streaming`, `memory_intensive`
+    (e.g. sorts, which buffer their whole input) or `in_memory_fallback` (operators the streaming engine
+    cannot run, e.g. `group_by_dynamic`, which are executed by the in-memory engine on their full input).
+    """
+    dot = lzdf.show_graph(engine="streaming", plan_stage="physical", raw_output=True)
+    nodes = []
+    for match in _DOT_NODE_PATTERN.finditer(dot):
+        node_id, label, fill_colour = match.groups()
+        label = label.replace("\\n", "\n").replace('\\"', '"')
+        lines = [line.strip() for line in label.splitlines() if line.strip()]
+        nodes.append(
+            {
+                "node_id": int(node_id),
+                # Fallback nodes are labelled "in-memory-map" followed by the plan node they run
+                "node": lines[1] if lines[0] == "in-memory-map" and len(lines) > 1 else lines[0],
+                "kind": _STREAMING_NODE_KINDS.get(fill_colour, "streaming"),
+                "detail": label,
+            }
+        )
+    return pl.DataFrame(
+        nodes,
+        schema={"node_id": pl.UInt64, "node": pl.Utf8, "kind": pl.Utf8, "detail": pl.Utf8},
+    )
+
+
+_SCAN_PROJECTION_PATTERN = re.compile(r"(?m)^\s*(\w+) SCAN \[(.*)\].*\n\s*PROJECT (\*|\d+)/(\d+) COLUMNS")
+
+
+def scan_projections(lzdf: pl.LazyFrame) -> pl.DataFrame:
+    """
+    The file scans of the optimised plan of `lzdf`, with the number of columns each reads (once projection
+    pushdown is applied) out of the number of columns of its files.
+    """
+    scans = [
+        {
+            "scan": kind,
+            "sources": sources,
+            "columns_read": int(total) if read == "*" else int(read),
+            "columns": int(total),
+        }
+        for kind, sources, read, total in _SCAN_PROJECTION_PATTERN.findall(lzdf.explain())
+    ]
+    return pl.DataFrame(
+        scans,
+        schema={"scan": pl.Utf8, "sources": pl.Utf8, "columns_read": pl.UInt32, "columns": pl.UInt32},
+    )
+
+
+class TREStage(ContextDecorator):
+    """
+    Stage-level telemetry: wall time, CPU time, peak RSS, rows in/out and bytes written.
+
+    Each completed stage appends one row (tagged with `TREStage.run_info`, i.e. version, yr, mon and run_id)
+    to `TREStage.records`, and the whole run so far is re-written to `TREStage.log_path` (a run-scoped parquet
+    file under the logs directory, see `pipeline.configure_telemetry`), so the timings survive the process and
+    can be compared between pipeline versions.
+
+    - CPU time is `time.process_time()`, i.e. summed over all (polars) threads of the process.
+    - Peak RSS is sampled every `sample_interval` seconds with psutil; without psutil the process high-water
+      mark is used instead, which never decreases between stages.
+    - Rows in are the rows entering the first logged step of `audit` (if given); rows out are counted as they
+      stream into the sink (see `count_rows_out`) or passed to `record_output`.
+
+    The `.TRE.sink_*` methods open a stage named after the output file unless one is already active. Use as
+    a context manager (or decorator) to group several writes, e.g. an output loop:
+    ```
+    with TREStage("individual_trait_readings") as stage:
+        for (trait, ), df in ...:
+            df.write_csv(path)
+            stage.record_output(path, rows=df.height)
+    ```
+    """
+    log_path = None
+    run_info = {"version": None, "yr": None, "mon": None, "run_id": None}
+    records = []
+    plan_path = None
+    profile_sinks = False
+    sample_interval = 0.1
+    _active = None
+
+    def __init__(self, name: str, audit: TREAudit | None = None) -> None:
+        self.name = name
+        self.audit = audit
+        self.rows_in = None
+        self.rows_out = None
+        self.outputs = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "TREStage":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop(status="ok" if exc_type is None else exc_type.__name__)
+
+    def start(self) -> "TREStage":
+        """Starts the clocks and the RSS sampler, and makes this the active stage."""
+        self.rows_in = None
+        self.rows_out = None
+        self.outputs = []
+        self._outer = TREStage._active
+        TREStage._active = self
+
+        self._started_at = datetime.datetime.now()
+        self._peak_rss = _current_rss()
+        self._sampling = threading.Event()
+        self._sampler = None
+        if self._peak_rss is not None:
+            self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+            self._sampler.start()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def _sample_rss(self) -> None:
+        while not self._sampling.wait(self.sample_interval):
+            self._peak_rss = max(self._peak_rss, _current_rss())
+
+    def stop(self, status: str = "ok") -> dict:
+        """Stops the clocks, records the stage and re-writes the run's telemetry file."""
+        wall_seconds = time.perf_counter() - self._wall_start
+        cpu_seconds = time.process_time() - self._cpu_start
+        if self._sampler is not None:
+            self._sampling.set()
+            self._sampler.join()
+            peak_rss = max(self._peak_rss, _current_rss())
+        else:
+            peak_rss = _high_water_rss()
+        if TREStage._active is self:
+            TREStage._active = self._outer
+
+        if self.rows_in is None and self.audit is not None:
+            self.rows_in = self.audit.rows_in
+        sizes = [_bytes_on_disk(path) for path in self.outputs]
+
+        record = {
+            **TREStage.run_info,
+            "stage": self.name,
+            "status": status,
+            "started_at": self._started_at,
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": cpu_seconds,
+            "peak_rss_bytes": peak_rss,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_written": sum(size for size in sizes if size is not None) if self.outputs else None,
+            "outputs": [str(path) for path in self.outputs],
+        }
+        TREStage.records.append(record)
+        self.write_log()
+
+        print(
+            f"[{self.name}] Wall: {wall_seconds:.1f}s, CPU: {cpu_seconds:.1f}s, "
+            f"Peak RSS: {peak_rss / 2**30:.2f} GiB, Rows in: {self.rows_in}, Rows out: {self.rows_out}, "
+            f"Bytes written: {record['bytes_written']}"
+        )
+        return record
+
+    def count_rows_out(self, lzdf: pl.LazyFrame) -> pl.LazyFrame:
+        """Returns `lzdf` with a pass-through node adding the rows streaming past it to `rows_out`."""
+        def _count_rows(df: pl.DataFrame) -> pl.DataFrame:
+            with self._lock:
+                self.rows_out = (self.rows_out or 0) + df.height
+            return df
+
+        return _pass_through(lzdf, _count_rows)
+
+    def record_output(self, path: AnyPath, rows: int | None = None) -> None:
+        """Registers a file written by this stage (its size is taken at the end of the stage)."""
+        self.outputs.append(path)
+        if rows is not None:
+            with self._lock:
+                self.rows_out = (self.rows_out or 0) + rows
+
+    @classmethod
+    def to_frame(cls) -> pl.DataFrame:
+        """All stages recorded in this run."""
+        return pl.DataFrame(
+            cls.records,
+            schema={
+                "version": pl.Utf8,
+                "yr": pl.Utf8,
+                "mon": pl.Utf8,
+                "run_id": pl.Utf8,
+                "stage": pl.Utf8,
+                "status": pl.Utf8,
+                "started_at": pl.Datetime("us"),
+                "wall_seconds": pl.Float64,
+                "cpu_seconds": pl.Float64,
+                "peak_rss_bytes": pl.UInt64,
+                "rows_in": pl.UInt64,
+                "rows_out": pl.UInt64,
+                "bytes_written": pl.UInt64,
+                "outputs": pl.List(pl.Utf8),
+            },
+        )
+
+    @classmethod
+    def write_log(cls) -> None:
+        if cls.log_path is not None:
+            cls.to_frame().write_parquet(cls.log_path)
+
+    @classmethod
+    def capture_query_plan(cls, lzdf: pl.LazyFrame, name: str) -> None:
+        """
+        Saves the optimised plan (`explain`) and the streaming engine's physical nodes of a sink to
+        `plan_path`, as `{name}.plan.txt` and `{name}.streaming_nodes.parquet`, and warns about operators
+        which fall back to the in-memory engine.
+        """
+        (cls.plan_path / f"{name}.plan.txt").write_text(lzdf.explain())
+        try:
+            nodes = _streaming_nodes(lzdf)
+        except Exception as e:
+            # Not every plan (or polars version) can be lowered to the streaming physical plan
+            print(f"[{name}] Streaming plan unavailable: {e}")
+            return
+        nodes.write_parquet(cls.plan_path / f"{name}.streaming_nodes.parquet")
+
+        fallback_nodes = nodes.filter(pl.col("kind").eq("in_memory_fallback"))["node"].to_list()
+        if fallback_nodes:
+            print(f"[{name}] Not streamable, runs in memory: {', '.join(fallback_nodes)}")
+
+
+@pl.api.register_lazyframe_namespace("TRE")
+class TRETools:
+    def __init__(self, lzdf: pl.LazyFrame) -> None:
+        self._lzdf = lzdf
+
+    def unique_with_logging(self, *args, label: str = "Unique", audit: TREAudit | None = None, **kwargs) -> pl.LazyFrame:
+        audit = audit or TREAudit._active
+        if audit is not None:
+            before_key, after_key = audit.register_step("unique", label, detail=f"{args}")
+            return audit.checkpoint(
+                audit.checkpoint(self._lzdf, before_key).unique(*args, **kwargs),
+                after_key
+            )
+
+        before = self._lzdf.collect().height
+        filtered_lzdf = self._lzdf.unique(*args, **kwargs)
+        after = filtered_lzdf.collect().height
+
+        print(f"[{label}: on {args}] Before unique: {before} rows, After unique: {after} rows{_describe_row_count_change(before, after)}")
+        return filtered_lzdf
+
+    def filter_with_logging(self, *args, label: str = "Filter", audit: TREAudit | None = None, **kwargs) -> pl.LazyFrame:
+        """
+        `.filter()` reporting the rows removed overall and, when given several predicates, by each predicate
+        alone and cumulatively (in argument order).
+
+        All counts come from a single aggregate `select` over the input (every predicate is evaluated as a
+        boolean column and summed), so the data are never materialised.  Under an active `TREAudit` the same
+        aggregations are evaluated batch by batch during the final sink instead.
+        """
+        predicates = _flatten_predicates(*args, **kwargs)
+        attrition_exprs = _attrition_exprs(predicates)
+        rules = [str(predicate) for predicate in predicates]
+
+        audit = audit or TREAudit._active
+        if audit is not None:
+            before_key, after_key = audit.register_step("filter", label, rules=rules)
+            return audit.checkpoint(
+                audit.checkpoint(self._lzdf, before_key, exprs=attrition_exprs[1:]).filter(*args, **kwargs),
+                after_key
+            )
+
+        counts = self._lzdf.select(attrition_exprs).collect().row(0, named=True)
+        before = counts["rows_before"]
+        after = before - counts[f"removed_cumulative_{len(predicates) - 1}"] if predicates else before
+
+        _print_filter_attrition(
+            label,
+            before,
+            after,
+            [
+                {
+                    "rule": i + 1,
+                    "detail": rule,
+                    "removed_alone": counts[f"removed_alone_{i}"],
+                    "removed_cumulative": counts[f"removed_cumulative_{i}"],
+                }
+                for i, rule in enumerate(rules)
+            ],
+        )
+        return self._lzdf.filter(*args, **kwargs)
+
+    def count_with_logging(
+        self,
+        column: str,
+        values: list[str],
+        label: str = "Count",
+        audit: TREAudit | None = None,
+    ) -> pl.LazyFrame:
+        """
+        `lzdf` unchanged, reporting how many of its rows have each of `values` in `column` (e.g. the format each
+        date was parsed with, see `dates.py`).  Under an active `TREAudit` the rows are counted batch by batch
+        during the final sink.
+        """
+        count_exprs = [(pl.col(column) == value).sum().alias(f"count_{i}") for i, value in enumerate(values)]
+        audit = audit or TREAudit._active
+        if audit is not None:
+            before_key, _ = audit.register_step("count", label, detail=column, rules=values)
+            # `column` is typically not used after the count
+            return audit.checkpoint(self._lzdf, before_key, exprs=count_exprs, projection_pushdown=False)
+
+        counts = self._lzdf.select(pl.len(), *count_exprs).collect().row(0)
+        _print_value_counts(label, counts[0], list(zip(values, counts[1:])))
+        return self._lzdf
+
+    def join_with_logging(
+        self,
+        other: pl.LazyFrame,
+        *args,
+        how: str = "inner",
+        label: str = "Join",
+        audit: TREAudit | None = None,
+        **kwargs
+    ) -> pl.LazyFrame:
+        audit = audit or TREAudit._active
+        if audit is not None:
+            before_key, after_key, right_key = audit.register_step("join", label, detail=how.upper(), right=True)
+            return audit.checkpoint(
+                audit.checkpoint(self._lzdf, before_key)
+                .join(audit.checkpoint(other, right_key), *args, how=how, **kwargs),
+                after_key
+            )
+
+        left_before = self._lzdf.collect().height
+        right_before = other.collect().height
+        joined_lzdf = self._lzdf.join(other, *args, how=how, **kwargs)
+        after = joined_lzdf.collect().height
+
+        print(f"[{label}] Join type: {how.upper()}")
+        print(f"[{label}] Left: {left_before} rows, Right: {right_before} rows -> After: {after} rows{_describe_row_count_change(left_before, after)}")
+        return joined_lzdf
+
+    def _sink(
+        self,
+        method: str,
+        path: AnyPath,
+        *args,
+        stage: str | None = None,
+        side_sinks: dict[AnyPath, pl.LazyFrame] | None = None,
+        partition_by: list[str] | None = None,
+        sort_by: list[str] | None = None,
+        **kwargs
+    ) -> None:
+        """
+        Runs `LazyFrame.<method>(path, ...)` inside the active `TREStage`, or in a new one named `stage`
+        (default: the output file name), counting the rows written and recording the output file.
+
+        With `partition_by`, `path` is the folder of a hive-partitioned dataset, one file per key (which is kept
+        in the files too), with its rows sorted by `sort_by` (see `datasets.py`).
+
+        `side_sinks` are lazy sinks (`sink_*(..., lazy=True)`) of plans sharing this one's input, e.g. the
+        rejected rows (see `quarantine.py`), keyed by their output path: they are run in the same
+        `pl.collect_all`, so the shared part of the plans is computed once.
+
+        Opt-in query-plan capture (`TREStage.plan_path` set): the plan and streaming nodes are saved first.
+        With `TREStage.profile_sinks` the query is instead run once through `LazyFrame.profile()`, its node
+        timings saved as `{output name}.profile.parquet` and the profiled result written to `path`.  Note that
+        `profile()` uses the in-memory engine, so only enable it where the sink's result fits in memory.
+        """
+        stage_context = (
+            nullcontext(TREStage._active) if TREStage._active is not None
+            else TREStage(stage or AnyPath(path).stem, audit=TREAudit._active)
+        )
+        with stage_context as active_stage:
+            lzdf = active_stage.count_rows_out(self._lzdf)
+            if TREStage.plan_path is not None:
+                TREStage.capture_query_plan(self._lzdf, AnyPath(path).stem)
+                if TREStage.profile_sinks:
+                    result, timings = lzdf.profile()
+                    timings.write_parquet(TREStage.plan_path / f"{AnyPath(path).stem}.profile.parquet")
+                    lzdf = result.lazy()
+            target = path if partition_by is None else pl.PartitionByKey(
+                path, by=partition_by, include_key=True, per_partition_sort_by=sort_by
+            )
+            if side_sinks:
+                pl.collect_all(
+                    [getattr(lzdf, method)(target, *args, lazy=True, **kwargs), *side_sinks.values()],
+                    engine="streaming",
+                )
+            else:
+                getattr(lzdf, method)(target, *args, **kwargs)
+            active_stage.record_output(path)
+            for side_path in side_sinks or {}:
+                active_stage.record_output(side_path)
+
+    def sink_ipc(self, path: AnyPath, *args, stage: str | None = None, side_sinks: dict | None = None, **kwargs) -> None:
+        self._sink("sink_ipc", path, *args, stage=stage, side_sinks=side_sinks, **kwargs)
+
+    def sink_parquet(
+        self,
+        path: AnyPath,
+        *args,
+        stage: str | None = None,
+        side_sinks: dict | None = None,
+        partition_by: list[str] | None = None,
+        sort_by: list[str] | None = None,
+        **kwargs
+    ) -> None:
+        self._sink(
+            "sink_parquet", path, *args, stage=stage, side_sinks=side_sinks, partition_by=partition_by, sort_by=sort_by,
+            **kwargs
+        )
+
+    def sink_csv(self, path: AnyPath, *args, stage: str | None = None, side_sinks: dict | None = None, **kwargs) -> None:
+        self._sink("sink_csv", path, *args, stage=stage, side_sinks=side_sinks, **kwargs)
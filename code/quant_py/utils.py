@@ -0,0 +1,38 @@
+# Non-HES or general functions
+
+import polars as pl
+
+from .dates import parse_dates
+
+try:
+    from IPython.display import display
+except ImportError: # e.g. when run from the command line
+    display = print
+
+
+def add_valid_test_date_from_candidate_columns(
+    lf: pl.LazyFrame,
+    date_cols: list[str],
+    formats: tuple[str, ...] = ("%Y-%m-%d %H:%M",),
+) -> pl.LazyFrame:
+    """
+    Adds a 'test_date' column selecting the first valid date from the provided date columns in order, years
+    starting with 4XXX read as 2XXX (e.g. 4022 --> 2022), see `dates.parse_dates`.
+    """
+    return parse_dates(lf, date_cols, list(formats), fix_year_typo=True).drop("_date_format")
+
+
+def display_with(df: pl.DataFrame, num_rows: int = 20, text_width: int = 80) -> None:
+    """A helper function to allow fuller display of polar dataframes with limited trucation of """
+    """number of rows and column width expansion"""
+    df_num_rows = df.height
+    if num_rows > 120:
+        raise ValueError(f"Don't be daft, that's too big a num_rows ({num_rows}).  Try 120 rows or fewer.")
+        return None
+    if num_rows < df_num_rows:
+        print(f"Too few num_rows ({num_rows}), ",end="")
+        num_rows = min(df_num_rows,120)
+        print(f"df is {df_num_rows} rows, setting num_rows to {num_rows}.")
+    with pl.Config(tbl_rows=num_rows, fmt_str_lengths=text_width):
+        display(df)
+    return None
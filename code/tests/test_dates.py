@@ -0,0 +1,84 @@
+import datetime
+
+import polars as pl
+import pytest
+
+from quant_py.dates import date_format_labels, decode_dates, parse_dates
+
+FORMATS = ["%Y-%m-%d %H:%M", "%d/%m/%Y", "%m/%d/%Y"]
+
+
+def test_decode_dates_first_format_wins():
+    decoded = decode_dates(pl.Series(["2021-03-04 09:30", "04/03/2021", "12/31/2021", "31.12.2021", None]), FORMATS)
+    assert decoded.to_dict(as_series=False) == {
+        "raw": ["2021-03-04 09:30", "04/03/2021", "12/31/2021", "31.12.2021", None],
+        # "04/03/2021" is parsed by both "%d/%m/%Y" and "%m/%d/%Y": the first one listed wins
+        "date": [datetime.date(2021, 3, 4), datetime.date(2021, 3, 4), datetime.date(2021, 12, 31), None, None],
+        "format_index": [0, 1, 2, None, None],
+    }
+    reversed_order = decode_dates(pl.Series(["04/03/2021"]), FORMATS[::-1])
+    assert reversed_order.row(0) == ("04/03/2021", datetime.date(2021, 4, 3), 0)
+
+
+def test_decode_dates_year_typo():
+    raw = pl.Series(["4022-05-01 09:30", "2022-05-01 09:30", "01/05/4022"])
+    assert decode_dates(raw, FORMATS).get_column("date").to_list() == [
+        datetime.date(4022, 5, 1),
+        datetime.date(2022, 5, 1),
+        datetime.date(4022, 5, 1),
+    ]
+    decoded = decode_dates(raw, FORMATS, fix_year_typo=True)
+    # only a leading year is fixed
+    assert decoded.get_column("date").to_list() == [
+        datetime.date(2022, 5, 1),
+        datetime.date(2022, 5, 1),
+        datetime.date(4022, 5, 1),
+    ]
+    # the typo-fixed formats' labels follow the formats'
+    assert decoded.get_column("format_index").to_list() == [len(FORMATS), 0, 1]
+
+
+def test_parse_dates():
+    lf = pl.LazyFrame(
+        {
+            "ReportDate": ["2021-03-04 09:30", None, "not a date", None, "4022-05-01 09:30", "pending"],
+            "RequestDate": ["01/01/2020", "02/01/2020", "03/01/2020", None, None, None],
+        }
+    )
+    parsed = parse_dates(lf, ["ReportDate", "RequestDate"], FORMATS, fix_year_typo=True).collect()
+    assert parsed.columns == ["ReportDate", "RequestDate", "test_date", "_date_format"]
+    # the first candidate column holding a date
+    assert parsed.get_column("test_date").to_list() == [
+        datetime.date(2021, 3, 4),
+        datetime.date(2020, 1, 2),
+        datetime.date(2020, 1, 3),
+        None,
+        datetime.date(2022, 5, 1),
+        None,
+    ]
+    assert parsed.get_column("_date_format").to_list() == [
+        "ReportDate: %Y-%m-%d %H:%M",
+        "RequestDate: %d/%m/%Y",
+        "RequestDate: %d/%m/%Y",
+        "null",
+        "ReportDate: %Y-%m-%d %H:%M (4xxx year)",
+        "unparsable",
+    ]
+    assert parsed.get_column("_date_format").dtype == pl.Enum(
+        date_format_labels(["ReportDate", "RequestDate"], FORMATS, fix_year_typo=True)
+    )
+
+
+def test_parse_dates_strict():
+    lf = pl.LazyFrame({"test_date": ["2021-03-04 09:30", None, "not a date"]})
+    parsed = parse_dates(lf, ["test_date"], FORMATS, strict=True, alias="date")
+    with pytest.raises(pl.exceptions.InvalidOperationError, match="match none of"):
+        parsed.collect()
+    # nulls are not an error
+    parsed = parse_dates(lf.head(2), ["test_date"], FORMATS, strict=True).collect()
+    assert parsed.get_column("_date_format").to_list() == ["test_date: %Y-%m-%d %H:%M", "null"]
+
+
+def test_parse_dates_needs_formats():
+    with pytest.raises(ValueError):
+        parse_dates(pl.LazyFrame({"test_date": ["2021-03-04"]}), ["test_date"], [])
@@ -0,0 +1,62 @@
+import datetime
+import struct
+
+import polars as pl
+
+from quant_py.columns import HASH_COLUMN_NAMES
+from quant_py.hashing import HASH_FIELDS, MASK, SEEDS, _digest_words, digest, with_hash, xxh64_reference
+
+EPOCH = datetime.date(1970, 1, 1)
+
+ROWS = [
+    ("A1", datetime.date(2021, 3, 4), "HbA1c", 48.0, "mmol/mol"),
+    ("A1", datetime.date(2021, 3, 4), "HbA1c", -0.0, "mmol/mol"),
+    ("A1", datetime.date(2021, 3, 4), "HbA1c", 0.0, "mmol/mol"),
+    ("B2", datetime.date(1969, 12, 31), "Cholesterol", 5.25, None),
+    ("B2", datetime.date(1901, 1, 1), "Cholesterol", None, "mmol/L"),
+    ("C3", None, None, 1e-7, ""),
+    (None, None, None, None, None),
+]
+
+
+def reference_words(row: tuple) -> list[int]:
+    """The 10 words of the fingerprint of `row`, after the module notes."""
+    words, null_fields = [], 0
+    for i, (field, value) in enumerate(zip(HASH_FIELDS, row)):
+        null_fields |= (value is None) << i
+        if field == "test_date":
+            words.append(0 if value is None else (value - EPOCH).days & MASK)
+        else:
+            words.extend((0, 0) if value is None else digest(value))
+    return [*words, null_fields]
+
+
+def test_with_hash_is_xxh64_of_the_words():
+    lf = pl.LazyFrame(
+        ROWS,
+        schema={
+            "pseudo_nhs_number": pl.Utf8,
+            "test_date": pl.Date,
+            "original_term": pl.Utf8,
+            "result": pl.Float64,
+            "result_value_units": pl.Utf8,
+        },
+        orient="row",
+    )
+    hashes = lf.pipe(with_hash).select(HASH_COLUMN_NAMES).collect().rows()
+
+    for row, hash_words in zip(ROWS, hashes):
+        data = struct.pack("<10Q", *reference_words(row))
+        assert hash_words == tuple(xxh64_reference(data, seed) for seed in SEEDS), row
+    # -0.0 is read as 0.0
+    assert hashes[1] == hashes[2]
+    assert len(set(hashes)) == len(ROWS) - 1
+
+
+def test_digest_words_are_the_digests():
+    strings = pl.Series(["", "A1", "é", "HbA1c", "x" * 1000]).slice(1)
+    results = pl.Series([-0.0, 0.0, 5.25, 1e-7, float("nan")])
+    for values in [strings, results]:
+        high, low = _digest_words(values)
+        assert list(zip(high, low)) == [digest(value) for value in values.to_list()]
+        assert high.dtype == low.dtype == pl.UInt64
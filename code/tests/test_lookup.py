@@ -0,0 +1,52 @@
+import datetime
+
+import polars as pl
+
+from quant_py import lookup
+from quant_py.config import RunConfig
+from quant_py.hes import combined_hes_path, region_types_enum
+from quant_py.persons import PERSON_DICTIONARY_SCHEMA, person_dictionary_file
+
+
+def episodes(pseudo_nhs_numbers: list[str]) -> pl.DataFrame:
+    """One 5-day APC episode per pseudonym."""
+    return pl.DataFrame(
+        {
+            "pseudo_nhs_number": pseudo_nhs_numbers,
+            "hospital_admission_datetime": [datetime.datetime(2021, 3, 1)] * len(pseudo_nhs_numbers),
+            "hospital_discharge_datetime": [datetime.datetime(2021, 3, 6)] * len(pseudo_nhs_numbers),
+            "region_types": [["APC"]] * len(pseudo_nhs_numbers),
+        },
+        schema_overrides={"region_types": pl.List(region_types_enum)},
+    )
+
+
+def test_get_person_only_reads_the_person_dictionary(tmp_path, monkeypatch):
+    config = RunConfig(version="version001", yr="2025", mon="10", root_folder_location=str(tmp_path))
+    dictionary_file = person_dictionary_file(config)
+    dictionary_file.parent.mkdir(parents=True)
+    pl.DataFrame(
+        {"pseudo_nhs_number": ["A", "B", "C"], "person_id": [0, 1, 2], "version": [1, 1, 1]},
+        schema=PERSON_DICTIONARY_SCHEMA,
+    ).write_ipc(dictionary_file)
+    written = dictionary_file.read_bytes()
+
+    read = []
+
+    def read_persons(path, person_ids):
+        read.append(person_ids)
+        if path == combined_hes_path(config):
+            return episodes(["A", "C"])
+        return pl.DataFrame({"person_id": person_ids}, schema={"person_id": pl.UInt32})
+
+    monkeypatch.setattr(lookup, "read_persons", read_persons)
+
+    person = lookup.get_person(config, ["C", "A", "unknown"])
+    assert read == [[0, 2]] * 3
+    assert sorted(person.readings.get_column("person_id")) == [0, 2]
+    assert person.admission_windows.get_column("person_id").unique().sort().to_list() == [0, 2]
+    assert person.admission_windows.get_column("person_id").dtype == pl.UInt32
+
+    # the unknown pseudonym was not added
+    assert dictionary_file.read_bytes() == written
+    assert sorted(path.name for path in dictionary_file.parent.iterdir()) == ["person_ids.arrow"]
@@ -0,0 +1,92 @@
+import random
+
+import polars as pl
+import pytest
+
+from quant_py.columns import HASH_COLUMN_NAMES
+from quant_py.merge import merged_sorted
+
+
+def sorted_input(fingerprints: list[tuple[int, int]], name: str) -> pl.LazyFrame:
+    """An ingest intermediate: its readings de-duplicated and sorted on the fingerprint."""
+    return (
+        pl.LazyFrame(
+            {
+                "hash": [high for high, _ in fingerprints],
+                "hash_low": [low for _, low in fingerprints],
+                "input": name,
+            },
+            schema={"hash": pl.UInt64, "hash_low": pl.UInt64, "input": pl.Utf8},
+        )
+        .unique(subset=HASH_COLUMN_NAMES)
+        .sort(HASH_COLUMN_NAMES)
+    )
+
+
+def unique_sorted(lfs: list[pl.LazyFrame]) -> pl.DataFrame:
+    return pl.concat(lfs).unique(subset=HASH_COLUMN_NAMES).sort(HASH_COLUMN_NAMES).select(HASH_COLUMN_NAMES).collect()
+
+
+def write_inputs(lfs: list[pl.LazyFrame], folder, suffix: str = ".arrow") -> list:
+    """`lfs` written to `folder`, in record batches (or row groups) of 4 rows."""
+    folder.mkdir(exist_ok=True)
+    paths = []
+    for i, lf in enumerate(lfs):
+        path = folder / f"{i}{suffix}"
+        if suffix == ".parquet":
+            lf.collect().write_parquet(path, row_group_size=4)
+        else:
+            df = lf.collect()
+            pl.concat([df.clear(), *df.iter_slices(4)], rechunk=False).write_ipc(path)
+        paths.append(path)
+    return paths
+
+
+def merge(lfs: list[pl.LazyFrame], tmp_path, batch_rows: int, suffix: str = ".arrow") -> pl.DataFrame:
+    with merged_sorted(write_inputs(lfs, tmp_path / "inputs", suffix), tmp_path / "spill", batch_rows=batch_rows) as lf:
+        return lf.collect()
+
+
+@pytest.mark.parametrize("suffix", [".arrow", ".parquet"])
+@pytest.mark.parametrize("batch_rows", [1, 3, 7, 1000])
+def test_overlapping_inputs(tmp_path, batch_rows, suffix):
+    generator = random.Random(batch_rows)
+    # few distinct high words, so that the order often falls to the low word
+    fingerprints = [(generator.randrange(4), generator.randrange(50)) for _ in range(200)]
+    lfs = [
+        sorted_input(generator.sample(fingerprints, 60), "a"),
+        sorted_input(generator.sample(fingerprints, 80), "b"),
+        sorted_input(fingerprints[:30], "c"),
+    ]
+    merged = merge(lfs, tmp_path, batch_rows, suffix)
+
+    assert merged.columns == ["hash", "hash_low", "input"]
+    assert merged.select(HASH_COLUMN_NAMES).equals(unique_sorted(lfs))
+    assert not (tmp_path / "spill").exists()
+
+
+def test_single_input(tmp_path):
+    lf = sorted_input([(2, 1), (1, 5), (1, 2), (0, 9)], "a")
+
+    assert merge([lf], tmp_path, batch_rows=2).equals(lf.collect())
+
+
+def test_empty_input(tmp_path):
+    empty = sorted_input([], "a")
+    other = sorted_input([(1, 1), (0, 1)], "b")
+
+    assert merge([empty], tmp_path, batch_rows=2).equals(empty.collect())
+    assert merge([empty, other], tmp_path, batch_rows=1).equals(other.collect())
+
+
+def test_no_inputs(tmp_path):
+    with pytest.raises(ValueError, match="no inputs"):
+        with merged_sorted([], tmp_path / "spill"):
+            pass
+
+
+def test_unsorted_input(tmp_path):
+    unsorted = pl.LazyFrame({"hash": [2, 1], "hash_low": [0, 0]}, schema={"hash": pl.UInt64, "hash_low": pl.UInt64})
+
+    with pytest.raises(ValueError, match="cannot be merged"):
+        merge([unsorted], tmp_path, batch_rows=1)
@@ -0,0 +1,60 @@
+import polars as pl
+
+from quant_py.partition import bucket_path, field_counts, line_ranges, partition_by_field_count
+
+HEADER = "id\tdate\tresult\n"
+CHUNK_BYTES = 24
+
+
+def lines_by_fields(lines: list[str]) -> dict[int, list[str]]:
+    buckets = {}
+    for line in lines:
+        if line:
+            buckets.setdefault(line.count("\t"), []).append(line)
+    return buckets
+
+
+def check_partition(file, output_path, lines: list[str]) -> None:
+    manifest = partition_by_field_count(file, output_path=output_path, workers=3, chunk_bytes=CHUNK_BYTES)
+    buckets = lines_by_fields(lines)
+    rows = sum(len(bucket) for bucket in buckets.values())
+
+    assert manifest.to_dict(as_series=False) == {
+        "separators": sorted(buckets),
+        "fields": [separators + 1 for separators in sorted(buckets)],
+        "rows": [len(buckets[separators]) for separators in sorted(buckets)],
+        "share": [len(buckets[separators]) / rows for separators in sorted(buckets)],
+        "path": [str(bucket_path(file, separators, output_path=output_path)) for separators in sorted(buckets)],
+    }
+    assert manifest.equals(pl.read_parquet(output_path / f"{file.stem}_partitions.parquet"))
+    assert manifest.drop("path").equals(field_counts(file, chunk_bytes=CHUNK_BYTES))
+    # each bucket is the header and its lines, in file order
+    for separators, bucket in buckets.items():
+        assert bucket_path(file, separators, output_path=output_path).read_text() == HEADER + "".join(
+            f"{line}\n" for line in bucket
+        )
+    assert sorted(path.name for path in output_path.iterdir()) == sorted(
+        [f"{file.stem}_partitions.parquet"] + [f"{file.stem}_tab{separators}.tab" for separators in buckets]
+    )
+
+
+def test_partition_by_field_count(tmp_path):
+    file, output_path = tmp_path / "results.tab", tmp_path / "buckets"
+    lines = [f"{i}\t2021-03-04\t{i * 1.5}" for i in range(20)]
+    lines[3] = "3\t2021-03-04"
+    lines[7] = "7\t2021-03-04\t10.5\tmmol/L"
+    lines[8] = ""
+    lines[15] = "15\t2021-03-04\t22.5\tmmol/L\tcomment"
+    lines[16] = "16\t2021-03-04\t24.0\tmmol/L"
+    file.write_text(HEADER + "\n".join(lines) + "\n")
+    _, ranges = line_ranges(file, CHUNK_BYTES)
+    assert len(ranges) > 5
+
+    check_partition(file, output_path, lines)
+
+    # the file re-extracted without its 4- and 5-field lines, and one more 2-field line
+    lines = [line for line in lines if line.count("\t") < 3] + ["20\t2021-03-05"]
+    file.write_text(HEADER + "\n".join(lines))
+    check_partition(file, output_path, lines)
+    assert not bucket_path(file, 3, output_path=output_path).exists()
+    assert not bucket_path(file, 4, output_path=output_path).exists()
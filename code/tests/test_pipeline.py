@@ -0,0 +1,62 @@
+import polars as pl
+import pytest
+from cloudpathlib import AnyPath
+
+from quant_py import dag, pipeline
+from quant_py.config import RunConfig
+from quant_py.dag import Stage
+
+
+def _ingest(config: RunConfig) -> None:
+    pl.read_csv(AnyPath(config.raw_data_path, "raw.csv")).write_ipc(AnyPath(config.data_path, "ingested.arrow"))
+
+
+def _combine(config: RunConfig) -> None:
+    pl.read_ipc(AnyPath(config.data_path, "ingested.arrow")).write_ipc(AnyPath(config.data_path, "combined.arrow"))
+
+
+def _parallel_ingest(config, names, ram_budget_gb, max_workers=None, on_completed=None):
+    # the stages in this process, rather than in a process pool
+    for name in names:
+        dag.STAGES[name].func(config)
+        on_completed(name)
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    stages = {
+        "ingest": Stage(
+            "ingest",
+            _ingest,
+            inputs=lambda config: [AnyPath(config.raw_data_path, "raw.csv")],
+            outputs=lambda config: [AnyPath(config.data_path, "ingested.arrow")],
+        ),
+        "combine": Stage(
+            "combine",
+            _combine,
+            inputs=lambda config: [AnyPath(config.data_path, "ingested.arrow")],
+            outputs=lambda config: [AnyPath(config.data_path, "combined.arrow")],
+        ),
+    }
+    monkeypatch.setattr(dag, "STAGES", stages)
+    monkeypatch.setattr(pipeline, "STAGES", stages)
+    monkeypatch.setattr(pipeline, "INGEST_SPECS", {"ingest": {}})
+    monkeypatch.setattr(pipeline, "parallel_ingest", _parallel_ingest)
+    config = RunConfig(version="version001", yr="2025", mon="10", root_folder_location=str(tmp_path))
+    config.make_directories()
+    config.raw_data_path.mkdir(parents=True, exist_ok=True)
+    pl.DataFrame({"a": [1, 2, 3]}).write_csv(AnyPath(config.raw_data_path, "raw.csv"))
+    return config
+
+
+def test_parallel_ingest_run_is_up_to_date(config):
+    assert pipeline.run(config, ingest_ram_budget_gb=1) == ["ingest", "combine"]
+    assert pipeline.run(config, ingest_ram_budget_gb=1) == []
+
+
+def test_changed_raw_file_reruns_downstream(config):
+    pipeline.run(config, ingest_ram_budget_gb=1)
+    pl.DataFrame({"a": [1, 2, 3, 4]}).write_csv(AnyPath(config.raw_data_path, "raw.csv"))
+
+    assert pipeline.run(config, ingest_ram_budget_gb=1) == ["ingest", "combine"]
+    assert pipeline.run(config, ingest_ram_budget_gb=1) == []
@@ -0,0 +1,182 @@
+import polars as pl
+import pytest
+
+from quant_py.result_rules import REJECTED_REASONS, apply_result_rules, decode_results, load_rule_file, load_rule_set
+
+# (raw, value, result_rule) per rule set. The accepted values and the rejections are those of the filters and
+# the cast to `pl.Float64` of the specs before the rule sets, except where noted.
+CASES = {
+    "barts.2021_04_path": [
+        ("5.2", 5.2, "numeric"),
+        ("<5", 5.0, "comparator"),
+        ("> 10", 10.0, "comparator"),
+        (" 7", 7.0, "stripped"),
+        (None, None, "null"),
+        ("1429 at 10.40 on 28/11/14.", None, "unparsable"),
+        ("08/01/2014", None, "unparsable"),
+        ("{5}", None, "unparsable"),  # failed the cast
+        ("1e3", None, "unparsable"),  # was read by the cast
+    ],
+    "barts.2022_03_path": [
+        ("5.2", 5.2, "numeric"),
+        ("< 3", 3.0, "comparator"),
+        ("<3", 3.0, "comparator"),
+        (">90", 90.0, "comparator"),
+        ("-2", None, "unparsable"),
+        ("+2", None, "unparsable"),
+        (".", None, "excluded_token"),
+        ("0.18*", None, "excluded_token"),
+        ("22.01.15; 1800", None, "excluded_token"),
+        ("1:8", None, "unparsable"),  # failed the cast
+        ("12 3", None, "unparsable"),
+        ("nan", None, "unparsable"),
+    ],
+    "barts.2023_05_path": [
+        ("5.2", 5.2, "numeric"),
+        ("<5", 5.0, "comparator"),
+        ("+/-3", 3.0, "comparator"),
+        ("{5}", 5.0, "wrapped"),
+        ("{ 5}", 5.0, "wrapped"),
+        ("5 -", 5.0, "stripped"),
+        ('5"', 5.0, "stripped"),
+        ("10%", 10.0, "stripped"),
+        ("12 g/l", 12.0, "stripped"),
+        ("+", None, "excluded_token"),
+        ("**", None, "excluded_token"),
+        ("Pending", None, "excluded_token"),
+        ("*115", None, "excluded_token"),
+        ("1:8", None, "excluded_token"),
+        ("Serum", None, "excluded_token"),
+    ],
+    "barts.2023_05_measurements": [
+        ("150", 150.0, "numeric"),
+        ("150cm", 150.0, "stripped"),
+        ("3.6.1", 36.1, "corrected"),
+        ("-2", -2.0, "numeric"),
+        ("-.5", -0.5, "numeric"),
+        (".5", None, "unparsable"),
+        (".2.2", None, "unparsable"),
+        ("abc", None, "unparsable"),  # failed the cast
+        ("1e3", None, "unparsable"),  # was read by the cast
+    ],
+    "barts.2023_12_path": [
+        ("5.2", 5.2, "numeric"),
+        ("<5", 5.0, "comparator"),
+        ("+-3", 3.0, "comparator"),
+        ("{5}", 5.0, "wrapped"),
+        ("(5)", 5.0, "wrapped"),
+        ("*{5}", 5.0, "wrapped"),
+        ("{(5)}", 5.0, "wrapped"),
+        (" 5", 5.0, "stripped"),
+        ("*****", None, "excluded_token"),
+        ("09:00", None, "excluded_token"),
+        ("Clumped", None, "excluded_token"),
+        ("5)", None, "unparsable"),  # failed the cast
+    ],
+    "barts.2023_12_measurements": [
+        ("72", 72.0, "numeric"),
+        (" 72", 72.0, "stripped"),
+        (">90", 90.0, "comparator"),
+        ("-2", -2.0, "numeric"),
+        ("10%", None, "excluded_token"),
+        ("?", None, "excluded_token"),
+        (".", None, "excluded_token"),
+        ("10:00", None, "excluded_token"),
+        ("abc", None, "unparsable"),
+    ],
+    "barts.2024_09_path": [
+        ("5.2", 5.2, "numeric"),
+        ("<5", 5.0, "comparator"),
+        ("+-3", 3.0, "comparator"),
+        ("+/-3", None, "unparsable"),
+        ("(5)", 5.0, "stripped"),
+        (" 5", 5.0, "stripped"),
+        ("150cm", None, "unparsable"),
+        ("5 5", None, "unparsable"),
+        ("5*", None, "unparsable"),
+        ("10%", None, "unparsable"),
+        ("2-5", None, "unparsable"),
+        ("09:00", None, "unparsable"),
+    ],
+    "barts.2024_09_measurements": [
+        ("72", 72.0, "numeric"),
+        ("+2", 2.0, "numeric"),
+        ("-2", None, "unparsable"),
+        (".5", 0.5, "numeric"),
+        ("3.6.1", 36.1, "corrected"),
+        (".2.2", None, "excluded_token"),
+        (".", None, "excluded_token"),
+        ("abc", None, "unparsable"),
+    ],
+    "bradford.2023_05_path": [
+        ("5.2", 5.2, "numeric"),
+        ("Less than 5", 5.0, "comparator"),
+        ("Grtr thn 7", 7.0, "comparator"),
+        (" <5", 5.0, "stripped"),
+        ("NA", None, "excluded_token"),
+        ("Negative", None, "excluded_token"),
+        ("Not detected", None, "unparsable"),
+        ("POSITIVE", None, "unparsable"),
+        ("", None, "unparsable"),
+        (None, None, "null"),
+    ],
+    "bradford.2024_12_measurements": [
+        ("72.5", 72.5, "numeric"),
+        ("-3", -3.0, "numeric"),
+        ("120 - 80", None, "unparsable"),
+        ("1/2", None, "unparsable"),
+        ("abc", None, "unparsable"),
+    ],
+    "bradford.2024_12_path": [
+        ("5.2", 5.2, "numeric"),
+        ("Less than5", 5.0, "comparator"),
+        ("Less than 5", 5.0, "comparator"),
+        ("Not 5", 5.0, "stripped"),
+        ("NA5", 5.0, "stripped"),
+        ("not detected", None, "unparsable"),
+        ("-No evidence of past infection.", None, "unparsable"),
+        ("See comment", None, "unparsable"),
+        ("", None, "unparsable"),
+        (None, None, "null"),
+    ],
+}
+
+# rule sets only ever included by others
+INCLUDED_ONLY = {"barts.path_tokens"}
+
+
+def test_every_rule_set_has_cases():
+    rule_sets = {
+        f"{provider}.{name}"
+        for provider in ["barts", "bradford"]
+        for name, rules in load_rule_file(provider).items()
+        if isinstance(rules, dict)
+    }
+    assert rule_sets - INCLUDED_ONLY == set(CASES)
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_decode_results(name):
+    raw, values, reasons = zip(*CASES[name])
+    decoded = decode_results(pl.Series(raw, dtype=pl.Utf8), load_rule_set(name))
+    assert decoded["raw"].to_list() == list(raw)
+    assert decoded["value"].to_list() == pytest.approx(list(values))
+    assert decoded["result_rule"].cast(pl.Utf8).to_list() == list(reasons)
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_apply_result_rules_matches_decode_results(name):
+    # every string twice, as a results column repeats them
+    raw = [row[0] for row in CASES[name]] * 2
+    applied = apply_result_rules(pl.LazyFrame({"result": raw}, schema={"result": pl.Utf8}), load_rule_set(name))
+    decoded = decode_results(pl.Series(raw, dtype=pl.Utf8), load_rule_set(name))
+    assert applied.collect().to_dict(as_series=False) == {
+        "result": decoded["value"].to_list(),
+        "result_rule": decoded["result_rule"].to_list(),
+    }
+
+
+def test_rejected_rows_have_no_value():
+    for name, cases in CASES.items():
+        for raw, value, reason in cases:
+            assert (value is None) == (reason in REJECTED_REASONS), (name, raw)
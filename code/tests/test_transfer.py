@@ -0,0 +1,110 @@
+import json
+import os
+
+import pytest
+
+from quant_py.transfer import _chunk_digest, checksum, copy_file, copy_files
+
+CHUNK_BYTES = 16
+CONTENT = bytes(range(256)) * 3 + b"tail"  # 48 chunks of 16 bytes and a partial one
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    """A local directory standing in for the bucket, with one file."""
+    bucket = tmp_path / "bucket"
+    bucket.mkdir()
+    (bucket / "results.tab").write_bytes(CONTENT)
+    return bucket
+
+
+def chunks(content: bytes) -> list[str]:
+    return [_chunk_digest(content[i : i + CHUNK_BYTES]) for i in range(0, len(content), CHUNK_BYTES)]
+
+
+def interrupted_copy(source, destination, complete_chunks: int, part_content: bytes) -> None:
+    """The `.part` file and progress sidecar `copy_file` leaves after `complete_chunks` chunks."""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    stat = source.stat()
+    (destination.parent / f".{destination.name}.part").write_bytes(part_content)
+    (destination.parent / f".{destination.name}.part.json").write_text(
+        json.dumps({
+            "source": str(source),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "chunk_bytes": CHUNK_BYTES,
+            "chunks": chunks(CONTENT)[:complete_chunks],
+        })
+    )
+
+
+def test_copy_file(bucket, tmp_path):
+    source, destination = bucket / "results.tab", tmp_path / "raw" / "results.tab"
+    record = copy_file(source, destination, CHUNK_BYTES)
+    assert destination.read_bytes() == CONTENT
+    assert destination.stat().st_mtime_ns == source.stat().st_mtime_ns
+    assert record["size"] == len(CONTENT)
+    assert record["checksum"] == checksum(chunks(CONTENT))
+    assert sorted(path.name for path in destination.parent.iterdir()) == ["results.tab"]
+
+
+def test_copy_file_resumes_after_truncation(bucket, tmp_path, capsys):
+    source, destination = bucket / "results.tab", tmp_path / "raw" / "results.tab"
+    # 3 complete chunks recorded, then the copy stopped half-way through the 4th
+    interrupted_copy(source, destination, 3, CONTENT[: 3 * CHUNK_BYTES + CHUNK_BYTES // 2])
+
+    record = copy_file(source, destination, CHUNK_BYTES)
+    assert f"from byte {3 * CHUNK_BYTES:,}" in capsys.readouterr().out
+    assert destination.read_bytes() == CONTENT
+    assert record["checksum"] == checksum(chunks(CONTENT))
+    assert sorted(path.name for path in destination.parent.iterdir()) == ["results.tab"]
+
+
+def test_copy_file_rejects_corrupted_part(bucket, tmp_path):
+    source, destination = bucket / "results.tab", tmp_path / "raw" / "results.tab"
+    corrupted = bytearray(CONTENT[: 3 * CHUNK_BYTES])
+    corrupted[CHUNK_BYTES + 1] ^= 0xFF
+    interrupted_copy(source, destination, 3, bytes(corrupted))
+
+    with pytest.raises(OSError, match="does not match"):
+        copy_file(source, destination, CHUNK_BYTES)
+    assert list(destination.parent.iterdir()) == []
+
+    # copied from the start the next time
+    copy_file(source, destination, CHUNK_BYTES)
+    assert destination.read_bytes() == CONTENT
+
+
+def test_copy_file_restarts_when_source_changed(bucket, tmp_path, capsys):
+    source, destination = bucket / "results.tab", tmp_path / "raw" / "results.tab"
+    interrupted_copy(source, destination, 3, CONTENT[: 3 * CHUNK_BYTES])
+    changed, stat = CONTENT[::-1], source.stat()
+    source.write_bytes(changed)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    copy_file(source, destination, CHUNK_BYTES)
+    assert "Resuming" not in capsys.readouterr().out
+    assert destination.read_bytes() == changed
+
+
+def test_copy_files_skips_copied(bucket, tmp_path, capsys):
+    (bucket / "units.tab").write_bytes(b"mmol/L\n")
+    files = [(bucket / name, tmp_path / "raw" / name) for name in ["results.tab", "units.tab"]]
+    manifest = tmp_path / "raw" / "copy_manifest.json"
+
+    copied = copy_files(files, manifest, workers=2, chunk_bytes=CHUNK_BYTES)
+    assert sorted(record["destination"] for record in copied) == sorted(str(destination) for _, destination in files)
+    assert json.loads(manifest.read_text()) == sorted(copied, key=lambda record: record["destination"])
+
+    # same size and modification time: skipped
+    capsys.readouterr()
+    assert copy_files(files, manifest, chunk_bytes=CHUNK_BYTES) == []
+    assert capsys.readouterr().out.count("Skipped") == 2
+
+    # a new modification time (the size unchanged) is copied again
+    stat = (bucket / "units.tab").stat()
+    os.utime(bucket / "units.tab", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    copied = copy_files(files, manifest, chunk_bytes=CHUNK_BYTES)
+    assert [record["destination"] for record in copied] == [str(tmp_path / "raw" / "units.tab")]
+    assert copied[0]["mtime_ns"] == stat.st_mtime_ns + 10**9
+    assert len(json.loads(manifest.read_text())) == 2